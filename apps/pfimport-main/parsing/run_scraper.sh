@@ -115,10 +115,10 @@ for dir in $CREATED_DIRS; do
         if [ -f "take_all.py" ]; then
             # Определяем имя выходного файла
             dir_name=$(basename "$dir")
-            output_file="${dir}/processed_${dir_name}.json"
+            output_file="${dir}/processed_${dir_name}.jsonl"
             
             log "Запускаем take_all.py для $dir..."
-            python take_all.py "$dir" "$output_file"
+            python take_all.py -i "$dir" -o "$output_file"
             
             if [ $? -eq 0 ]; then
                 log "take_all.py выполнен успешно для $dir"
@@ -126,7 +126,7 @@ for dir in $CREATED_DIRS; do
                 # 7. Удаляем все файлы кроме созданных take_all.py
                 log "Очищаем папку $dir от временных файлов..."
                 
-                # Сохраняем файлы, созданные take_all.py (JSON файлы с processed_ в имени)
+                # Сохраняем файлы, созданные take_all.py (processed_*.jsonl и его манифест)
                 # Удаляем json_data директорию и её содержимое
                 if [ -d "$dir/json_data" ]; then
                     rm -rf "$dir/json_data"
@@ -3,42 +3,31 @@
 
 import os
 import json
+import hashlib
 import argparse
+from multiprocessing import Pool
 
+try:
+    import orjson  # быстрый парсер; без него работаем на стандартном json
+except ImportError:
+    orjson = None
 
+# Сколько файлов обрабатывать между сбросами вывода и манифеста на диск
+FLUSH_EVERY = 500
+# Сколько файлов отдавать воркеру за раз
+POOL_CHUNKSIZE = 64
 
-def process_all_files(root_dir: str, output_file: str, ext: str = ".json"):
-    """
-    Рекурсивно обходит root_dir, для каждого файла с расширением ext
-    загружает JSON, применяет transform_property и пишет результат
-    в output_file в формате JSON-массива.
-    """
-    first_obj = True
-    with open(output_file, "w", encoding="utf-8") as fout:
-        fout.write("[\n")
-        for dirpath, dirnames, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if not filename.lower().endswith(ext):
-                    continue
 
-                file_path = os.path.join(dirpath, filename)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as fin:
-                        data = json.load(fin)
-                    new_obj = transform_property(data)
-                    if new_obj is not None:
-                        if not first_obj:
-                            fout.write(",\n")
-                        fout.write(json.dumps(new_obj, ensure_ascii=False, indent=2))
-                        first_obj = False
-
-                except Exception as e:
-                    # Выводим в консоль, но продолжаем обработку остальных файлов
-                    print(f"Ошибка обработки {file_path}: {e}")
+def loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
 
-        fout.write("\n]\n")
+def dumps_line(obj) -> bytes:
+    """Объект → одна компактная строка JSON Lines (с переводом строки)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
 
-    print(f"Обработка завершена. Результат записан в {output_file}")
 
 def transform_property(data):
     """
@@ -174,56 +163,156 @@ def transform_property(data):
 
     return transformed
 
-def process_all_files(root_dir: str, output_file: str, ext: str = ".json"):
+
+def iter_files(root_dir: str, ext: str):
+    """Файлы с расширением ext под root_dir, в стабильном (отсортированном) порядке."""
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(ext):
+                yield os.path.join(dirpath, filename)
+
+
+def transform_file(file_path: str):
     """
-    Рекурсивно обходит root_dir, для каждого файла с расширением ext
-    загружает JSON, применяет transform_property, убирает дубликаты по id
-    и пишет результат в output_file в формате JSON-массива.
+    Выполняется в воркере: (file_path, строка JSONL или None, id, ошибка).
     """
-    seen_ids = set()
-    first_obj = True
+    try:
+        with open(file_path, "rb") as fin:
+            data = loads(fin.read())
+        new_obj = transform_property(data)
+        if new_obj is None:
+            return file_path, None, None, None
+        return file_path, dumps_line(new_obj), new_obj.get("id"), None
+    except Exception as e:
+        return file_path, None, None, str(e)
 
-    with open(output_file, "w", encoding="utf-8") as fout:
-        fout.write("[\n")
 
-        for dirpath, dirnames, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if not filename.lower().endswith(ext):
-                    continue
+def content_digest(line: bytes) -> str:
+    """Хеш строки JSONL: отличает новую версию объекта от повтора той же."""
+    return hashlib.blake2b(line, digest_size=16).hexdigest()
 
-                file_path = os.path.join(dirpath, filename)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as fin:
-                        data = json.load(fin)
 
-                    new_obj = transform_property(data)
-                    if new_obj is None:
-                        continue
+def file_signature(file_path: str):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
 
-                    obj_id = new_obj.get("id")
-                    # Если id уже встречался — пропускаем
-                    if obj_id is not None:
-                        if obj_id in seen_ids:
-                            print(f"Дубликат пропущен: id={obj_id} (файл {file_path})")
-                            continue
-                        seen_ids.add(obj_id)
 
-                    # Запись объекта в выходной файл
-                    if not first_obj:
-                        fout.write(",\n")
-                    fout.write(json.dumps(new_obj, ensure_ascii=False, indent=2))
-                    first_obj = False
-
-                except Exception as e:
-                    print(f"Ошибка обработки {file_path}: {e}")
+def load_manifest(manifest_file: str):
+    """
+    Манифест — JSON Lines [path, mtime_ns, size, id, offset, digest]: файл
+    уже преобразован, а выходной файл после него имел длину offset; digest —
+    content_digest() записанной строки (в старых манифестах его нет).
+    Возвращает ({path: (mtime_ns, size)}, {id: digest последней записанной
+    версии}, offset последней записи).
+    """
+    done, seen_ids, offset, valid_length = {}, {}, 0, 0
+    if not os.path.exists(manifest_file):
+        return done, seen_ids, offset
+    with open(manifest_file, "r+b") as f:
+        for line in f:
+            try:
+                record = loads(line)
+                path, mtime_ns, size, obj_id, offset = record[:5]
+            except ValueError:
+                break  # недописанная строка после сбоя
+            valid_length += len(line)
+            done[path] = (mtime_ns, size)
+            if obj_id is not None:
+                seen_ids[obj_id] = record[5] if len(record) > 5 else None
+        f.truncate(valid_length)
+    return done, seen_ids, offset
+
+
+def process_all_files(
+    root_dir: str,
+    output_file: str,
+    ext: str = ".json",
+    workers: int | None = None,
+    manifest_file: str | None = None,
+    restart: bool = False,
+):
+    """
+    Рекурсивно обходит root_dir, для каждого файла с расширением ext
+    загружает JSON, применяет transform_property, убирает дубликаты (тот же
+    id с тем же содержимым) и пишет результат в output_file в формате JSON
+    Lines (один объект на строку). Изменившийся объект с уже записанным id
+    дописывается ещё раз: импорт (PFJsonImporter) берёт последнюю версию.
+
+    Файлы разбираются в пуле процессов. Манифест (output_file + ".manifest")
+    запоминает уже преобразованные файлы: повторный запуск продолжает с места
+    остановки, а строки, записанные после последней записи манифеста, отбрасываются.
+    """
+    manifest_file = manifest_file or output_file + ".manifest"
+    if restart:
+        for path in (output_file, manifest_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done, seen_ids, offset = load_manifest(manifest_file)
+    if done:
+        print(f"Продолжаем: {len(done)} файлов уже обработано, {len(seen_ids)} объектов")
+
+    pending = [
+        path
+        for path in iter_files(root_dir, ext)
+        if done.get(path) != tuple(file_signature(path))
+    ]
+
+    written = duplicates = errors = 0
+    manifest_lines = []
+    with open(output_file, "ab") as fout, open(manifest_file, "ab") as fmanifest:
+        # Отрезаем всё, что не подтверждено манифестом
+        fout.truncate(offset)
+        fout.seek(offset)
+
+        def flush():
+            fout.flush()
+            fmanifest.write(b"".join(manifest_lines))
+            fmanifest.flush()
+            manifest_lines.clear()
+
+        with Pool(workers) as pool:
+            results = pool.imap(transform_file, pending, chunksize=POOL_CHUNKSIZE)
+            for count, (file_path, line, obj_id, error) in enumerate(results, 1):
+                if error is not None:
+                    # Выводим в консоль, но продолжаем обработку остальных файлов
+                    errors += 1
+                    print(f"Ошибка обработки {file_path}: {error}")
+                    continue
 
-        fout.write("\n]\n")
+                digest = None
+                if line is not None:
+                    digest = content_digest(line)
+                    # Тот же id с тем же содержимым — пропускаем, новую версию пишем
+                    if obj_id is not None and seen_ids.get(obj_id) == digest:
+                        duplicates += 1
+                        print(f"Дубликат пропущен: id={obj_id} (файл {file_path})")
+                        obj_id = digest = None
+                    else:
+                        if obj_id is not None:
+                            seen_ids[obj_id] = digest
+                        fout.write(line)
+                        offset += len(line)
+                        written += 1
+
+                mtime_ns, size = file_signature(file_path)
+                manifest_lines.append(
+                    dumps_line([file_path, mtime_ns, size, obj_id, offset, digest])
+                )
+                if count % FLUSH_EVERY == 0:
+                    flush()
+        flush()
+
+    print(
+        f"Обработка завершена: {len(pending)} файлов, записано {written}, "
+        f"дубликатов {duplicates}, ошибок {errors}. Результат записан в {output_file}"
+    )
 
-    print(f"Обработка завершена. Результат записан в {output_file}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Рекурсивно обработать все файлы, убрать дубли по id и сохранить в один JSON"
+        description="Рекурсивно обработать все файлы, убрать дубли по id и сохранить в один JSON Lines файл"
     )
     parser.add_argument(
         "-i", "--input-dir",
@@ -233,13 +322,36 @@ if __name__ == "__main__":
     parser.add_argument(
         "-o", "--output-file",
         required=True,
-        help="Путь к выходному JSON-файлу"
+        help="Путь к выходному JSONL-файлу"
     )
     parser.add_argument(
         "-e", "--extension",
         default=".json",
-        help="Расширение файлов для обработки (по умолчанию .html)"
+        help="Расширение файлов для обработки (по умолчанию .json)"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="Число процессов-обработчиков (по умолчанию — число CPU)"
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Файл манифеста (по умолчанию <output-file>.manifest)"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Начать заново: удалить выходной файл и манифест"
     )
     args = parser.parse_args()
 
-    process_all_files(args.input_dir, args.output_file, args.extension)
+    process_all_files(
+        args.input_dir,
+        args.output_file,
+        args.extension,
+        workers=args.workers,
+        manifest_file=args.manifest,
+        restart=args.restart,
+    )
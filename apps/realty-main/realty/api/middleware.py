@@ -11,6 +11,21 @@ HTTP_REQUEST_DURATION_SECONDS = Histogram(
     "HTTP request duration in seconds",
     ["method", "path", "status"],
 )
+STATS_CACHE_REQUESTS_TOTAL = Counter(
+    "stats_cache_requests_total",
+    "Search statistics cache lookups by result (hit, miss, stale)",
+    ["namespace", "transaction_type", "result"],
+)
+STATS_CACHE_EVICTIONS_TOTAL = Counter(
+    "stats_cache_evictions_total",
+    "Search statistics cache entries evicted on a data generation bump",
+    ["transaction_type"],
+)
+STATS_CACHE_GENERATION_BUMPS_TOTAL = Counter(
+    "stats_cache_generation_bumps_total",
+    "Search statistics cache generation bumps (imports that invalidated the cache)",
+    ["transaction_type"],
+)
 
 class MetricsMiddleware:
     def __init__(self, get_response):
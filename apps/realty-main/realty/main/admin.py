@@ -169,7 +169,7 @@ class MergedRentalTransactionAdmin(admin.ModelAdmin):
             "Tenant Information",
             {"fields": ("tenant_type_id", "tenant_type_ar", "tenant_type_en")},
         ),
-        ("Other", {"fields": ("period", "meter_sale_price")}),
+        ("Other", {"fields": ("meter_sale_price",)}),
         ("Timestamps", {"fields": ("created_at", "updated_at", "verified_at")}),
     )
 
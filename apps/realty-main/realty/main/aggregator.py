@@ -1,17 +1,39 @@
-from typing import Optional
+"""
+Метрики двух периодов (aggregator_2periods).
+
+Все «срезы» — текущий период, предыдущий, все сделки того же периода и
+они же без районов текущей выборки — считаются одним запросом: каждая
+метрика — условный агрегат (filter=Q(...)) по объединённому QuerySet,
+медианы — percentile_cont на PostgreSQL или скетч за один проход
+(см. quantiles.py). Дневные агрегаты (TransactionDailyRollup) считаются
+так же, медианы — по объединённым скетчам строк.
+"""
+
+from collections import Counter
 
 from django.db.models import Avg
+from django.db.models import Case
 from django.db.models import Count
+from django.db.models import F
 from django.db.models import Max
 from django.db.models import Min
+from django.db.models import Q
 from django.db.models import Sum
+from django.db.models import Value
+from django.db.models import When
 
 from .models import Building
 from .models import MergedTransaction
+from .models import TransactionDailyRollup
+from .quantiles import PercentileCont
+from .quantiles import scope_flags
+from .quantiles import scoped_quantiles
+from .quantiles import supports_percentile_cont
+from .sketch import sketch_quantile
 
 
 def _calc_percent_change(
-    current_value: Optional[float], previous_value: Optional[float]
+    current_value: float | None, previous_value: float | None
 ) -> float:
     """
     Процентное изменение = ((current - previous) / previous) * 100,
@@ -22,20 +44,68 @@ def _calc_percent_change(
     return ((current_value - previous_value) / previous_value) * 100.0
 
 
-def _approximate_median_via_minmax(min_val, max_val):
+def _scoped_rollup_metrics(qs, scopes: dict[str, Q]) -> dict[str, dict]:
     """
-    Приближённая медиана как (min_val + max_val) / 2,
-    если оба значения не None.
+    _scoped_metrics по строкам TransactionDailyRollup: суммы складываются,
+    медиана — по объединённому скетчу строк среза (точность ±1%).
     """
-    if min_val is not None and max_val is not None:
-        return (min_val + max_val) / 2.0
-    return None
+    exprs = {}
+    for name, condition in scopes.items():
+        cond = condition or None
+        exprs.update(
+            {
+                f"{name}__deals_count": Sum("count", filter=cond),
+                f"{name}__buildings_count": Count(
+                    "building", distinct=True, filter=cond
+                ),
+                f"{name}__min_price": Min("min_price", filter=cond),
+                f"{name}__max_price": Max("max_price", filter=cond),
+                f"{name}__sum_price": Sum("sum_price", filter=cond),
+                f"{name}__sum_sqm": Sum("sum_sqm", filter=cond),
+                f"{name}__sum_roi": Sum("sum_roi", filter=cond),
+                f"{name}__roi_count": Sum("roi_count", filter=cond),
+            }
+        )
+    agg = qs.order_by().aggregate(**exprs)
+
+    # Скетчи всех срезов — одним проходом по строкам
+    flags = scope_flags(scopes)
+    sketches = {name: Counter() for name in scopes}
+    rows = qs.order_by().annotate(**flags).values_list("price_sketch", *flags)
+    for sketch, *inside in rows.iterator():
+        if not sketch:
+            continue
+        member = dict(zip(flags, inside, strict=True))
+        for name, condition in scopes.items():
+            if not condition or member[f"_in_{name}"]:
+                sketches[name].update(sketch)
+
+    result = {}
+    for name in scopes:
+        deals_count = agg[f"{name}__deals_count"] or 0
+        sum_price = float(agg[f"{name}__sum_price"] or 0.0)
+        sum_sqm = float(agg[f"{name}__sum_sqm"] or 0.0)
+        roi_count = agg[f"{name}__roi_count"] or 0
+        sum_roi = float(agg[f"{name}__sum_roi"] or 0.0)
+        result[name] = {
+            "deals_count": deals_count,
+            "buildings_count": agg[f"{name}__buildings_count"],
+            "avg_price": sum_price / deals_count if deals_count else 0.0,
+            "min_price": float(agg[f"{name}__min_price"] or 0.0),
+            "max_price": float(agg[f"{name}__max_price"] or 0.0),
+            "sum_price": sum_price,
+            "sum_sqm": sum_sqm,
+            "avg_roi": sum_roi / roi_count if roi_count else 0.0,
+            "median_price": sketch_quantile(sketches[name], 0.5),
+            "avg_price_sqm": sum_price / sum_sqm if sum_sqm > 0 else 0.0,
+        }
+    return result
 
 
-def _aggregator_for_qs(qs):
+def _scoped_metrics(qs, scopes: dict[str, Q]) -> dict[str, dict]:
     """
-    Считает агрегаты по одному QuerySet (все сделки за период).
-    Возвращает словарь с:
+    Метрики _aggregator_for_qs для нескольких срезов `qs` (scopes:
+    {имя: Q-фильтр}, пустой Q() — весь qs) одним aggregate():
       - deals_count
       - buildings_count
       - avg_price
@@ -44,42 +114,70 @@ def _aggregator_for_qs(qs):
       - sum_price
       - sum_sqm
       - avg_roi
-      - median_price (по min+max, приблизительно)
+      - median_price (percentile_cont / скетч, см. quantiles.py)
       - avg_price_sqm (sum_price / sum_sqm)
     При извлечении значений из агрегаций приводим Decimal → float.
     """
-    agg = qs.aggregate(
-        deals_count=Count("*"),
-        buildings_count=Count("building", distinct=True),
-        avg_price=Avg("transaction_price"),
-        min_price=Min("transaction_price"),
-        max_price=Max("transaction_price"),
-        sum_price=Sum("transaction_price"),
-        sum_sqm=Sum("sqm"),
-        avg_roi=Avg("roi"),
-    )
-    avg_price = float(agg["avg_price"]) if agg["avg_price"] is not None else 0.0
-    min_price = float(agg["min_price"]) if agg["min_price"] is not None else 0.0
-    max_price = float(agg["max_price"]) if agg["max_price"] is not None else 0.0
-    sum_price = float(agg["sum_price"] or 0.0)
-    sum_sqm = float(agg["sum_sqm"] or 0.0)
-    avg_roi = float(agg["avg_roi"]) if agg["avg_roi"] is not None else 0.0
+    if qs.model is TransactionDailyRollup:
+        return _scoped_rollup_metrics(qs, scopes)
+    in_database = supports_percentile_cont(qs)
+    exprs = {}
+    for name, condition in scopes.items():
+        cond = condition or None
+        exprs.update(
+            {
+                f"{name}__deals_count": Count("pk", filter=cond),
+                f"{name}__buildings_count": Count(
+                    "building", distinct=True, filter=cond
+                ),
+                f"{name}__avg_price": Avg("transaction_price", filter=cond),
+                f"{name}__min_price": Min("transaction_price", filter=cond),
+                f"{name}__max_price": Max("transaction_price", filter=cond),
+                f"{name}__sum_price": Sum("transaction_price", filter=cond),
+                f"{name}__sum_sqm": Sum("sqm", filter=cond),
+                f"{name}__avg_roi": Avg("roi", filter=cond),
+            }
+        )
+        if in_database:
+            exprs[f"{name}__median_price"] = PercentileCont(
+                "transaction_price", 0.5, filter=cond
+            )
+    agg = qs.order_by().aggregate(**exprs)
+    if not in_database:
+        medians = scoped_quantiles(qs, "transaction_price", scopes, (0.5,))
+        for name in scopes:
+            agg[f"{name}__median_price"] = medians[name][0.5]
+
+    def as_float(name, key):
+        value = agg[f"{name}__{key}"]
+        return float(value) if value is not None else 0.0
+
+    result = {}
+    for name in scopes:
+        sum_price = as_float(name, "sum_price")
+        sum_sqm = as_float(name, "sum_sqm")
+        result[name] = {
+            "deals_count": agg[f"{name}__deals_count"],
+            "buildings_count": agg[f"{name}__buildings_count"],
+            "avg_price": as_float(name, "avg_price"),
+            "min_price": as_float(name, "min_price"),
+            "max_price": as_float(name, "max_price"),
+            "sum_price": sum_price,
+            "sum_sqm": sum_sqm,
+            "avg_roi": as_float(name, "avg_roi"),
+            "median_price": as_float(name, "median_price"),
+            "avg_price_sqm": sum_price / sum_sqm if sum_sqm > 0 else 0.0,
+        }
+    return result
 
-    median_price_approx = _approximate_median_via_minmax(min_price, max_price)
-    avg_price_sqm = sum_price / sum_sqm if sum_sqm > 0 else 0.0
 
-    return {
-        "deals_count": agg["deals_count"],
-        "buildings_count": agg["buildings_count"],
-        "avg_price": avg_price,
-        "min_price": min_price,
-        "max_price": max_price,
-        "sum_price": sum_price,
-        "sum_sqm": sum_sqm,
-        "avg_roi": avg_roi,
-        "median_price": median_price_approx if median_price_approx is not None else 0.0,
-        "avg_price_sqm": avg_price_sqm,
-    }
+def _aggregator_for_qs(qs):
+    """
+    Считает агрегаты по одному QuerySet (все сделки за период), см.
+    _scoped_metrics. QuerySet по TransactionDailyRollup считается по дневным
+    агрегатам.
+    """
+    return _scoped_metrics(qs, {"qs": Q()})["qs"]
 
 
 def aggregator_2periods(qs_current, qs_previous, transaction_type: str):
@@ -144,46 +242,56 @@ def aggregator_2periods(qs_current, qs_previous, transaction_type: str):
         }
 
     # --- Ниже всё для продаж (или другого типа, кроме 'rental'). ---
-    curr = _aggregator_for_qs(qs_current)
-    prev = _aggregator_for_qs(qs_previous)
-
-    # Определяем period
-    if qs_current.exists():
-        first_tx = qs_current.first()
-        period = first_tx.period or str(first_tx.date_of_transaction.year)
+    # Эталонный период — по первой сделке текущей выборки: её period (у
+    # MergedTransaction это процедура DLD), иначе год; у дневных агрегатов
+    # колонки period нет — сравниваем с тем же годом.
+    is_rollup = qs_current.model is TransactionDailyRollup
+    if is_rollup:
+        model = TransactionDailyRollup
+        first_tx = qs_current.values("date").first()
+        all_q = Q(transaction_type="sales")
+        if first_tx:
+            all_q &= Q(date__year=first_tx["date"].year)
     else:
-        period = None
-
-    # Если получили period, пытаемся взять все сделки с этим же period, иначе все
-    if period:
-        all_deals_qs = MergedTransaction.objects.filter(period=period)
-        if not all_deals_qs.exists():
-            # Если period не сработал, пробуем deal_year
-            try:
-                all_deals_qs = MergedTransaction.objects.filter(deal_year=int(period))
-            except ValueError:
-                all_deals_qs = MergedTransaction.objects.all()
+        model = MergedTransaction
+        first_tx = qs_current.values("period", "date_of_transaction").first()
+        all_q = Q()
+        if first_tx and first_tx["period"]:
+            all_q = Q(period=first_tx["period"])
+        elif first_tx:
+            all_q = Q(deal_year=first_tx["date_of_transaction"].year)
+
+    scopes = {
+        "curr": Q(pk__in=qs_current.values("pk")),
+        "prev": Q(pk__in=qs_previous.values("pk")),
+        "all": all_q,
+    }
+    if first_tx:
+        # Сравнение со сделками по другим area (не входящим в qs_current)
+        current_area_ids = qs_current.exclude(area_id__isnull=True).values("area_id")
+        scopes["excl"] = all_q & ~Q(area_id__in=current_area_ids)
+    if all_q:
+        base_qs = model.objects.filter(scopes["curr"] | scopes["prev"] | all_q)
     else:
-        all_deals_qs = MergedTransaction.objects.all()
-
-    all_metrics = _aggregator_for_qs(all_deals_qs)
-
-    # Считаем total_buildings (уникальные здания в qs_current)
-    building_ids_current = qs_current.values_list("building_id", flat=True).distinct()
-    buildings_in_current = Building.objects.filter(id__in=building_ids_current)
-    total_buildings = buildings_in_current.count()
+        base_qs = model.objects.all()
+    metrics = _scoped_metrics(base_qs, scopes)
+    curr, prev, all_metrics = metrics["curr"], metrics["prev"], metrics["all"]
+
+    # total_buildings / total_properties (здание без total_units — 1 объект)
+    buildings = Building.objects.filter(
+        id__in=qs_current.values("building_id")
+    ).aggregate(
+        total_buildings=Count("id"),
+        total_properties=Sum(
+            Case(When(total_units__gt=0, then=F("total_units")), default=Value(1))
+        ),
+    )
+    total_buildings = buildings["total_buildings"]
+    total_properties = buildings["total_properties"] or 0
 
     # total_deals
     total_deals = curr["deals_count"]
 
-    # total_properties
-    total_properties = 0
-    for b in buildings_in_current:
-        if b.total_units and b.total_units > 0:
-            total_properties += b.total_units
-        else:
-            total_properties += 1
-
     # growth_dynamic_percent = процент изменения total_deals
     growth_dynamic_percent = _calc_percent_change(total_deals, prev["deals_count"])
 
@@ -195,17 +303,9 @@ def aggregator_2periods(qs_current, qs_previous, transaction_type: str):
         average_price_value, all_metrics["avg_price"]
     )
 
-    # Сравнение со сделками по другим area (не входящим в qs_current)
-    if period and qs_current.exists():
-        current_area_ids = (
-            qs_current.values_list("area_id", flat=True)
-            .exclude(area_id__isnull=True)
-            .distinct()
-        )
-        deals_excl_areas = all_deals_qs.exclude(area_id__in=current_area_ids)
-        excl_metrics = _aggregator_for_qs(deals_excl_areas)
+    if "excl" in metrics:
         average_price_comparison = _calc_percent_change(
-            average_price_value, excl_metrics["avg_price"]
+            average_price_value, metrics["excl"]["avg_price"]
         )
     else:
         average_price_comparison = 0.0
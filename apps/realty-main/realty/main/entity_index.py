@@ -0,0 +1,176 @@
+"""
+Process-local name index of Areas, Buildings and Projects.
+
+Search and autocomplete resolve a user string with ``icontains`` against the
+three tables (``LIKE '%x%'``, no index can help). The index keeps the
+(lower-cased) names in memory with trigram postings: a substring of 3+
+characters is answered by intersecting the postings of its trigrams and
+checking the few candidates, shorter ones by a scan of the in-memory names.
+Results are ordered by id, like ``.filter(...).first()`` of the tables.
+
+The index is shared by the whole process (``get_entity_index``) and rebuilt
+when the entity generation in the cache changes: imports that create or
+rename entities call ``bump_entity_generation``. The generation is checked at
+most every CHECK_INTERVAL seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import Area
+from .models import Building
+from .models import Project
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "entity_index_generation"
+CHECK_INTERVAL = 5.0
+# Без общего кэша (DummyCache) поколения нет — индекс просто перестраивается раз в минуту
+NO_CACHE_REBUILD_INTERVAL = 60.0
+
+# Порядок разрешения поисковой строки: сначала район, потом здание, потом проект
+KINDS = ("area", "building", "project")
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class _NameTable:
+    """Names of one kind: parallel id/name lists sorted by id plus trigram postings."""
+
+    def __init__(self, rows: list[tuple[int, str]]):
+        rows = sorted((pk, name) for pk, name in rows if name)
+        self.ids = [pk for pk, _ in rows]
+        self.names = [name for _, name in rows]
+        self.lowered = [name.casefold() for name in self.names]
+        self.postings: dict[str, set[int]] = defaultdict(set)
+        for position, name in enumerate(self.lowered):
+            for trigram in _trigrams(name):
+                self.postings[trigram].add(position)
+
+    def positions(self, needle: str) -> list[int]:
+        """Positions (in id order) of the names containing `needle` (already case-folded)."""
+        if len(needle) < 3:
+            return [i for i, name in enumerate(self.lowered) if needle in name]
+        postings = sorted(
+            (self.postings.get(t, set()) for t in _trigrams(needle)), key=len
+        )
+        candidates = set.intersection(*postings) if postings else set()
+        return sorted(i for i in candidates if needle in self.lowered[i])
+
+
+class EntityIndex:
+    """Substring lookup of Area / Building / Project names, see the module docstring."""
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.tables = {
+            "area": _NameTable(list(Area.objects.values_list("id", "name_en"))),
+            "area_ar": _NameTable(list(Area.objects.values_list("id", "name_ar"))),
+            "building": _NameTable(
+                list(Building.objects.values_list("id", "english_name"))
+            ),
+            "project": _NameTable(
+                list(Project.objects.values_list("id", "english_name"))
+            ),
+        }
+
+    def find(
+        self, kind: str, substring: str, include_arabic: bool = False
+    ) -> list[int]:
+        """
+        Ids of the entities of `kind` whose name contains `substring`
+        (case-insensitive), in id order. For areas `include_arabic` also
+        matches ``name_ar``, like ``Q(name_en__icontains) | Q(name_ar__icontains)``.
+        """
+        needle = (substring or "").casefold()
+        table = self.tables[kind]
+        ids = [table.ids[i] for i in table.positions(needle)]
+        if kind == "area" and include_arabic:
+            arabic = self.tables["area_ar"]
+            ids = sorted(set(ids) | {arabic.ids[i] for i in arabic.positions(needle)})
+        return ids
+
+    def first(self, kind: str, substring: str) -> int | None:
+        ids = self.find(kind, substring)
+        return ids[0] if ids else None
+
+    def resolve(self, substring: str) -> tuple[str, int] | None:
+        """(kind, id) of the first area, else building, else project matching `substring`."""
+        for kind in KINDS:
+            pk = self.first(kind, substring)
+            if pk is not None:
+                return kind, pk
+        return None
+
+    def suggest(self, substring: str, limit: int = 5) -> dict[str, list[dict]]:
+        """Autocomplete payload: up to `limit` {"id", "name"} per kind."""
+        needle = (substring or "").casefold()
+        suggestions = {}
+        for kind, key in (
+            ("area", "areas"),
+            ("building", "buildings"),
+            ("project", "projects"),
+        ):
+            table = self.tables[kind]
+            suggestions[key] = [
+                {"id": table.ids[i], "name": table.names[i]}
+                for i in table.positions(needle)[:limit]
+            ]
+        return suggestions
+
+
+_index: EntityIndex | None = None
+_checked_at = 0.0
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def _current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Начинаем с метки времени, чтобы потерянный счётчик не совпал со старым
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def get_entity_index() -> EntityIndex:
+    """The process-wide index, rebuilt if the entity generation changed."""
+    global _index, _checked_at, _built_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < CHECK_INTERVAL:
+        return _index
+    with _lock:
+        generation = _current_generation()
+        if (
+            _index is None
+            or generation != _index.generation
+            or (generation is None and now - _built_at >= NO_CACHE_REBUILD_INTERVAL)
+        ):
+            started = time.perf_counter()
+            _index = EntityIndex(generation)
+            _built_at = now
+            logger.info(
+                "Entity index rebuilt in %.3fs (generation %s)",
+                time.perf_counter() - started,
+                generation,
+            )
+        _checked_at = now
+    return _index
+
+
+def bump_entity_generation():
+    """Call after Areas / Buildings / Projects were created or renamed."""
+    global _checked_at, _built_at
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time() * 1000), None)
+    # Этот процесс перестроит индекс при следующем обращении
+    _checked_at = _built_at = float("-inf")
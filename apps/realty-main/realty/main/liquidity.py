@@ -0,0 +1,156 @@
+"""
+Set-based liquidity engine for the search statistics.
+
+Liquidity of a period is defined as:
+
+  - group the period's transactions by (year, month) and collect the UNIQUE
+    building_ids of each month;
+  - for every building with an effective total_units > 0 take
+    liquidity_parameter_one / total_units;
+  - average those ratios per month, then average the monthly values.
+
+The effective total_units of a building is its own ``total_units`` when it is
+> 0, otherwise the ``total_units`` of its project.
+
+Instead of querying ``BuildingLiquidityParameterOne`` and ``Building`` for every
+building of every month, the engine collects the (year, month) -> buildings
+maps of all registered periods first, then loads every needed
+``(building_id, year, month) -> liquidity_parameter_one`` row and every
+effective ``total_units`` in one bulk query each, and computes all periods in
+memory.
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import date
+
+from .models import Building
+from .models import BuildingLiquidityParameterOne
+
+MonthKey = tuple[int, int]
+MonthBuildings = dict[MonthKey, set[int]]
+
+# Above this many building ids an ``IN (...)`` list stops being cheaper than
+# scanning the (year range of the) whole table, and SQLite caps bound params.
+MAX_IN_BUILDINGS = 900
+
+
+def group_buildings_by_month(
+    pairs: Iterable[tuple[int | None, date | None]],
+) -> MonthBuildings:
+    """
+    Turns (building_id, date_of_transaction) pairs into
+    {(year, month): {building_id, ...}}. Pairs without a building or a date are skipped.
+    """
+    month_buildings: MonthBuildings = defaultdict(set)
+    for building_id, tx_date in pairs:
+        if building_id and tx_date:
+            month_buildings[(tx_date.year, tx_date.month)].add(building_id)
+    return month_buildings
+
+
+class LiquidityEngine:
+    """
+    Computes liquidity values for several periods with one bulk load.
+
+    Usage:
+        engine = LiquidityEngine()
+        current = engine.add_period(pairs_current)
+        previous = engine.add_period(pairs_previous)
+        values = engine.evaluate()
+        values[current], values[previous]
+
+    Loaded rows are memoized on the engine, so calling ``add_period`` and
+    ``evaluate`` again only fetches what was not loaded yet.
+    """
+
+    def __init__(self):
+        self._periods: list[MonthBuildings] = []
+        # (building_id, year, month) -> liquidity_parameter_one
+        self._liquidity: dict[tuple[int, int, int], float] = {}
+        self._loaded_months: set[tuple[int, int, int]] = set()
+        # building_id -> effective total_units
+        self._units: dict[int, int] = {}
+
+    def add_period(self, pairs: Iterable[tuple[int | None, date | None]]) -> int:
+        """
+        Registers a period given as (building_id, date_of_transaction) pairs
+        and returns its index in the list returned by ``evaluate``.
+        """
+        return self.add_month_buildings(group_buildings_by_month(pairs))
+
+    def add_month_buildings(self, month_buildings: MonthBuildings) -> int:
+        """Same as ``add_period`` for an already grouped {(year, month): {building_id}} map."""
+        self._periods.append(month_buildings)
+        return len(self._periods) - 1
+
+    def evaluate(self) -> list[float]:
+        """Loads everything the registered periods need, then computes each of them."""
+        self._load()
+        return [
+            self._period_value(month_buildings) for month_buildings in self._periods
+        ]
+
+    # ------------------------------------------------------------------ #
+
+    def _load(self):
+        needed_keys = set()
+        for month_buildings in self._periods:
+            for (yy, mm), bld_ids in month_buildings.items():
+                for b_id in bld_ids:
+                    needed_keys.add((b_id, yy, mm))
+        missing_keys = needed_keys - self._loaded_months
+        if not missing_keys:
+            return
+
+        building_ids = {key[0] for key in missing_keys}
+        years = [key[1] for key in missing_keys]
+
+        liquidity_qs = BuildingLiquidityParameterOne.objects.filter(
+            year__gte=min(years), year__lte=max(years)
+        )
+        if len(building_ids) <= MAX_IN_BUILDINGS:
+            liquidity_qs = liquidity_qs.filter(building_id__in=building_ids)
+        for b_id, yy, mm, liq in liquidity_qs.values_list(
+            "building_id", "year", "month", "liquidity_parameter_one"
+        ).iterator(chunk_size=10000):
+            key = (b_id, yy, mm)
+            if key in missing_keys:
+                self._liquidity[key] = float(liq or 0)
+        self._loaded_months |= missing_keys
+
+        missing_buildings = building_ids - self._units.keys()
+        if missing_buildings:
+            building_qs = Building.objects.all()
+            if len(missing_buildings) <= MAX_IN_BUILDINGS:
+                building_qs = building_qs.filter(id__in=missing_buildings)
+            for b_id, total_units, project_units in building_qs.values_list(
+                "id", "total_units", "project__total_units"
+            ).iterator(chunk_size=10000):
+                if b_id not in missing_buildings:
+                    continue
+                if total_units and total_units > 0:
+                    self._units[b_id] = total_units
+                else:
+                    self._units[b_id] = project_units or 0
+            # Buildings that vanished in the meantime count as "no units".
+            for b_id in missing_buildings - self._units.keys():
+                self._units[b_id] = 0
+
+    def _period_value(self, month_buildings: MonthBuildings) -> float:
+        monthly_averages = []
+        for (yy, mm), bld_ids in month_buildings.items():
+            ratios = []
+            for b_id in bld_ids:
+                liquidity_val = self._liquidity.get((b_id, yy, mm))
+                if liquidity_val is None:
+                    continue
+                tu = self._units.get(b_id, 0)
+                if tu > 0:
+                    ratios.append(liquidity_val / tu)
+            if ratios:
+                monthly_averages.append(sum(ratios) / len(ratios))
+
+        if monthly_averages:
+            return sum(monthly_averages) / len(monthly_averages)
+        return 0.0
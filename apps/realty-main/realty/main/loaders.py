@@ -0,0 +1,113 @@
+"""
+Per-request DataLoaders of the GraphQL schema (schema.py).
+
+The analytics resolvers used to run 3-5 aggregate queries per entity. Here
+every loader collects the ids requested while one GraphQL request is being
+resolved and answers all of them with one GROUP BY query per model
+(transaction_totals_by for the transactions, plain counts for buildings /
+projects), so a dashboard asking for 50 buildings costs the same handful
+of queries as one building.
+
+Loaders are async (strawberry DataLoader): the schema has to be executed
+asynchronously, e.g. behind strawberry.django.views.AsyncGraphQLView.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from strawberry.dataloader import DataLoader
+
+from .models import Area
+from .models import Building
+from .models import Project
+from .rollup import transaction_totals_by
+
+
+def _entities(model, ids: list[int]) -> list:
+    """Objects of `ids` in order; DoesNotExist for the missing ones (per key)."""
+    found = model.objects.in_bulk(ids)
+    return [
+        found.get(pk) or model.DoesNotExist(f"{model.__name__} {pk} does not exist")
+        for pk in ids
+    ]
+
+
+def _counts(qs, group_field: str, ids: list[int], **count_kwargs) -> dict[int, int]:
+    rows = (
+        qs.filter(**{f"{group_field}__in": ids})
+        .values(group_field)
+        .annotate(n=Count("id", **count_kwargs))
+        .order_by()
+    )
+    counts = {row[group_field]: row["n"] for row in rows}
+    return {pk: counts.get(pk, 0) for pk in ids}
+
+
+def area_analytics(ids: list[int]) -> list:
+    areas = _entities(Area, ids)
+    sales = transaction_totals_by("sales", "building__area", ids)
+    rents = transaction_totals_by("rental", "building__area", ids)
+    buildings = _counts(Building.objects, "area", ids)
+    projects = _counts(Project.objects, "buildings__area", ids, distinct=True)
+    return [
+        area
+        if isinstance(area, Exception)
+        else {
+            "area": area,
+            "sales": sales[pk],
+            "rents": rents[pk],
+            "building_count": buildings[pk],
+            "project_count": projects[pk],
+        }
+        for pk, area in zip(ids, areas, strict=True)
+    ]
+
+
+def building_analytics(ids: list[int]) -> list:
+    buildings = _entities(Building, ids)
+    sales = transaction_totals_by("sales", "building", ids)
+    rents = transaction_totals_by("rental", "building", ids)
+    return [
+        building
+        if isinstance(building, Exception)
+        else {"building": building, "sales": sales[pk], "rents": rents[pk]}
+        for pk, building in zip(ids, buildings, strict=True)
+    ]
+
+
+def project_analytics(ids: list[int]) -> list:
+    projects = _entities(Project, ids)
+    sales = transaction_totals_by("sales", "building__project", ids)
+    rents = transaction_totals_by("rental", "building__project", ids)
+    buildings = _counts(Building.objects, "project", ids)
+    return [
+        project
+        if isinstance(project, Exception)
+        else {
+            "project": project,
+            "sales": sales[pk],
+            "rents": rents[pk],
+            "building_count": buildings[pk],
+        }
+        for pk, project in zip(ids, projects, strict=True)
+    ]
+
+
+class Loaders:
+    """The DataLoaders of one GraphQL request (see get_loaders)."""
+
+    def __init__(self):
+        self.area_analytics = DataLoader(load_fn=sync_to_async(area_analytics))
+        self.building_analytics = DataLoader(load_fn=sync_to_async(building_analytics))
+        self.project_analytics = DataLoader(load_fn=sync_to_async(project_analytics))
+
+
+def get_loaders(info) -> Loaders:
+    """Loaders of the current request, created on first use and kept on the context."""
+    context = info.context
+    if isinstance(context, dict):
+        return context.setdefault("loaders", Loaders())
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        context.loaders = loaders
+    return loaders
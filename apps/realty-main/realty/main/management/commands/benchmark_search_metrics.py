@@ -0,0 +1,167 @@
+# realty/main/management/commands/benchmark_search_metrics.py
+import statistics
+import time
+from datetime import date
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from realty.main.metrics import compute_metrics
+from realty.main.metrics import TransactionArrays
+
+
+class _LegacyRow:
+    """Minimal stand-in for a MergedTransaction instance (the attributes the old helpers read)."""
+
+    __slots__ = ("transaction_price", "sqm", "date_of_transaction", "building_id")
+
+    def __init__(self, transaction_price, sqm, date_of_transaction, building_id):
+        self.transaction_price = transaction_price
+        self.sqm = sqm
+        self.date_of_transaction = date_of_transaction
+        self.building_id = building_id
+
+
+# Per-object helpers as they were implemented inside calc_and_save_search_log.
+def _legacy_average_price(objs):
+    prices = [float(o.transaction_price or 0) for o in objs]
+    return sum(prices) / len(prices) if prices else 0.0
+
+
+def _legacy_median_price(objs):
+    prices = [float(o.transaction_price or 0) for o in objs]
+    return statistics.median(prices) if prices else 0.0
+
+
+def _legacy_avg_area(objs):
+    areas = [float(o.sqm or 0) for o in objs]
+    return sum(areas) / len(areas) if areas else 0.0
+
+
+def _legacy_price_range_span(objs):
+    prices = [float(o.transaction_price or 0) for o in objs]
+    if prices:
+        return min(prices), max(prices)
+    return (0.0, 0.0)
+
+
+def _legacy_sum_deals_volume(objs):
+    return sum(float(o.transaction_price or 0) for o in objs)
+
+
+def _legacy_metrics(objs):
+    return {
+        "count": len(objs),
+        "avg_price": _legacy_average_price(objs),
+        "median_price": _legacy_median_price(objs),
+        "avg_area": _legacy_avg_area(objs),
+        "price_range": _legacy_price_range_span(objs),
+        "sum_price": _legacy_sum_deals_volume(objs),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark: векторизованное ядро метрик (realty.main.metrics) против "
+        "старых поштучных хелперов calc_and_save_search_log на синтетической "
+        "таблице (по умолчанию 1M строк, без обращения к БД)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=1_000_000, help="Размер синтетической таблицы"
+        )
+        parser.add_argument(
+            "--buildings", type=int, default=5000, help="Количество зданий"
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rows, n_buildings = options["rows"], options["buildings"]
+        rng = np.random.default_rng(options["seed"])
+
+        today = date.today()
+        # 4 года истории: хватает на "2 years" + предыдущий период
+        days_back = rng.integers(0, 4 * 365, size=rows)
+        prices = rng.lognormal(mean=14.0, sigma=0.6, size=rows).round(2)
+        sqms = rng.uniform(300, 4000, size=rows).round(1)
+        building_ids = rng.integers(1, n_buildings + 1, size=rows)
+        dates = np.datetime64(today, "D") - days_back.astype("timedelta64[D]")
+
+        start_current, end_current = today - timedelta(days=365), today
+        start_previous, end_previous = (
+            start_current - timedelta(days=365),
+            start_current,
+        )
+
+        self.stdout.write(f"Synthetic table: {rows} rows, {n_buildings} buildings")
+
+        # --- legacy: model-like objects + one Python loop per metric ---
+        legacy_rows = [
+            _LegacyRow(p, s, today - timedelta(days=int(d)), b)
+            for p, s, d, b in zip(
+                prices.tolist(),
+                sqms.tolist(),
+                days_back.tolist(),
+                building_ids.tolist(),
+                strict=True,
+            )
+        ]
+        t0 = time.perf_counter()
+        current_list = [
+            o
+            for o in legacy_rows
+            if start_current <= o.date_of_transaction <= end_current
+        ]
+        prev_list = [
+            o
+            for o in legacy_rows
+            if start_previous <= o.date_of_transaction <= end_previous
+        ]
+        legacy = [_legacy_metrics(current_list), _legacy_metrics(prev_list)]
+        legacy_seconds = time.perf_counter() - t0
+
+        # --- kernel: NumPy arrays + masks, one pass ---
+        arrays = TransactionArrays(
+            price=prices.astype(np.float64),
+            sqm=sqms.astype(np.float64),
+            date=dates,
+            building_id=building_ids.astype(np.int64),
+        )
+        t0 = time.perf_counter()
+        masks = [
+            arrays.period_mask(start_current, end_current),
+            arrays.period_mask(start_previous, end_previous),
+        ]
+        kernel = compute_metrics(arrays, masks)
+        kernel_seconds = time.perf_counter() - t0
+
+        for name, old, new in zip(("current", "previous"), legacy, kernel, strict=True):
+            mismatch = [
+                key
+                for key, old_value, new_value in (
+                    ("count", old["count"], new["count"]),
+                    ("avg_price", old["avg_price"], new["avg_price"]),
+                    ("median_price", old["median_price"], new["median_price"]),
+                    ("avg_area", old["avg_area"], new["avg_area"]),
+                    ("min_price", old["price_range"][0], new["min_price"]),
+                    ("max_price", old["price_range"][1], new["max_price"]),
+                    ("sum_price", old["sum_price"], new["sum_price"]),
+                )
+                if not np.isclose(old_value, new_value, rtol=1e-9)
+            ]
+            if mismatch:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"{name}: results differ for {', '.join(mismatch)}"
+                    )
+                )
+            else:
+                self.stdout.write(f"{name}: {new['count']} rows, results match")
+
+        self.stdout.write(f"Legacy helpers: {legacy_seconds:.3f}s")
+        self.stdout.write(f"Vector kernel:  {kernel_seconds:.3f}s")
+        if kernel_seconds > 0:
+            self.stdout.write(
+                self.style.SUCCESS(f"Speed-up: x{legacy_seconds / kernel_seconds:.1f}")
+            )
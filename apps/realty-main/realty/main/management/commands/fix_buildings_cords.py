@@ -1,7 +1,12 @@
 # realty/main/management/commands/fix_buildings_and_coords.py
 
 from django.core.management.base import BaseCommand
-from django.db.models import Count
+from django.db import transaction
+
+from realty.main.management.coords import CHUNK_SIZE
+from realty.main.management.coords import PhaseTimer
+from realty.main.management.coords import bulk_set_coords
+from realty.main.management.coords import coords_from_locations
 from realty.main.models import Building, Land
 
 
@@ -13,57 +18,52 @@ class Command(BaseCommand):
     )
 
     def handle(self, *args, **options):
-        total_deleted = 0
-        # 1) Удаляем дубли в Building
-        duplicates = (
-            Building.objects.values("project_id", "english_name")
-            .annotate(cnt=Count("pk"))
-            .filter(cnt__gt=1)
-        )
-        for dup in duplicates:
-            qs = Building.objects.filter(
-                project_id=dup["project_id"], english_name=dup["english_name"]
-            ).order_by("pk")
-            # первый (с наименьшим pk) оставляем, остальные удаляем
-            keep = qs.first()
-            to_delete = qs.exclude(pk=keep.pk)
-            cnt = to_delete.count()
-            to_delete.delete()
-            total_deleted += cnt
+        timer = PhaseTimer()
+
+        # 1) Удаляем дубли в Building: один проход по (project, english_name)
+        with timer.phase("duplicates"):
+            seen = set()
+            duplicates = {}
+            rows = Building.objects.order_by("pk").values_list(
+                "pk", "project_id", "english_name"
+            )
+            for pk, project_id, english_name in rows.iterator(chunk_size=CHUNK_SIZE):
+                key = (project_id, english_name)
+                if key in seen:
+                    # первый (с наименьшим pk) оставляем, остальные удаляем
+                    duplicates.setdefault(key, []).append(pk)
+                else:
+                    seen.add(key)
+            to_delete = [pk for pks in duplicates.values() for pk in pks]
+            for start in range(0, len(to_delete), CHUNK_SIZE):
+                with transaction.atomic():
+                    Building.objects.filter(
+                        pk__in=to_delete[start : start + CHUNK_SIZE]
+                    ).delete()
+        for (project_id, english_name), pks in duplicates.items():
             self.stdout.write(
-                f"Deleted {cnt} duplicates for project={dup['project_id']} "
-                f"english_name='{dup['english_name']}'"
+                f"Deleted {len(pks)} duplicates for project={project_id} "
+                f"english_name='{english_name}'"
             )
         self.stdout.write(
-            self.style.SUCCESS(f"Total duplicates deleted: {total_deleted}")
+            self.style.SUCCESS(f"Total duplicates deleted: {len(to_delete)}")
         )
 
         # 2) Заполняем координаты в Building
-        building_updated = 0
-        buildings = Building.objects.select_related("project__location").all()
-        for b in buildings:
-            loc = getattr(b.project, "location", None)
-            if loc and loc.latitude is not None and loc.longitude is not None:
-                if b.latitude != loc.latitude or b.longitude != loc.longitude:
-                    b.latitude = loc.latitude
-                    b.longitude = loc.longitude
-                    b.save(update_fields=["latitude", "longitude"])
-                    building_updated += 1
+        with timer.phase("buildings"):
+            building_updated = bulk_set_coords(
+                Building, coords_from_locations(Building, only_missing=False)
+            )
         self.stdout.write(
             self.style.SUCCESS(f"Buildings updated with coords: {building_updated}")
         )
 
         # 3) Заполняем координаты в Land
-        land_updated = 0
-        lands = Land.objects.select_related("project__location").all()
-        for l in lands:
-            loc = getattr(l.project, "location", None)
-            if loc and loc.latitude is not None and loc.longitude is not None:
-                if l.latitude != loc.latitude or l.longitude != loc.longitude:
-                    l.latitude = loc.latitude
-                    l.longitude = loc.longitude
-                    l.save(update_fields=["latitude", "longitude"])
-                    land_updated += 1
+        with timer.phase("lands"):
+            land_updated = bulk_set_coords(
+                Land, coords_from_locations(Land, only_missing=False)
+            )
         self.stdout.write(
             self.style.SUCCESS(f"Lands updated with coords: {land_updated}")
         )
+        self.stdout.write(timer.report())
@@ -1,10 +1,18 @@
 import os
-import json
+from collections import defaultdict
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
 
-from realty.main.models import Project, Location, Building, Land
+from realty.main.management.coords import PhaseTimer
+from realty.main.management.coords import bulk_set_coords
+from realty.main.management.coords import coords_from_locations
+from realty.main.management.coords import json_files
+from realty.main.management.coords import match_children
+from realty.main.management.coords import parse_coords_dir
+from realty.main.management.coords import project_ids
+from realty.main.management.coords import upsert_locations
+from realty.main.models import Building
+from realty.main.models import Land
 
 
 class Command(BaseCommand):
@@ -20,104 +28,76 @@ class Command(BaseCommand):
         parser.add_argument(
             "json_dir", type=str, help="Путь к директории, содержащей JSON-файлы"
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Процессов для разбора JSON (1 — без пула)",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         root_dir = options["json_dir"]
         if not os.path.isdir(root_dir):
             self.stderr.write(self.style.ERROR(f"Папка не найдена: {root_dir}"))
             return
 
+        timer = PhaseTimer()
         total = {"projects": 0, "buildings": 0, "lands": 0, "defaults": 0}
 
-        for dirpath, _, files in os.walk(root_dir):
-            for fname in files:
-                if not fname.lower().endswith(".json"):
-                    continue
-
-                full_path = os.path.join(dirpath, fname)
-                try:
-                    payload = json.load(open(full_path, encoding="utf-8"))
-                except Exception as e:
-                    self.stderr.write(f"Не прочитался {full_path}: {e}")
-                    continue
-
-                resp = payload.get("response", {})
-                proj_data = resp.get("project")
-                if not proj_data:
-                    continue
+        with timer.phase("parse"):
+            paths = json_files(root_dir)
+            parsed = parse_coords_dir(paths, options["workers"])
+        self.stdout.write(
+            f"Parsed {len(paths)} files in {options['workers']} processes"
+        )
 
-                # Найдём первый Project по номеру
-                proj_num = proj_data.get("title", {}).get("number")
-                if not proj_num:
+        with timer.phase("resolve"):
+            ids, duplicates = project_ids()
+            locations = {}
+            buildings = defaultdict(list)
+            lands = defaultdict(list)
+            for item in parsed:
+                fname = os.path.basename(item["path"])
+                if "error" in item:
+                    self.stderr.write(f"Не прочитался {item['path']}: {item['error']}")
                     continue
-                qs_proj = Project.objects.filter(project_number=proj_num)
-                if not qs_proj.exists():
-                    self.stderr.write(
-                        f"Project {proj_num} не найден в БД, файл {fname}"
-                    )
+                number = item["project_number"]
+                project_id = ids.get(number)
+                if project_id is None:
+                    self.stderr.write(f"Project {number} не найден в БД, файл {fname}")
                     continue
-                if qs_proj.count() > 1:
+                if number in duplicates:
                     self.stderr.write(
                         self.style.WARNING(
-                            f"Найдено {qs_proj.count()} проектов с project_number={proj_num}, используем первый."
+                            f"Найдено {duplicates[number]} проектов с project_number={number}, используем первый."
                         )
                     )
-                project = qs_proj.first()
-
-                # 1) Location
-                coords = proj_data.get("location", {}).get("googleCoordinates", {})
-                lat = coords.get("latitude")
-                lng = coords.get("longitude")
-                if lat is not None and lng is not None:
-                    Location.objects.update_or_create(
-                        project=project, defaults={"latitude": lat, "longitude": lng}
-                    )
+                # последующие файлы проекта перекрывают предыдущие
+                if item["location"]:
+                    locations[project_id] = item["location"]
                     total["projects"] += 1
-
-                # 2) Buildings из JSON
-                for b in proj_data.get("buidlings", []):
-                    loc = b.get("location", {})
-                    blat, blng = loc.get("latitude"), loc.get("longitude")
-                    if blat is None or blng is None:
-                        continue
-                    eng = b.get("name", {}).get("englishName")
-                    qs_b = Building.objects.filter(project=project)
-                    if eng:
-                        qs_b = qs_b.filter(english_name=eng)
-                    else:
-                        num = b.get("number")
-                        qs_b = qs_b.filter(number=num) if num else qs_b.none()
-                    updated = qs_b.update(latitude=blat, longitude=blng)
-                    total["buildings"] += updated
-
-                # 3) Lands из JSON
-                for l in proj_data.get("lands", []):
-                    loc = l.get("location", {})
-                    llat, llng = loc.get("latitude"), loc.get("longitude")
-                    if llat is None or llng is None:
-                        continue
-                    eng_l = l.get("name", {}).get("englishName")
-                    qs_l = Land.objects.filter(project=project)
-                    if eng_l:
-                        qs_l = qs_l.filter(english_name=eng_l)
-                    else:
-                        num_l = l.get("number")
-                        qs_l = qs_l.filter(number=num_l) if num_l else qs_l.none()
-                    updated = qs_l.update(latitude=llat, longitude=llng)
-                    total["lands"] += updated
+                buildings[project_id].extend(item["buildings"])
+                lands[project_id].extend(item["lands"])
+
+        # 1) Location
+        with timer.phase("locations"):
+            written = upsert_locations(locations)
+        self.stdout.write(f"Locations written: {written}")
+
+        # 2) Buildings и 3) Lands из JSON
+        with timer.phase("buildings"):
+            changed, total["buildings"] = match_children(Building, buildings)
+            written = bulk_set_coords(Building, changed)
+        self.stdout.write(f"Buildings written: {written}")
+        with timer.phase("lands"):
+            changed, total["lands"] = match_children(Land, lands)
+            written = bulk_set_coords(Land, changed)
+        self.stdout.write(f"Lands written: {written}")
 
         # 4) Defaults для Building без coords: берем из project.location
-        buildings_no = Building.objects.filter(
-            latitude__isnull=True, longitude__isnull=True
-        )
-        for b in buildings_no.select_related("project__location"):
-            loc = getattr(b.project, "location", None)
-            if loc and loc.latitude is not None and loc.longitude is not None:
-                b.latitude = loc.latitude
-                b.longitude = loc.longitude
-                b.save(update_fields=["latitude", "longitude"])
-                total["defaults"] += 1
+        with timer.phase("defaults"):
+            defaults = coords_from_locations(Building, only_missing=True)
+            total["defaults"] = bulk_set_coords(Building, defaults)
 
         # Итоги
         self.stdout.write(
@@ -136,3 +116,4 @@ class Command(BaseCommand):
                 f"Buildings coords defaulted from project: {total['defaults']}"
             )
         )
+        self.stdout.write(timer.report())
@@ -6,9 +6,11 @@ from pathlib import Path
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from rapidfuzz import fuzz, process
-from shapely.geometry import shape, Point
+from shapely.geometry import shape
 
-from realty.pfimport.models import Area  # ← модель из pfimport
+from realty.pfimport.models import Area, PFListRent, PFListSale  # ← модели из pfimport
+from realty.pfimport.map_tiles import build_area_blobs
+from realty.pfimport.spatial import AreaIndex, assign_areas
 from realty.main.models import Building  # ← модель из main
 
 logger = logging.getLogger(__name__)
@@ -41,7 +43,12 @@ class Command(BaseCommand):
         parser.add_argument(
             "--assign-buildings",
             action="store_true",
-            help="Если передано — сразу проставит Building.area",
+            help="Если передано — сразу проставит Building.area_by_pf",
+        )
+        parser.add_argument(
+            "--assign-listings",
+            action="store_true",
+            help="Проставить район по координатам объявлениям PF без района",
         )
 
     # ──────────────────────────────────────────────────────────────────────────
@@ -53,6 +60,7 @@ class Command(BaseCommand):
 
         fuzzy_th = opts["fuzzy_threshold"]
         assign = opts["assign_buildings"]
+        assign_listings = opts["assign_listings"]
 
         self.stdout.write(f"Scanning {geo_dir} (threshold={fuzzy_th}) …")
 
@@ -162,37 +170,41 @@ class Command(BaseCommand):
             )
         )
 
-        # ───── Optional: проставляем Building.area ─────
+        # Упрощённые полигоны по зумам для карты (gzip/brotli + ETag)
+        sizes = build_area_blobs()
+        self.stdout.write(
+            "Area overlays: "
+            + ", ".join(f"z{zoom} {size:,} B" for zoom, size in sizes.items())
+        )
+
+        if not (assign or assign_listings):
+            return
+
+        # Индекс полигонов районов (STRtree), один на все привязки
+        index = AreaIndex.from_db()
+        self.stdout.write(f"Area index: {len(index)} polygons")
+
+        # ───── Optional: проставляем Building.area_by_pf ─────
         if assign:
             self.stdout.write("Assigning buildings to areas …")
-            assigned, skipped = 0, 0
-            # Готовим in‑memory список (area_obj, shapely_polygon)
-            area_polygons = [
-                (a, shape(a.geometry_json))
-                for a in Area.objects.exclude(geometry_json=None)
-            ]
-
-            for b in Building.objects.filter(
-                latitude__isnull=False,
-                longitude__isnull=False,
-            ):
-                pt = Point(b.longitude, b.latitude)
-                target_area = None
-                for area_obj, poly in area_polygons:
-                    if poly.contains(pt):
-                        target_area = area_obj
-                        break
-
-                if target_area:
-                    if b.area_id != target_area.pk:
-                        b.area_by_pf = target_area
-                        b.save(update_fields=["area_by_pf"])
-                    assigned += 1
-                else:
-                    skipped += 1
-
+            assigned, changed, skipped = assign_areas(
+                Building.objects.all(), "area_by_pf", index
+            )
             self.stdout.write(
                 self.style.SUCCESS(
-                    f"✔ Buildings assigned: {assigned}, skipped: {skipped}"
+                    f"✔ Buildings assigned: {assigned} ({changed} changed), "
+                    f"skipped: {skipped}"
                 )
             )
+
+        # ───── Optional: район объявлениям PF без района ─────
+        if assign_listings:
+            for model in (PFListSale, PFListRent):
+                assigned, changed, skipped = assign_areas(
+                    model.objects.filter(area__isnull=True), "area", index
+                )
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"✔ {model.__name__} assigned: {assigned}, skipped: {skipped}"
+                    )
+                )
@@ -1,11 +1,14 @@
 import logging
+import time
+from collections import Counter
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
-from rapidfuzz import fuzz
-from rapidfuzz import process
 from realty.main.management.projects import get_projects_file
 from realty.main.management.utils import download_dubai_pulse_csv
 from realty.main.management.utils import safe_str_value
@@ -16,9 +19,13 @@ from realty.main.models import Function
 from realty.main.models import MergedTransaction
 from realty.main.models import Project
 from realty.main.models import Room
+from realty.main.name_matcher import FuzzyNameMatcher
 
 logger = logging.getLogger(__name__)
 
+TRANSACTIONS_CHUNK_SIZE = 50_000
+BULK_BATCH_SIZE = 2_000
+
 
 class Command(BaseCommand):
     help = "Populates Projects, Buildings, and MergedTransactions from external Excel/CSV files."
@@ -35,6 +42,12 @@ class Command(BaseCommand):
             action="store_true",
             help="Clean all objects before populating",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=TRANSACTIONS_CHUNK_SIZE,
+            help="Transactions CSV rows per chunk",
+        )
 
     def handle(self, *args, **options):
         projects_file = get_projects_file(options["projects_zip"])
@@ -53,7 +66,7 @@ class Command(BaseCommand):
             logger.info("Clean complete.")
 
         self.populate_projects_and_buildings(projects_file)
-        self.populate_transactions(transactions_file)
+        self.populate_transactions(transactions_file, options["chunk_size"])
         logger.info("Population complete.")
 
     def populate_projects_and_buildings(self, projects_file):
@@ -172,9 +185,15 @@ class Command(BaseCommand):
 
         logger.info("Projects and buildings populated.")
 
-    def populate_transactions(self, transactions_file):
-        df = pd.read_csv(transactions_file)
-        process_transaction_chunk(df)
+    def populate_transactions(
+        self, transactions_file, chunk_size=TRANSACTIONS_CHUNK_SIZE
+    ):
+        ingest = TransactionIngest()
+        for chunk in pd.read_csv(transactions_file, chunksize=chunk_size):
+            process_transaction_chunk(chunk, ingest)
+        ingest.matcher.log_stats()
+        logger.info(f"Liquidity: {ingest.flush_liquidity()} building-months updated")
+        ingest.log_progress()
         # total_rows = len(df)
         # num_processes = max(multiprocessing.cpu_count(), 4)
         # chunks = np.array_split(df, num_processes)
@@ -240,108 +259,267 @@ class Command(BaseCommand):
         logger.info("Transactions populated.")
 
 
-# @task()
-def process_transaction_chunk(chunk_df):
-    import pandas as pd
-
-    # from django import db
-    # db.connections.close_all()
-    # import os
-    #
-    # print("Processing chunk ", randint(0, 1000))
-    # print(os.getpid())
-    #
-    # logger.info(f"Processing chunk file: {chunk_file}")
-    # chunk_df = pd.read_csv(chunk_file)
-    # processed, errors = 0, 0
-    for index, row in chunk_df.iterrows():
+class TransactionIngest:
+    """
+    Lookups shared by all chunks of one transactions import, loaded once:
+    areas by name, the building name matcher, single-building projects
+    (their total_units go to building_rooms_count) and room counts per
+    (building, room type). Liquidity counters are accumulated in memory and
+    written once by flush_liquidity().
+    """
+
+    def __init__(self, matcher: FuzzyNameMatcher | None = None):
+        self.started = time.perf_counter()
+        self.matcher = matcher or building_matcher()
+        self.areas: dict[str, int] = {}
+        for pk, name in Area.objects.order_by("-id").values_list("id", "name_en"):
+            self.areas[name or ""] = pk  # как get_or_create: первая по id
+        self.building_projects = dict(Building.objects.values_list("id", "project_id"))
+        self.single_building_units = {
+            pk: units or 0
+            for pk, units in Project.objects.annotate(n=Count("buildings"))
+            .filter(n=1)
+            .values_list("id", "total_units")
+        }
+        self.room_values: dict[tuple[int, str], int | None] = {}
+        for building_id, name, value in Room.objects.order_by("-id").values_list(
+            "building_id", "english_name", "value"
+        ):
+            # Нечисловое значение не валит всю пачку, а пишется как NULL
+            self.room_values[(building_id, name)] = (
+                int(value) if value and value.isdigit() else None
+            )
+        self.liquidity: Counter = Counter()
+        self.missing_buildings: set[str] = set()
+        self.rows = self.created = self.skipped = self.errors = 0
+
+    def ensure_areas(self, names) -> None:
+        """Creates the areas of `names` that do not exist yet."""
+        new = [name for name in dict.fromkeys(names) if name not in self.areas]
+        if new:
+            created = Area.objects.bulk_create([Area(name_en=name) for name in new])
+            self.areas.update((area.name_en, area.pk) for area in created)
+
+    def flush_liquidity(self) -> int:
+        """Adds the accumulated sales per (building, year, month) to BuildingLiquidityParameterOne."""
+        if not self.liquidity:
+            return 0
+        years = {year for _, year, _ in self.liquidity}
+        existing = {
+            (b_id, year, month): value
+            for b_id, year, month, value in BuildingLiquidityParameterOne.objects.filter(
+                year__in=years
+            ).values_list("building_id", "year", "month", "liquidity_parameter_one")
+        }
+        rows = [
+            BuildingLiquidityParameterOne(
+                building_id=b_id,
+                year=year,
+                month=month,
+                liquidity_parameter_one=existing.get((b_id, year, month), 0) + n,
+            )
+            for (b_id, year, month), n in self.liquidity.items()
+        ]
+        with transaction.atomic():
+            BuildingLiquidityParameterOne.objects.bulk_create(
+                rows,
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["building", "year", "month"],
+                update_fields=["liquidity_parameter_one"],
+            )
+        self.liquidity.clear()
+        return len(rows)
+
+    def write(self, objs, sale_keys) -> int:
+        """
+        Inserts `objs` in one transaction and counts the sales of `sale_keys`
+        ((building, year, month) or None, one per object) for liquidity. When
+        that fails, the rows are retried in BULK_BATCH_SIZE batches and the
+        rows of a failing batch one by one, so only the bad rows are lost.
+        Returns the number of rows not written.
+        """
         try:
-            instance_date_str = safe_str_value(row.get("instance_date", ""))
+            with transaction.atomic():
+                MergedTransaction.objects.bulk_create(objs, batch_size=BULK_BATCH_SIZE)
+        except Exception as e:
+            logger.warning(
+                f"Error writing transactions chunk ({len(objs)} rows), "
+                f"retrying in batches: {e}"
+            )
+            written = self._write_batches(objs, sale_keys)
+        else:
+            written = sale_keys
+        self.created += len(written)
+        self.liquidity.update(key for key in written if key is not None)
+        errors = len(objs) - len(written)
+        self.errors += errors
+        return errors
+
+    def _write_batches(self, objs, sale_keys) -> list:
+        """Sale keys of the rows written batch by batch, then row by row."""
+        for obj in objs:
+            # pk, выданные откатанной вставке, недействительны
+            obj.pk = None
+            obj._state.adding = True
+        written = []
+        for start in range(0, len(objs), BULK_BATCH_SIZE):
+            batch = objs[start : start + BULK_BATCH_SIZE]
+            keys = sale_keys[start : start + BULK_BATCH_SIZE]
             try:
-                instance_date = pd.to_datetime(instance_date_str)
+                with transaction.atomic():
+                    MergedTransaction.objects.bulk_create(batch)
             except Exception:
-                instance_date = timezone.now()
-
-            transaction_number = safe_str_value(row.get("transaction_id", ""))
-            trans_group_en = safe_str_value(row.get("trans_group_en", ""))
-            procedure_en = safe_str_value(row.get("procedure_name_en", ""))
-            area_en = safe_str_value(row.get("area_name_en", ""))
-            building_name_en = safe_str_value(row.get("building_name_en", ""))
-            master_project_en = safe_str_value(row.get("master_project_en", ""))
-            rooms_en = safe_str_value(row.get("rooms_en", ""))
-
-            actual_worth = row.get("actual_worth", 0)
-            if pd.isna(actual_worth):
-                actual_worth = 0
-
-            procedure_area = row.get("procedure_area", 0)
-            if pd.isna(procedure_area):
-                procedure_area = 0
-
-            if "Mortgage" in trans_group_en:
-                transaction_type = "sales"
+                for obj, key in zip(batch, keys, strict=True):
+                    obj.pk = None
+                    obj._state.adding = True
+                    try:
+                        with transaction.atomic():
+                            MergedTransaction.objects.bulk_create([obj])
+                    except Exception as e:
+                        logger.error(
+                            f"Error writing transaction {obj.building_name} "
+                            f"{obj.date_of_transaction}: {e}"
+                        )
+                    else:
+                        written.append(key)
             else:
-                transaction_type = "rental"
-
-            deal_year = instance_date.year
-            deal_month = instance_date.month
+                written.extend(keys)
+        return written
+
+    def log_progress(self):
+        elapsed = time.perf_counter() - self.started
+        logger.info(
+            f"Transactions: {self.rows} rows, {self.created} created, "
+            f"{self.skipped} skipped, {self.errors} errors "
+            f"({self.rows / elapsed if elapsed else 0:.0f} rows/s)"
+        )
 
-            area_obj, _ = Area.objects.get_or_create(name_en=area_en)
 
-            building = find_building_exact_or_fuzzy(building_name_en)
-            if not building:
-                logger.warning(
-                    f"Transaction {transaction_number}: building '{building_name_en}' not found. Skipping."
-                )
-                continue
+def _clean_str_column(df, column):
+    """Vectorized safe_str_value() of a column ("" for a missing column)."""
+    if column not in df:
+        return pd.Series("", index=df.index)
+    return (
+        df[column]
+        .fillna("")
+        .astype(str)
+        .str.replace("\u202c", "", regex=False)
+        .str.strip()
+    )
 
-            price_value = float(actual_worth) if actual_worth else 0
-            area_value = float(procedure_area) if procedure_area else 0
 
-            meter_price = 0
-            if price_value > 0 and area_value > 0:
-                meter_price = price_value / area_value
+def _numeric_column(df, column):
+    if column not in df:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).astype(float)
 
-            building_rooms_count = 0
-            if building.project.buildings.count() == 1:
-                building_rooms_count = building.project.total_units or 0
 
-            same_room_type_in_building = (
-                building.rooms.filter(english_name=rooms_en).only("value").first()
-            )
-            if same_room_type_in_building:
-                same_rooms_count_in_building = same_room_type_in_building.value
-            else:
-                same_rooms_count_in_building = None
-            MergedTransaction.objects.create(
-                transaction_type=transaction_type,
-                building=building,
-                date_of_transaction=instance_date.date(),
-                building_name=building_name_en,
-                location_name=area_en,
-                number_of_rooms=rooms_en,
-                sqm=area_value,
-                transaction_price=price_value,
+# @task()
+def process_transaction_chunk(chunk_df, ingest: TransactionIngest | None = None):
+    """
+    Writes one DataFrame chunk of DLD transactions with bulk_create (one
+    transaction per chunk). Pass the same TransactionIngest for all chunks of
+    a file and call flush_liquidity() at the end; without it the chunk is
+    processed on its own and liquidity is flushed right away.
+    Returns (processed, errors).
+    """
+    standalone = ingest is None
+    if standalone:
+        ingest = TransactionIngest()
+
+    dates = pd.to_datetime(
+        _clean_str_column(chunk_df, "instance_date"), errors="coerce", format="mixed"
+    ).fillna(pd.Timestamp(timezone.now().date()))
+    building_names = _clean_str_column(chunk_df, "building_name_en")
+    area_names = _clean_str_column(chunk_df, "area_name_en")
+    rooms = _clean_str_column(chunk_df, "rooms_en")
+    procedures = _clean_str_column(chunk_df, "procedure_name_en")
+    master_projects = _clean_str_column(chunk_df, "master_project_en")
+    transaction_types = np.where(
+        _clean_str_column(chunk_df, "trans_group_en").str.contains(
+            "Mortgage", regex=False
+        ),
+        "sales",
+        "rental",
+    )
+    prices = _numeric_column(chunk_df, "actual_worth")
+    sqms = _numeric_column(chunk_df, "procedure_area")
+    meter_prices = (prices / sqms).where((prices > 0) & (sqms > 0), 0.0)
+
+    # Все уникальные имена чанка — одним пакетом, дальше только словари
+    buildings = ingest.matcher.match_many(building_names.unique())
+    for name, pk in buildings.items():
+        if pk is None and name not in ingest.missing_buildings:
+            ingest.missing_buildings.add(name)
+            logger.warning(f"Building '{name}' not found. Skipping its transactions.")
+    ingest.ensure_areas(area_names.unique())
+
+    objs = []
+    sale_keys = []
+    columns = zip(
+        dates.dt.date,
+        building_names,
+        area_names,
+        rooms,
+        procedures,
+        master_projects,
+        transaction_types,
+        prices,
+        sqms,
+        meter_prices,
+        strict=True,
+    )
+    for (
+        date,
+        building_name,
+        area_name,
+        room,
+        procedure,
+        master_project,
+        t_type,
+        price,
+        sqm,
+        meter_price,
+    ) in columns:
+        building_id = buildings.get(building_name)
+        if building_id is None:
+            ingest.skipped += 1
+            continue
+        project_id = ingest.building_projects.get(building_id)
+        objs.append(
+            MergedTransaction(
+                transaction_type=t_type,
+                building_id=building_id,
+                date_of_transaction=date,
+                building_name=building_name,
+                location_name=area_name,
+                number_of_rooms=room,
+                sqm=sqm,
+                transaction_price=price,
                 detail_link="",
-                something_important_v1=master_project_en,
-                period=procedure_en,
+                something_important_v1=master_project,
+                period=procedure,
                 meter_sale_price=meter_price,
-                deal_year=deal_year,
-                area=area_obj,
-                same_rooms_count_in_building=same_rooms_count_in_building,
-                building_rooms_count=building_rooms_count,
+                deal_year=date.year,
+                area_id=ingest.areas[area_name],
+                same_rooms_count_in_building=ingest.room_values.get(
+                    (building_id, room)
+                ),
+                building_rooms_count=ingest.single_building_units.get(project_id, 0),
             )
+        )
+        sale_keys.append(
+            (building_id, date.year, date.month) if t_type == "sales" else None
+        )
 
-            if transaction_type == "sales":
-                liq_obj, _ = BuildingLiquidityParameterOne.objects.get_or_create(
-                    building=building,
-                    year=deal_year,
-                    month=deal_month,
-                )
-                liq_obj.liquidity_parameter_one += 1
-                liq_obj.save()
-        except Exception as e:
-            logger.error(f"Error in transaction row {index}: {e}")
+    ingest.rows += len(chunk_df)
+    errors = ingest.write(objs, sale_keys)
+
+    if standalone:
+        ingest.flush_liquidity()
+    ingest.log_progress()
+    return len(objs) - errors, errors
 
 
 def get_transactions_file() -> Path:
@@ -349,14 +527,20 @@ def get_transactions_file() -> Path:
         site_url="https://www.dubaipulse.gov.ae/data/dld-transactions/dld_transactions-open",
         file_type="transactions",
     )
-    logger.info(f"Reading file {transactions_file} into DataFrame")
-    df = pd.read_csv(transactions_file)
-    logger.info("Filtering transactions to keep only 'Flat'")
-    filtered_df = df[df["property_sub_type_en"] == "Flat"].copy()
     filtered_file_name = (
         transactions_file.parent / f"{transactions_file.stem}_filtered.csv"
     )
-    filtered_df.to_csv(filtered_file_name, index=False)
+    logger.info(f"Filtering {transactions_file} to keep only 'Flat'")
+    # Файл большой: фильтруем по частям, не загружая его целиком
+    for number, chunk in enumerate(
+        pd.read_csv(transactions_file, chunksize=TRANSACTIONS_CHUNK_SIZE)
+    ):
+        chunk[chunk["property_sub_type_en"] == "Flat"].to_csv(
+            filtered_file_name,
+            mode="w" if number == 0 else "a",
+            header=number == 0,
+            index=False,
+        )
     logger.info(f"Wrote filtered file {filtered_file_name}")
     return filtered_file_name
 
@@ -380,34 +564,22 @@ def format_project_number(value):
         return ""
 
 
-def find_building_exact_or_fuzzy(name_str, threshold=80):
+def building_matcher(threshold=80) -> FuzzyNameMatcher:
+    """Matcher of all building names; build it once per import and reuse it."""
+    return FuzzyNameMatcher.from_model(Building, "english_name", threshold=threshold)
+
+
+def find_building_exact_or_fuzzy(name_str, threshold=80, matcher=None):
+    """
+    Building by exact (case-insensitive) name, else by the best WRatio match
+    with score >= threshold. Pass a matcher from building_matcher() when
+    looking up many names: without it the name index is built on every call.
+    """
     if not name_str:
         return None
-    exact_qs = Building.objects.filter(english_name__iexact=name_str)
-    count_exact = exact_qs.count()
-    if count_exact == 1:
-        return exact_qs.first()
-    elif count_exact > 1:
-        logger.warning(f"Multiple buildings found for '{name_str}'. Using first.")
-        return exact_qs.first()
-    else:
-        buildings = Building.objects.all()
-        names = [b.english_name for b in buildings if b.english_name]
-        search_norm = normalize_str(name_str)
-        result = process.extractOne(search_norm, names, scorer=fuzz.WRatio)
-        if result:
-            best_match, score, _ = result
-            if score >= threshold:
-                fuzzy_qs = Building.objects.filter(english_name__iexact=best_match)
-                if fuzzy_qs.count() == 1:
-                    logger.info(
-                        f"Fuzzy match: '{name_str}' => '{best_match}' (score: {score})"
-                    )
-                    return fuzzy_qs.first()
-                elif fuzzy_qs.count() > 1:
-                    logger.warning(
-                        f"Fuzzy match found multiple for '{best_match}'. Using first."
-                    )
-                    return fuzzy_qs.first()
+    if matcher is None:
+        matcher = building_matcher(threshold)
+    building = matcher.instance(name_str)
+    if building is None:
         logger.warning(f"Building '{name_str}' not found.")
-        return None
+    return building
@@ -1,7 +1,7 @@
 import csv
-import datetime
-import gc
 import re
+import sys
+import time
 from decimal import Decimal
 from decimal import InvalidOperation
 from pathlib import Path
@@ -10,16 +10,31 @@ from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
 from django.db import transaction
 from django.utils import timezone
-from rapidfuzz import fuzz
-from rapidfuzz import process
 from realty.main.models import Area
 from realty.main.models import Building
 from realty.main.models import MergedRentalTransaction
 from realty.main.models import Project
+from realty.main.name_matcher import FuzzyNameMatcher
+
+CHUNK_SIZE = 5000
+BULK_BATCH_SIZE = 1000
+FUZZY_THRESHOLD = 80
+# Ключ upsert-а, см. unique_rental_contract_date
+UPSERT_KEY = ["contract_id", "date_of_transaction"]
+# Всё, что пишет build_merged_rental, кроме ключа (и created_at)
+UPSERT_UPDATE_FIELDS = [
+    field.name
+    for field in MergedRentalTransaction._meta.concrete_fields
+    if not field.primary_key
+    and field.name not in UPSERT_KEY + ["created_at", "verified_at"]
+]
 
 
 class Command(BaseCommand):
-    help = "Fill MergedRentalTransaction from a large CSV file (in chunks)."
+    help = (
+        "Fill MergedRentalTransaction from a large CSV file: streamed in chunks, "
+        "upserted by (contract_id, date_of_transaction), resumable by byte offset."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -37,21 +52,40 @@ class Command(BaseCommand):
             default=1,
             help="Номер строки (1-based), с которой начинать обработку CSV (включая заголовок).",
         )
+        parser.add_argument(
+            "--start-offset",
+            type=int,
+            default=0,
+            help="Байтовое смещение начала записи, с которого продолжить импорт "
+            "(печатается после каждого записанного чанка).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Строк CSV в одном чанке (одна транзакция).",
+        )
 
     def handle(self, *args, **options):
         csv_file = options["csv_file"]
         start_line = options.get("start_line", 1)
-        # посчитаем общее число строк (включая заголовок)
-        total_lines = sum(1 for _ in Path(csv_file).open(mode="r", encoding="utf-8"))
-        self.stdout.write(
-            self.style.NOTICE(f"Начинаю обработку с строки {start_line}/{total_lines}")
-        )
+        start_offset = options.get("start_offset", 0)
+
+        file_path = Path(csv_file)
+        if not file_path.exists():
+            raise CommandError(f"Файл {csv_file} не существует.")
+
+        if start_offset:
+            self.stdout.write(
+                self.style.NOTICE(
+                    f"Продолжаю с байта {start_offset}/{file_path.stat().st_size}"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.NOTICE(f"Начинаю обработку со строки {start_line}")
+            )
 
-        # 1) Спросим у пользователя, нужно ли очистить данные:
-        # confirm = input(
-        #     "Очистить все записи в MergedRentalTransaction перед началом? (y/n): "
-        # )
-        # if confirm.lower().startswith("y"):
         # 1) Очистить данные?
         if options["clean_first"]:
             self.stdout.write(self.style.WARNING("Чищу MergedRentalTransaction…"))
@@ -69,109 +103,164 @@ class Command(BaseCommand):
                     self.style.WARNING("Все записи MergedRentalTransaction удалены.")
                 )
 
-        file_path = Path(csv_file)
-        if not file_path.exists():
-            raise CommandError(f"Файл {csv_file} не существует.")
-
-        # Составим справочники Projects, Areas и Buildings один раз, чтобы быстрее делать fuzzy-поиск.
+        # Справочники Projects, Areas и Buildings — один раз на весь импорт
         self.init_cached_data()
 
-        # self.process_file_in_chunks(file_path)
-        # передаём start_line и total_lines
-        self.process_file_in_chunks(
-            file_path, chunk_size=5000, start_line=start_line, total_lines=total_lines
-        )
-        self.stdout.write(
-            self.style.SUCCESS(f"Всего строк во входном файле: {total_lines}")
+        rows = self.process_file_in_chunks(
+            file_path,
+            chunk_size=options["chunk_size"],
+            start_line=start_line,
+            start_offset=start_offset,
         )
+        self.stdout.write(self.style.SUCCESS(f"Обработано строк: {rows}"))
 
     def init_cached_data(self):
         """
-        Считываем один раз все Project, Area и Building,
-        чтобы потом быстро искать по fuzzy и определять building для проекта.
+        Индексы имён Area и Project для fuzzy-поиска и здание проекта
+        (единственное здание с building_count == 1) — в памяти, по id.
         """
-        self.all_projects = list(Project.objects.all().values("id", "english_name"))
-        self.all_areas = list(Area.objects.all().values("id", "name_en"))
-
-        buildings_qs = Building.objects.all().values(
-            "id", "project_id", "english_name", "building_count"
+        self.area_matcher = FuzzyNameMatcher.from_model(
+            Area, "name_en", threshold=FUZZY_THRESHOLD
+        )
+        self.project_matcher = FuzzyNameMatcher.from_model(
+            Project, "english_name", threshold=FUZZY_THRESHOLD
         )
-        self.buildings_by_project_id = {}
-        for b in buildings_qs:
-            pid = b["project_id"]
-            self.buildings_by_project_id.setdefault(pid, [])
-            self.buildings_by_project_id[pid].append(
-                (b["id"], b["english_name"], b["building_count"])
-            )
 
-        self.project_names = []
-        for pr in self.all_projects:
-            if pr["english_name"]:
-                self.project_names.append(pr["english_name"])
+        candidates = {}
+        for b_id, pid, name in Building.objects.filter(building_count=1).values_list(
+            "id", "project_id", "english_name"
+        ):
+            candidates.setdefault(pid, []).append((b_id, name))
+        # {project_id: (building_id, english_name)}
+        self.building_by_project = {
+            pid: found[0] for pid, found in candidates.items() if len(found) == 1
+        }
 
-        self.area_names = []
-        for ar in self.all_areas:
-            if ar["name_en"]:
-                self.area_names.append(ar["name_en"])
+    def iter_rows(self, file_path: Path, start_offset=0):
+        """
+        Yields (row, offset) of the CSV records; offset is the byte position
+        right after the record, i.e. where a resumed import starts.
+        """
+        with file_path.open(mode="rb") as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode("utf-8-sig")]))
+            position = len(header_line)
+            if start_offset > position:
+                f.seek(start_offset)
+                position = start_offset
+
+            def lines():
+                nonlocal position
+                for line in f:
+                    position += len(line)
+                    yield line.decode("utf-8")
+
+            # csv.reader берёт строки по одной (или несколько — для полей с переводом строки)
+            for values in csv.reader(lines()):
+                if len(values) != len(header):
+                    if values:
+                        self.stderr.write(
+                            self.style.WARNING(
+                                f"Skipping malformed record ending at byte {position}: "
+                                f"{len(values)} fields, expected {len(header)}"
+                            )
+                        )
+                    continue
+                yield dict(zip(header, values, strict=True)), position
 
-    # def process_file_in_chunks(self, file_path: Path, chunk_size=5000):
     def process_file_in_chunks(
-        self, file_path: Path, chunk_size=5000, start_line=1, total_lines=None
+        self, file_path: Path, chunk_size=CHUNK_SIZE, start_line=1, start_offset=0
     ):
         """
-        Читаем CSV по 5000 строк, обрабатываем, вызываем GC, повторяем.
+        Читаем CSV потоком, без предварительного подсчёта строк, и пишем
+        чанками по chunk_size. После каждого чанка печатаем смещение для
+        --start-offset.
         """
-        with file_path.open(mode="r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-
-            rows_buffer = []
-            # for row in reader:
-            # enumerate начиная с 2, т.к. header – строка 1
-            for idx, row in enumerate(reader, start=2):
-                # пропускаем до нужной стартовой
-                if idx < start_line:
-                    continue
+        total_bytes = file_path.stat().st_size
+        started = time.perf_counter()
+        rows_buffer = []
+        processed = 0
+        offset = start_offset
+        # enumerate начиная с 2, т.к. header – строка 1
+        for idx, (row, offset) in enumerate(
+            self.iter_rows(file_path, start_offset), start=2
+        ):
+            # пропускаем до нужной стартовой (при продолжении по смещению не используется)
+            if not start_offset and idx < start_line:
+                continue
 
-                rows_buffer.append(row)
-                # if len(rows_buffer) >= chunk_size:
-                if len(rows_buffer) >= chunk_size:
-                    # выводим прогресс
-                    self.stdout.write(
-                        self.style.NOTICE(f"Обрабатываю строку {idx}/{total_lines}")
-                    )
+            rows_buffer.append(row)
+            if len(rows_buffer) >= chunk_size:
+                self.handle_chunk(rows_buffer)
+                processed += len(rows_buffer)
+                rows_buffer.clear()
+                self.report_progress(processed, offset, total_bytes, started)
 
-                    self.handle_chunk(rows_buffer)
-                    rows_buffer.clear()
-                    gc.collect()
+        # Остаток
+        if rows_buffer:
+            self.handle_chunk(rows_buffer)
+            processed += len(rows_buffer)
+            self.report_progress(processed, offset, total_bytes, started)
 
-            # Остаток
-            if rows_buffer:
-                self.stdout.write(
-                    self.style.NOTICE(f"Обрабатываю строку {idx}/{total_lines}")
-                )
+        self.area_matcher.log_stats()
+        self.project_matcher.log_stats()
+        return processed
 
-                rows_buffer.clear()
-                gc.collect()
+    def report_progress(self, processed, offset, total_bytes, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.NOTICE(
+                f"Строк: {processed}, байт {offset}/{total_bytes} "
+                f"({100 * offset / total_bytes if total_bytes else 100:.1f}%), "
+                f"{processed / elapsed if elapsed else 0:.0f} строк/с; "
+                f"продолжить: --start-offset={offset}"
+            )
+        )
 
     @transaction.atomic
     def handle_chunk(self, rows):
-        for row in rows:
-            if not self.row_is_relevant(row):
-                continue
+        rows = [row for row in rows if self.row_is_relevant(row)]
 
+        # Fuzzy-поиск — по уникальным именам чанка, одним пакетом (с мемоизацией)
+        self.area_matcher.match_many(
+            (row.get("area_name_en") or "").strip() for row in rows
+        )
+        self.project_matcher.match_many(
+            (row.get(key) or "").strip()
+            for row in rows
+            for key in ("project_name_en", "master_project_en")
+        )
+
+        keyed = {}
+        without_contract = []
+        for row in rows:
             # 1. Найдём / создадим Area:
-            area_obj = self.find_or_create_area(row)
+            area_id = self.find_or_create_area(row)
 
             # 2. Найдём / создадим Project:
-            project_obj = self.find_or_create_project(row)
-
-            # 3. Найдём Building (если project_obj не None)
-            building_obj = self.find_building(project_obj)
-
-            # 4. Создадим / обновим MergedRentalTransaction
-            self.create_or_update_merged_rental(
-                row, area_obj, project_obj, building_obj
-            )
+            project_id = self.find_or_create_project(row)
+
+            # 3. Найдём Building (если проект найден)
+            building = self.building_by_project.get(project_id)
+
+            # 4. Соберём MergedRentalTransaction
+            obj = self.build_merged_rental(row, area_id, project_id, building)
+            if obj.contract_id:
+                # Повтор ключа внутри чанка: как и при update_or_create, побеждает последний
+                keyed[(obj.contract_id, obj.date_of_transaction)] = obj
+            else:
+                without_contract.append(obj)
+
+        MergedRentalTransaction.objects.bulk_create(
+            list(keyed.values()),
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=UPSERT_KEY,
+            update_fields=UPSERT_UPDATE_FIELDS,
+        )
+        MergedRentalTransaction.objects.bulk_create(
+            without_contract, batch_size=BULK_BATCH_SIZE
+        )
 
     def row_is_relevant(self, row) -> bool:
         """
@@ -195,53 +284,44 @@ class Command(BaseCommand):
     def find_or_create_area(self, row):
         """
         Fuzzy-поиск по area_name_en.
-        Если нет, создаём новую Area.
+        Если нет, создаём новую Area. Возвращает id.
         """
         area_name_en = (row.get("area_name_en") or "").strip()
         if not area_name_en:
             return None
 
-        match = process.extractOne(area_name_en, self.area_names, scorer=fuzz.WRatio)
-        if match and match[1] > 80:
-            matched_str = match[0]
-            for a in self.all_areas:
-                if a["name_en"] == matched_str:
-                    return Area.objects.get(id=a["id"])
+        area_id = self.area_matcher.match(area_name_en)
+        if area_id is not None:
+            return area_id
 
         new_area = Area.objects.create(
             area_idx=self.safe_int(row.get("area_id")),
             name_ar=row.get("area_name_ar") or None,
             name_en=area_name_en,
         )
-        self.all_areas.append({"id": new_area.id, "name_en": new_area.name_en})
-        self.area_names.append(new_area.name_en)
-        return new_area
+        self.area_matcher.add(new_area.id, new_area.name_en)
+        return new_area.id
 
     def find_or_create_project(self, row):
         """
         1) Если есть project_name_en -> fuzzy-поиск;
            если не нашли, тогда пытаемся master_project_en;
            если не нашли, создаём.
+        Возвращает id.
         """
         p_en = (row.get("project_name_en") or "").strip()
         mp_en = (row.get("master_project_en") or "").strip()
 
+        for candidate_name in (p_en, mp_en):
+            project_id = self.project_matcher.match(candidate_name)
+            if project_id is not None:
+                return project_id
+
         # arabic_name возьмём из master_project_ar или project_name_ar.
         arabic_name_from_csv = (row.get("master_project_ar") or "").strip()
         if not arabic_name_from_csv and row.get("project_name_ar"):
             arabic_name_from_csv = row.get("project_name_ar")
 
-        candidates = []
-        if p_en:
-            candidates.append(p_en)
-        if mp_en:
-            candidates.append(mp_en)
-
-        for candidate_name in candidates:
-            project_obj = self.find_project_by_fuzzy(candidate_name)
-            if project_obj:
-                return project_obj
-
         final_english = p_en if p_en else mp_en
         project_number = row.get("project_number") or ""
         new_proj = Project.objects.create(
@@ -249,50 +329,17 @@ class Command(BaseCommand):
             english_name=final_english,
             arabic_name=arabic_name_from_csv,
         )
-        self.all_projects.append(
-            {"id": new_proj.id, "english_name": new_proj.english_name}
-        )
-        if new_proj.english_name and new_proj.english_name not in self.project_names:
-            self.project_names.append(new_proj.english_name)
-
-        return new_proj
-
-    def find_project_by_fuzzy(self, candidate_name):
-        match = process.extractOne(
-            candidate_name, self.project_names, scorer=fuzz.WRatio
-        )
-        if match and match[1] > 80:
-            matched_str = match[0]
-            for pr in self.all_projects:
-                if pr["english_name"] == matched_str:
-                    return Project.objects.get(id=pr["id"])
-        return None
-
-    def find_building(self, project_obj):
-        if not project_obj:
-            return None
-        pid = project_obj.id
-        if pid not in self.buildings_by_project_id:
-            return None
-
-        candidates = self.buildings_by_project_id[pid]
-        # building_count == 1
-        candidates = [c for c in candidates if c[2] == 1]
+        self.project_matcher.add(new_proj.id, new_proj.english_name)
+        return new_proj.id
 
-        if len(candidates) == 1:
-            building_id, eng_name, bcount = candidates[0]
-            return Building.objects.get(id=building_id)
-        return None
-
-    def create_or_update_merged_rental(self, row, area_obj, project_obj, building_obj):
+    def build_merged_rental(self, row, area_id, project_id, building):
         """
-        Создаём/обновляем MergedRentalTransaction по (contract_id, date_of_transaction),
-        и заполняем:
+        Собираем (не сохраняя) MergedRentalTransaction с ключом
+        (contract_id, date_of_transaction) и заполняем:
           - transaction_price = Decimal(contract_amount)
           - sqm = actual_area
           - location_name = area_name_en
           - meter_sale_price = transaction_price / Decimal(str(sqm)) (если sqm>0)
-          - period = вычисляем по разнице между today и date_of_transaction
           - number_of_rooms = "2 B/R" (преобразование через convert_rooms_string)
         """
         contract_id = (row.get("contract_id") or "").strip()
@@ -318,72 +365,60 @@ class Command(BaseCommand):
         raw_rooms_str = (row.get("ejari_property_sub_type_en") or "").lower()
         number_of_rooms = self.convert_rooms_string(raw_rooms_str)
 
-        # period
-        period_value = self.get_period(date_of_transaction)
-
-        defaults = {
-            "transaction_type": "rental",
-            "building": building_obj,
-            "project": project_obj,
-            "area": area_obj,
-            "date_of_transaction": date_of_transaction,
-            "building_name": building_obj.english_name if building_obj else None,
-            "location_name": location_name,
-            "number_of_rooms": number_of_rooms,
-            "sqm": sqm,
-            "transaction_price": transaction_price,
-            "meter_sale_price": meter_sale_price,
-            "detail_link": None,  # Если нужно заполнять - возьмите из CSV
-            "contract_start_date": start_date,
-            "contract_end_date": self.parse_date(row.get("contract_end_date")),
-            "contract_reg_type_id": row.get("contract_reg_type_id") or None,
-            "contract_reg_type_ar": row.get("contract_reg_type_ar") or None,
-            "contract_reg_type_en": row.get("contract_reg_type_en") or None,
-            "annual_amount": self.safe_float(row.get("annual_amount")),
-            "no_of_prop": self.safe_int(row.get("no_of_prop")),
-            "line_number": self.safe_int(row.get("line_number")),
-            "is_free_hold": True if (row.get("is_free_hold") == "1") else False,
-            "ejari_bus_property_type_id": row.get("ejari_bus_property_type_id"),
-            "ejari_bus_property_type_ar": row.get("ejari_bus_property_type_ar"),
-            "ejari_bus_property_type_en": row.get("ejari_bus_property_type_en"),
-            "ejari_property_type_id": row.get("ejari_property_type_id"),
-            "ejari_property_type_en": row.get("ejari_property_type_en"),
-            "ejari_property_type_ar": row.get("ejari_property_type_ar"),
-            "ejari_property_sub_type_id": row.get("ejari_property_sub_type_id"),
-            "ejari_property_sub_type_en": row.get("ejari_property_sub_type_en"),
-            "ejari_property_sub_type_ar": row.get("ejari_property_sub_type_ar"),
-            "property_usage_en": row.get("property_usage_en"),
-            "property_usage_ar": row.get("property_usage_ar"),
-            "project_number": row.get("project_number"),
-            "project_name_ar": row.get("project_name_ar"),
-            "project_name_en": row.get("project_name_en"),
-            "master_project_ar": row.get("master_project_ar"),
-            "master_project_en": row.get("master_project_en"),
-            "area_id_csv": self.safe_int(row.get("area_id")),
-            "area_name_ar": row.get("area_name_ar"),
-            "area_name_en": row.get("area_name_en"),
-            "actual_area": sqm,
-            "nearest_landmark_ar": row.get("nearest_landmark_ar"),
-            "nearest_landmark_en": row.get("nearest_landmark_en"),
-            "nearest_metro_ar": row.get("nearest_metro_ar"),
-            "nearest_metro_en": row.get("nearest_metro_en"),
-            "nearest_mall_ar": row.get("nearest_mall_ar"),
-            "nearest_mall_en": row.get("nearest_mall_en"),
-            "tenant_type_id": self.safe_int(row.get("tenant_type_id")),
-            "tenant_type_ar": row.get("tenant_type_ar"),
-            "tenant_type_en": row.get("tenant_type_en"),
-            "period": period_value,
-        }
-
-        if contract_id:
-            # update_or_create по (contract_id, date_of_transaction)
-            obj, created = MergedRentalTransaction.objects.update_or_create(
-                contract_id=contract_id,
-                date_of_transaction=date_of_transaction,
-                defaults=defaults,
-            )
-        else:
-            obj = MergedRentalTransaction.objects.create(**defaults)
+        building_id, building_name = building if building else (None, None)
+        return MergedRentalTransaction(
+            contract_id=contract_id or None,
+            transaction_type="rental",
+            building_id=building_id,
+            project_id=project_id,
+            area_id=area_id,
+            date_of_transaction=date_of_transaction,
+            building_name=building_name,
+            location_name=location_name,
+            number_of_rooms=number_of_rooms,
+            sqm=sqm,
+            transaction_price=transaction_price,
+            meter_sale_price=meter_sale_price,
+            detail_link=None,  # Если нужно заполнять - возьмите из CSV
+            contract_start_date=start_date,
+            contract_end_date=self.parse_date(row.get("contract_end_date")),
+            contract_reg_type_id=row.get("contract_reg_type_id") or None,
+            contract_reg_type_ar=row.get("contract_reg_type_ar") or None,
+            contract_reg_type_en=row.get("contract_reg_type_en") or None,
+            annual_amount=self.safe_float(row.get("annual_amount")),
+            no_of_prop=self.safe_int(row.get("no_of_prop")),
+            line_number=self.safe_int(row.get("line_number")),
+            is_free_hold=True if (row.get("is_free_hold") == "1") else False,
+            ejari_bus_property_type_id=row.get("ejari_bus_property_type_id"),
+            ejari_bus_property_type_ar=row.get("ejari_bus_property_type_ar"),
+            ejari_bus_property_type_en=row.get("ejari_bus_property_type_en"),
+            ejari_property_type_id=row.get("ejari_property_type_id"),
+            ejari_property_type_en=row.get("ejari_property_type_en"),
+            ejari_property_type_ar=row.get("ejari_property_type_ar"),
+            ejari_property_sub_type_id=row.get("ejari_property_sub_type_id"),
+            ejari_property_sub_type_en=row.get("ejari_property_sub_type_en"),
+            ejari_property_sub_type_ar=row.get("ejari_property_sub_type_ar"),
+            property_usage_en=row.get("property_usage_en"),
+            property_usage_ar=row.get("property_usage_ar"),
+            project_number=row.get("project_number"),
+            project_name_ar=row.get("project_name_ar"),
+            project_name_en=row.get("project_name_en"),
+            master_project_ar=row.get("master_project_ar"),
+            master_project_en=row.get("master_project_en"),
+            area_id_csv=self.safe_int(row.get("area_id")),
+            area_name_ar=row.get("area_name_ar"),
+            area_name_en=row.get("area_name_en"),
+            actual_area=sqm,
+            nearest_landmark_ar=row.get("nearest_landmark_ar"),
+            nearest_landmark_en=row.get("nearest_landmark_en"),
+            nearest_metro_ar=row.get("nearest_metro_ar"),
+            nearest_metro_en=row.get("nearest_metro_en"),
+            nearest_mall_ar=row.get("nearest_mall_ar"),
+            nearest_mall_en=row.get("nearest_mall_en"),
+            tenant_type_id=self.safe_int(row.get("tenant_type_id")),
+            tenant_type_ar=row.get("tenant_type_ar"),
+            tenant_type_en=row.get("tenant_type_en"),
+        )
 
     def convert_rooms_string(self, raw_string: str):
         """
@@ -407,31 +442,6 @@ class Command(BaseCommand):
 
         return replaced
 
-    def get_period(self, date_of_transaction):
-        """
-        Возвращаем "1 week", "1 month", "3 month", "6 month", "1 year", "2 years",
-        либо "older than 2 years" в зависимости от diff.days
-        """
-        if not date_of_transaction:
-            return None
-        today = datetime.date.today()
-        diff_days = (today - date_of_transaction).days
-
-        if diff_days <= 7:
-            return "1 week"
-        elif diff_days <= 30:
-            return "1 month"
-        elif diff_days <= 90:
-            return "3 month"
-        elif diff_days <= 180:
-            return "6 month"
-        elif diff_days <= 365:
-            return "1 year"
-        elif diff_days <= 730:
-            return "2 years"
-        else:
-            return "older than 2 years"
-
     def parse_date(self, date_str):
         if not date_str:
             return None
@@ -0,0 +1,88 @@
+# realty/main/management/commands/rebuild_transaction_rollup.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_datetime
+from realty.main.rollup import dates_changed_since
+from realty.main.rollup import rebuild_rollup
+from realty.main.rollup import refresh_rollup
+from realty.main.rollup import totals_mismatches
+from realty.main.rollup import TRANSACTION_TYPES
+
+# Группировки, по которым loaders.py читает итоги из rollup
+VERIFY_GROUPS = ("building", "building__area", "building__project")
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает дневные агрегаты сделок (TransactionDailyRollup). "
+        "По умолчанию — только дни, изменённые с прошлой сборки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=(*TRANSACTION_TYPES, "all"),
+            default="all",
+            help="Тип сделок: sales, rental или all",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Полная пересборка (нужна после удаления сделок, например --clean-first)",
+        )
+        parser.add_argument(
+            "--since",
+            type=str,
+            default=None,
+            help="Пересчитать дни сделок, изменённых начиная с этого момента (ISO datetime)",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="После сборки сверить итоги rollup с сырыми сделками (ошибка при расхождении)",
+        )
+
+    def handle(self, *args, **options):
+        types = TRANSACTION_TYPES if options["type"] == "all" else (options["type"],)
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+
+        for transaction_type in types:
+            t0 = time.perf_counter()
+            if options["full"]:
+                written = rebuild_rollup(transaction_type)
+            elif since is not None:
+                written = rebuild_rollup(
+                    transaction_type, dates_changed_since(transaction_type, since)
+                )
+            else:
+                written = refresh_rollup(transaction_type)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{transaction_type}: {written} rollup rows in "
+                    f"{time.perf_counter() - t0:.1f}s"
+                )
+            )
+            if options["verify"]:
+                self.verify(transaction_type)
+
+    def verify(self, transaction_type):
+        failed = 0
+        for group_field in VERIFY_GROUPS:
+            mismatches = totals_mismatches(transaction_type, group_field)
+            for key, rollup, raw in mismatches[:10]:
+                self.stderr.write(
+                    f"{transaction_type} {group_field}={key}: rollup {rollup} != raw {raw}"
+                )
+            failed += len(mismatches)
+        if failed:
+            raise CommandError(
+                f"{transaction_type}: rollup totals differ from the transactions "
+                f"in {failed} groups"
+            )
+        self.stdout.write(f"{transaction_type}: rollup totals match the transactions")
@@ -0,0 +1,61 @@
+# realty/main/management/commands/warm_stats_cache.py
+import time
+
+from django.core.management.base import BaseCommand
+from realty.main.tasks import enqueue_warm_batches
+from realty.main.warming import plan_warm_items
+from realty.main.warming import TRANSACTION_TYPES
+from realty.main.warming import warm_item
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогрев кэша статистики поиска: только изменившиеся сущности, "
+        "самые популярные первыми. По умолчанию ставит пачки задач для воркеров "
+        "(ежедневную цепочку compute_aggregation_for_caching не трогает)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--inline",
+            action="store_true",
+            help="Прогреть в этом процессе, без очереди задач",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Прогреть всё, даже если данные не менялись",
+        )
+        parser.add_argument(
+            "--type", choices=(*TRANSACTION_TYPES, "all"), default="all"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Не больше N элементов"
+        )
+
+    def handle(self, *args, **options):
+        types = TRANSACTION_TYPES if options["type"] == "all" else (options["type"],)
+        planned = plan_warm_items(types, force=options["force"])
+        if options["limit"] is not None:
+            planned = planned[: options["limit"]]
+        self.stdout.write(f"{len(planned)} items to warm")
+
+        if not options["inline"]:
+            batches = enqueue_warm_batches(planned)
+            self.stdout.write(self.style.SUCCESS(f"Enqueued {batches} warm batches"))
+            return
+
+        t0 = time.perf_counter()
+        failed = 0
+        for number, (item, signature) in enumerate(planned, start=1):
+            if not warm_item(item, signature):
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"Failed: {item}"))
+            if number % 100 == 0:
+                self.stdout.write(f"{number}/{len(planned)} items")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Warmed {len(planned) - failed} items ({failed} failed) "
+                f"in {time.perf_counter() - t0:.1f}s"
+            )
+        )
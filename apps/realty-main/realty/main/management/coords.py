@@ -0,0 +1,242 @@
+"""
+Coordinate sync of Projects (Location), Buildings and Lands.
+
+Used by import_coords (DLD project JSONs) and fix_buildings_cords
+(coordinates from project.location). The JSON files are parsed in a
+process pool, projects are resolved through one preloaded
+project_number → id map, buildings / lands through one preloaded index of
+the projects in the files, and only the rows whose coordinates change are
+written: Location with bulk_create(update_conflicts=True), Building / Land
+with bulk_update, CHUNK_SIZE rows per transaction.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from realty.main.models import Location
+from realty.main.models import Project
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5_000
+BULK_BATCH_SIZE = 1_000
+
+Coords = tuple[float, float]
+
+
+class PhaseTimer:
+    """Wall time of the named phases of one run, for the final report."""
+
+    def __init__(self):
+        self.timings: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - started))
+
+    def report(self) -> str:
+        total = sum(seconds for _, seconds in self.timings)
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.timings]
+        return f"Timing: {', '.join(parts)} (total {total:.2f}s)"
+
+
+def _coords(location: dict | None) -> Coords | None:
+    location = location or {}
+    lat, lng = location.get("latitude"), location.get("longitude")
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+def _children(
+    items: Iterable[dict],
+) -> list[tuple[str | None, str | None, Coords]]:
+    """(englishName, number, coords) of the JSON buildings / lands with coordinates."""
+    result = []
+    for item in items or ():
+        coords = _coords(item.get("location"))
+        if coords is None:
+            continue
+        name = (item.get("name") or {}).get("englishName")
+        number = item.get("number")
+        result.append((name or None, str(number) if number else None, coords))
+    return result
+
+
+def parse_coords_file(path: str) -> dict | None:
+    """
+    Coordinates of one DLD project JSON: {"project_number", "location",
+    "buildings", "lands"}; {"error": ...} when unreadable, None when it has
+    no project. Runs in the worker processes, so no ORM here.
+    """
+    try:
+        with open(path, encoding="utf-8") as fh:
+            payload = json.load(fh)
+    except Exception as exc:
+        return {"path": path, "error": str(exc)}
+
+    project = (payload.get("response") or {}).get("project")
+    if not project:
+        return None
+    number = (project.get("title") or {}).get("number")
+    if not number:
+        return None
+    return {
+        "path": path,
+        "project_number": str(number),
+        "location": _coords((project.get("location") or {}).get("googleCoordinates")),
+        "buildings": _children(project.get("buidlings")),  # sic, как в DLD JSON
+        "lands": _children(project.get("lands")),
+    }
+
+
+def json_files(root_dir: str) -> list[str]:
+    return sorted(
+        os.path.join(dirpath, fname)
+        for dirpath, _, files in os.walk(root_dir)
+        for fname in files
+        if fname.lower().endswith(".json")
+    )
+
+
+def parse_coords_dir(paths: list[str], workers: int) -> list[dict]:
+    """parse_coords_file of every path (in file order), in `workers` processes."""
+    if workers <= 1 or len(paths) < 2:
+        results = map(parse_coords_file, paths)
+        return [result for result in results if result]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(parse_coords_file, paths, chunksize=64)
+        return [result for result in results if result]
+
+
+def project_ids() -> tuple[dict[str, int], dict[str, int]]:
+    """
+    ({project_number: smallest Project id}, {project_number: count}) for the
+    numbers shared by several projects.
+    """
+    ids: dict[str, int] = {}
+    duplicates: dict[str, int] = defaultdict(int)
+    for number, pk in Project.objects.order_by("pk").values_list(
+        "project_number", "id"
+    ):
+        if number in ids:
+            duplicates[number] += 1
+        else:
+            ids[number] = pk
+    return ids, {number: n + 1 for number, n in duplicates.items()}
+
+
+def bulk_set_coords(model, coords: dict[int, Coords]) -> int:
+    """Writes {pk: (lat, lng)} to `model`, CHUNK_SIZE rows per transaction."""
+    rows = [
+        model(pk=pk, latitude=lat, longitude=lng)
+        for pk, (lat, lng) in sorted(coords.items())
+    ]
+    for start in range(0, len(rows), CHUNK_SIZE):
+        with transaction.atomic():
+            model.objects.bulk_update(
+                rows[start : start + CHUNK_SIZE],
+                ["latitude", "longitude"],
+                batch_size=BULK_BATCH_SIZE,
+            )
+    return len(rows)
+
+
+def upsert_locations(coords: dict[int, Coords]) -> int:
+    """Location of every {project id: (lat, lng)}, created or updated in place."""
+    current = {
+        project_id: (lat, lng)
+        for project_id, lat, lng in Location.objects.filter(
+            project_id__in=list(coords)
+        ).values_list("project_id", "latitude", "longitude")
+    }
+    rows = [
+        Location(project_id=project_id, latitude=lat, longitude=lng)
+        for project_id, (lat, lng) in sorted(coords.items())
+        if current.get(project_id) != (lat, lng)
+    ]
+    for start in range(0, len(rows), CHUNK_SIZE):
+        with transaction.atomic():
+            Location.objects.bulk_create(
+                rows[start : start + CHUNK_SIZE],
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["project"],
+                update_fields=["latitude", "longitude", "updated_at"],
+            )
+    return len(rows)
+
+
+def match_children(model, items: dict[int, list]) -> tuple[dict[int, Coords], int]:
+    """
+    New coordinates of the `model` (Building / Land) rows named by the JSON
+    children {project id: [(englishName, number, coords)]}: every row of the
+    project with that english_name, or with that number when the name is
+    empty; later entries win. Returns ({pk: coords} of the rows that change,
+    number of rows matched).
+    """
+    by_name = defaultdict(list)
+    by_number = defaultdict(list)
+    current = {}
+    project_list = list(items)
+    for start in range(0, len(project_list), CHUNK_SIZE):
+        rows = model.objects.filter(
+            project_id__in=project_list[start : start + CHUNK_SIZE]
+        ).values_list(
+            "id", "project_id", "english_name", "number", "latitude", "longitude"
+        )
+        for pk, project_id, name, number, lat, lng in rows.iterator():
+            by_name[(project_id, name)].append(pk)
+            by_number[(project_id, number)].append(pk)
+            current[pk] = (lat, lng)
+
+    target: dict[int, Coords] = {}
+    for project_id, children in items.items():
+        for name, number, coords in children:
+            if name:
+                matched = by_name.get((project_id, name), ())
+            elif number:
+                matched = by_number.get((project_id, number), ())
+            else:
+                matched = ()
+            for pk in matched:
+                target[pk] = coords
+    changed = {pk: coords for pk, coords in target.items() if current[pk] != coords}
+    return changed, len(target)
+
+
+def coords_from_locations(model, only_missing: bool) -> dict[int, Coords]:
+    """
+    {pk: project.location coords} of the `model` rows whose coordinates
+    differ from their project's Location (only_missing: rows without any).
+    """
+    qs = model.objects.filter(
+        project__location__latitude__isnull=False,
+        project__location__longitude__isnull=False,
+    )
+    if only_missing:
+        qs = qs.filter(latitude__isnull=True, longitude__isnull=True)
+    rows = qs.values_list(
+        "id",
+        "latitude",
+        "longitude",
+        "project__location__latitude",
+        "project__location__longitude",
+    )
+    return {
+        pk: (loc_lat, loc_lng)
+        for pk, lat, lng, loc_lat, loc_lng in rows.iterator(chunk_size=CHUNK_SIZE)
+        if (lat, lng) != (loc_lat, loc_lng)
+    }
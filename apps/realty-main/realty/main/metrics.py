@@ -0,0 +1,163 @@
+"""
+Vectorized metric kernel for the search statistics.
+
+Instead of materializing full model instances and looping over them once per
+metric, the kernel fetches only ``(transaction_price, sqm, date_of_transaction,
+building_id)`` as NumPy arrays and computes count, sum, mean, median, min/max
+and the average area for any number of period masks at once.
+
+Semantics match the historical per-object helpers of ``calc_and_save_search_log``:
+a missing price or sqm counts as 0.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+
+from .liquidity import MonthBuildings
+
+METRIC_FIELDS = ("transaction_price", "sqm", "date_of_transaction", "building_id")
+
+
+class PeriodArraysMixin:
+    """Masks shared by the per-row array containers (needs ``date`` and ``building_id``)."""
+
+    date: np.ndarray  # datetime64[D], missing -> NaT
+    building_id: np.ndarray  # int64, missing -> 0
+
+    def period_mask(self, start: date, end: date) -> np.ndarray:
+        """Boolean mask of the rows with start <= date <= end (both inclusive)."""
+        start64 = np.datetime64(start, "D")
+        end64 = np.datetime64(end, "D")
+        return (self.date >= start64) & (self.date <= end64)
+
+    def month_buildings(self, mask: np.ndarray) -> MonthBuildings:
+        """{(year, month): {building_id, ...}} of the masked rows, for the LiquidityEngine."""
+        valid = mask & (self.building_id > 0) & ~np.isnat(self.date)
+        months = self.date[valid].astype("datetime64[M]").astype(np.int64)
+        buildings = self.building_id[valid]
+        if not len(months):
+            return {}
+        pairs = np.unique(np.stack([months, buildings], axis=1), axis=0)
+        month_buildings: MonthBuildings = {}
+        for month_idx, b_id in pairs.tolist():
+            key = (1970 + month_idx // 12, month_idx % 12 + 1)
+            month_buildings.setdefault(key, set()).add(b_id)
+        return month_buildings
+
+
+@dataclass
+class TransactionArrays(PeriodArraysMixin):
+    price: np.ndarray  # float64, missing -> 0
+    sqm: np.ndarray  # float64, missing -> 0
+    date: np.ndarray  # datetime64[D], missing -> NaT
+    building_id: np.ndarray  # int64, missing -> 0
+
+    def __len__(self):
+        return len(self.price)
+
+    @classmethod
+    def empty(cls) -> "TransactionArrays":
+        return cls(
+            price=np.zeros(0, dtype=np.float64),
+            sqm=np.zeros(0, dtype=np.float64),
+            date=np.zeros(0, dtype="datetime64[D]"),
+            building_id=np.zeros(0, dtype=np.int64),
+        )
+
+    def metrics(self, masks: Sequence[np.ndarray]) -> list[dict[str, float]]:
+        return compute_metrics(self, masks)
+
+
+def load_transaction_arrays(qs) -> TransactionArrays:
+    """
+    Fetches METRIC_FIELDS of a MergedTransaction / MergedRentalTransaction
+    queryset with ``values_list`` and converts them to NumPy arrays.
+    """
+    rows = list(qs.order_by().values_list(*METRIC_FIELDS))
+    if not rows:
+        return TransactionArrays.empty()
+    prices, sqms, dates, building_ids = zip(*rows, strict=True)
+    return TransactionArrays(
+        price=np.array(
+            [float(p) if p is not None else 0.0 for p in prices], dtype=np.float64
+        ),
+        sqm=np.array([s if s is not None else 0.0 for s in sqms], dtype=np.float64),
+        date=np.array(dates, dtype="datetime64[D]"),
+        building_id=np.array(
+            [b if b is not None else 0 for b in building_ids], dtype=np.int64
+        ),
+    )
+
+
+def empty_metrics() -> dict[str, float]:
+    return {
+        "count": 0,
+        "sum_price": 0.0,
+        "avg_price": 0.0,
+        "median_price": 0.0,
+        "min_price": 0.0,
+        "max_price": 0.0,
+        "sum_sqm": 0.0,
+        "avg_area": 0.0,
+        "avg_price_per_sqft": 0.0,
+    }
+
+
+def compute_metrics(
+    arrays: TransactionArrays, masks: Sequence[np.ndarray]
+) -> list[dict[str, float]]:
+    """
+    Computes the metrics of every mask in one pass over the arrays.
+
+    Returns, per mask, a dict with:
+      - count, sum_price, avg_price, median_price, min_price, max_price
+      - sum_sqm, avg_area, avg_price_per_sqft (avg price / avg area)
+    Empty masks yield zeros, like the historical helpers.
+    """
+    if not masks:
+        return []
+    if not len(arrays):
+        return [empty_metrics() for _ in masks]
+    mask_matrix = np.vstack([np.asarray(m, dtype=bool) for m in masks])
+    weights = mask_matrix.astype(np.float64)
+
+    counts = mask_matrix.sum(axis=1)
+    sum_prices = weights @ arrays.price
+    sum_sqms = weights @ arrays.sqm
+    min_prices = np.where(mask_matrix, arrays.price, np.inf).min(axis=1, initial=np.inf)
+    max_prices = np.where(mask_matrix, arrays.price, -np.inf).max(
+        axis=1, initial=-np.inf
+    )
+
+    results = []
+    for i in range(len(masks)):
+        count = int(counts[i])
+        if not count:
+            results.append(empty_metrics())
+            continue
+        # Median via selection (O(n)) on the masked prices instead of a full sort.
+        mid = count // 2
+        if count % 2:
+            median = np.partition(arrays.price[mask_matrix[i]], mid)[mid]
+        else:
+            subset = np.partition(arrays.price[mask_matrix[i]], [mid - 1, mid])
+            median = (subset[mid - 1] + subset[mid]) / 2.0
+        avg_price = float(sum_prices[i]) / count
+        avg_area = float(sum_sqms[i]) / count
+        results.append(
+            {
+                "count": count,
+                "sum_price": float(sum_prices[i]),
+                "avg_price": avg_price,
+                "median_price": float(median),
+                "min_price": float(min_prices[i]),
+                "max_price": float(max_prices[i]),
+                "sum_sqm": float(sum_sqms[i]),
+                "avg_area": avg_area,
+                "avg_price_per_sqft": avg_price / avg_area if avg_area > 0 else 0.0,
+            }
+        )
+    return results
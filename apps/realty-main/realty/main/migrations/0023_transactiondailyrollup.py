@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_csvrentimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(db_index=True, max_length=10)),
+                ('number_of_rooms', models.CharField(blank=True, max_length=255, null=True)),
+                ('date', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sum_price', models.FloatField(default=0)),
+                ('sum_sqm', models.FloatField(default=0)),
+                ('price_count', models.PositiveIntegerField(default=0)),
+                ('sqm_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.FloatField(blank=True, null=True)),
+                ('max_price', models.FloatField(blank=True, null=True)),
+                ('sum_roi', models.FloatField(default=0)),
+                ('roi_count', models.PositiveIntegerField(default=0)),
+                ('price_sketch', models.JSONField(blank=True, default=dict)),
+                ('built_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('area', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.area')),
+                ('building', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.building')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transaction_type', 'date'], name='main_transa_transac_3480a1_idx'), models.Index(fields=['transaction_type', 'building', 'date'], name='main_transa_transac_6da7bf_idx'), models.Index(fields=['transaction_type', 'area', 'date'], name='main_transa_transac_ad97bd_idx'), models.Index(fields=['transaction_type', 'project', 'date'], name='main_transa_transac_c0aeb7_idx')],
+            },
+        ),
+    ]
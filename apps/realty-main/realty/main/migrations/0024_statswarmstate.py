@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_transactiondailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsWarmState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=10)),
+                ('entity_kind', models.CharField(choices=[('dubai', 'All Dubai'), ('area', 'Area'), ('building', 'Building'), ('project', 'Project')], max_length=10)),
+                ('entity_name', models.CharField(blank=True, default='', max_length=255)),
+                ('signature', models.CharField(blank=True, default='', max_length=64)),
+                ('warmed_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('transaction_type', 'entity_kind', 'entity_name'), name='unique_stats_warm_state')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:06
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_contracts(apps, schema_editor):
+    # Перед уникальным ключом оставляем по одной (последней) записи на (contract_id, date)
+    MergedRentalTransaction = apps.get_model('main', 'MergedRentalTransaction')
+    duplicates = (
+        MergedRentalTransaction.objects.exclude(contract_id__isnull=True)
+        .values('contract_id', 'date_of_transaction')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates.iterator():
+        MergedRentalTransaction.objects.filter(
+            contract_id=row['contract_id'],
+            date_of_transaction=row['date_of_transaction'],
+        ).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_statswarmstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvrentimport',
+            name='start_offset',
+            field=models.PositiveBigIntegerField(default=0, help_text='Byte offset to resume from (see the populate_db_rents output); a non-zero offset keeps the existing rental transactions'),
+        ),
+        migrations.RunPython(drop_duplicate_contracts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='mergedrentaltransaction',
+            constraint=models.UniqueConstraint(fields=('contract_id', 'date_of_transaction'), name='unique_rental_contract_date'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_rental_contract_upsert'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mergedrentaltransaction',
+            name='main_merged_period_9f6428_idx',
+        ),
+        migrations.RemoveField(
+            model_name='mergedrentaltransaction',
+            name='period',
+        ),
+        migrations.AddIndex(
+            model_name='mergedrentaltransaction',
+            index=models.Index(fields=['area', 'date_of_transaction'], name='main_merged_area_id_102de8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mergedrentaltransaction',
+            index=models.Index(fields=['building', 'date_of_transaction'], name='main_merged_buildin_70c331_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mergedrentaltransaction',
+            index=models.Index(fields=['project', 'date_of_transaction'], name='main_merged_project_1b1a90_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_drop_rental_period'),
+        ('pfimport', '0013_pfseenlisting'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='building',
+            index=models.Index(fields=['latitude', 'longitude'], name='main_buildi_latitud_f5e77b_idx'),
+        ),
+    ]
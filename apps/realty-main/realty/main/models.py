@@ -151,6 +151,10 @@ class Building(BaseModel):
         db_index=True,
     )
 
+    class Meta:
+        # bbox-запросы карты (pfimport.map_tiles)
+        indexes = [models.Index(fields=["latitude", "longitude"])]
+
     def __str__(self):
         first_word = (
             self.project.english_name.split()[0]
@@ -388,9 +392,6 @@ class MergedRentalTransaction(BaseModel):
     tenant_type_ar = models.CharField(max_length=255, blank=True, null=True)
     tenant_type_en = models.CharField(max_length=255, blank=True, null=True)
 
-    # Если хотите, оставьте period (как у вас уже было),
-    # или любые другие поля, индексы и т. д.
-    period = models.CharField(max_length=50, blank=True, null=True, db_index=True)
     meter_sale_price = models.DecimalField(
         max_digits=15, decimal_places=2, blank=True, null=True
     )
@@ -418,17 +419,73 @@ class MergedRentalTransaction(BaseModel):
         return first_tx.building_rooms_count if first_tx else 0
 
     class Meta:
-        # Если у вас есть уже некий индекс на transaction_price, sqm — оставьте или удалите
+        # Фильтр по периоду — диапазон date_of_transaction внутри выбранного
+        # объекта (utils._get_period_range), т.е. range scan по этим индексам
         indexes = [
-            models.Index(fields=["period"]),
-            # можно добавить уникальный индекс, если нужно (contract_id, date_of_transaction)
-            # но тогда надо убедиться, что не будет дубликатов.
+            models.Index(fields=["area", "date_of_transaction"]),
+            models.Index(fields=["building", "date_of_transaction"]),
+            models.Index(fields=["project", "date_of_transaction"]),
+        ]
+        constraints = [
+            # Ключ upsert-а populate_db_rents (bulk_create(update_conflicts=True));
+            # строки без contract_id (NULL) ограничением не затрагиваются
+            models.UniqueConstraint(
+                fields=["contract_id", "date_of_transaction"],
+                name="unique_rental_contract_date",
+            ),
         ]
 
     def __str__(self):
         return f"Rental {self.contract_id} [{self.date_of_transaction}]"
 
 
+class TransactionDailyRollup(models.Model):
+    """
+    Pre-aggregated MergedTransaction / MergedRentalTransaction rows per
+    (transaction_type, area, building, project, number_of_rooms, day).
+
+    Holds only mergeable aggregates (count, sums, min/max and a quantile sketch,
+    see realty/main/sketch.py), so any period query can be answered by summing
+    the daily rows. Rebuilt by the `rebuild_transaction_rollup` command.
+    """
+
+    transaction_type = models.CharField(max_length=10, db_index=True)
+    area = models.ForeignKey(Area, on_delete=models.CASCADE, blank=True, null=True)
+    building = models.ForeignKey(
+        Building, on_delete=models.CASCADE, blank=True, null=True
+    )
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, blank=True, null=True
+    )
+    number_of_rooms = models.CharField(max_length=255, blank=True, null=True)
+    date = models.DateField()
+
+    count = models.PositiveIntegerField(default=0)
+    sum_price = models.FloatField(default=0)
+    sum_sqm = models.FloatField(default=0)
+    # сделки с заданной ценой / площадью — знаменатели средних без NULL
+    price_count = models.PositiveIntegerField(default=0)
+    sqm_count = models.PositiveIntegerField(default=0)
+    min_price = models.FloatField(blank=True, null=True)
+    max_price = models.FloatField(blank=True, null=True)
+    sum_roi = models.FloatField(default=0)
+    roi_count = models.PositiveIntegerField(default=0)
+    price_sketch = models.JSONField(default=dict, blank=True)
+
+    built_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["transaction_type", "date"]),
+            models.Index(fields=["transaction_type", "building", "date"]),
+            models.Index(fields=["transaction_type", "area", "date"]),
+            models.Index(fields=["transaction_type", "project", "date"]),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.transaction_type} {self.building_id or '-'} [{self.date}] x{self.count}"
+
+
 # --- Импорт данных и служебные модели ---
 
 
@@ -508,6 +565,18 @@ def run_csv_import(import_id: int):
         imp.log += f"Calling: python manage.py {' '.join(cmd_args)}\n"
         call_command(*cmd_args)
 
+        # Дневные агрегаты: пересчитываем только затронутые импортом дни
+        imp.log += "Refreshing transaction rollup...\n"
+        call_command("rebuild_transaction_rollup", "--type=sales")
+
+        # Новое поколение данных: кэш статистики продаж больше не актуален,
+        # индекс имён сущностей тоже мог устареть (новые здания)
+        from realty.main.entity_index import bump_entity_generation
+        from realty.main.stats_cache import bump_generation
+
+        bump_generation("sales")
+        bump_entity_generation()
+
         imp.status = "completed"
         imp.log += "Import finished successfully.\n"
     except Exception as exc:  # noqa: BLE001
@@ -559,11 +628,26 @@ def run_csv_rent_import(import_id: int):
             "populate_db_rents",
             str(tmp_file),
             f"--start-line={imp.start_line}",
-            "--clean-first",
         ]
+        if imp.start_offset:
+            # Продолжение прерванного импорта: уже записанное не трогаем
+            cmd.append(f"--start-offset={imp.start_offset}")
+        else:
+            cmd.append("--clean-first")
         imp.log += f"Calling: python manage.py {' '.join(cmd)}\n"
         call_command(*cmd)
 
+        # --clean-first удаляет все сделки (а upsert мог обновить любые дни),
+        # поэтому агрегаты собираем заново
+        imp.log += "Rebuilding rental rollup…\n"
+        call_command("rebuild_transaction_rollup", "--type=rental", "--full")
+
+        from realty.main.entity_index import bump_entity_generation
+        from realty.main.stats_cache import bump_generation
+
+        bump_generation("rental")
+        bump_entity_generation()
+
         imp.status, msg = "completed", "Import finished successfully.\n"
     except Exception as exc:  # noqa: BLE001
         imp.status, msg = "failed", f"ERROR: {exc}\n"
@@ -584,6 +668,11 @@ class CsvRentImport(LifecycleModel):
 
     rents_csv_url = models.URLField("URL CSV-файла аренды")
     start_line = models.PositiveIntegerField(default=1)
+    start_offset = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Byte offset to resume from (see the populate_db_rents output); "
+        "a non-zero offset keeps the existing rental transactions",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(blank=True, null=True)
     finished_at = models.DateTimeField(blank=True, null=True)
@@ -662,6 +751,14 @@ def run_import(data_import_id):
             )
         else:
             call_command("populate_db", clean=data_import.clean_data)
+        call_command("rebuild_transaction_rollup", full=data_import.clean_data)
+
+        from realty.main.entity_index import bump_entity_generation
+        from realty.main.stats_cache import bump_generation
+
+        for transaction_type in ("sales", "rental"):
+            bump_generation(transaction_type)
+        bump_entity_generation()
         data_import.status = "completed"
     except Exception as e:
         data_import.status = "failed"
@@ -694,3 +791,40 @@ class SearchTransactionsLog(models.Model):
 
     def __str__(self):
         return f"SearchLog {self.id} at {self.requested_at}"
+
+
+class StatsWarmState(models.Model):
+    """
+    Checkpoint of the stats cache warmer (realty/main/warming.py): one row per
+    (transaction_type, entity) with the data signature it was last warmed for.
+    Items whose signature did not change are skipped, so a crashed run resumes
+    where it stopped.
+    """
+
+    ENTITY_KINDS = [
+        ("dubai", "All Dubai"),
+        ("area", "Area"),
+        ("building", "Building"),
+        ("project", "Project"),
+    ]
+
+    transaction_type = models.CharField(max_length=10)
+    entity_kind = models.CharField(max_length=10, choices=ENTITY_KINDS)
+    entity_name = models.CharField(max_length=255, blank=True, default="")
+    signature = models.CharField(max_length=64, blank=True, default="")
+    warmed_at = models.DateTimeField(blank=True, null=True)
+    duration_seconds = models.FloatField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["transaction_type", "entity_kind", "entity_name"],
+                name="unique_stats_warm_state",
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"Warm {self.transaction_type} {self.entity_kind} {self.entity_name or '-'}"
+        )
@@ -0,0 +1,201 @@
+"""
+Fuzzy name matcher for the importers (buildings, projects, areas).
+
+DLD files repeat the same names millions of times, and the historical helpers
+rebuilt the full name list and ran ``process.extractOne`` over it for every
+row without an exact match. The matcher is built once per import:
+
+  - names are normalized (strip + casefold) and kept in id order;
+  - an exact (case-insensitive) match is a dict lookup;
+  - otherwise candidates are pre-filtered with a trigram index (names sharing
+    the most trigrams with the query, at most MAX_CANDIDATES) and scored
+    with ``fuzz.WRatio``; ``match_many`` scores whole batches of distinct
+    names with ``process.cdist`` on all cores;
+  - every result (including "not found") is memoized per raw name.
+
+Ties are resolved towards the smallest id, like ``.first()`` of the tables.
+"""
+
+import logging
+from collections import Counter
+from collections import defaultdict
+from collections.abc import Iterable
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 80
+MAX_CANDIDATES = 200
+BATCH_SIZE = 512
+
+
+def normalize_name(name: str | None) -> str:
+    if not name:
+        return ""
+    return name.strip().casefold()
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyNameMatcher:
+    """
+    Matches raw names to ids of (id, name) rows, see the module docstring.
+
+        matcher = FuzzyNameMatcher.from_model(Building, "english_name")
+        matcher.match_many(df["building_name_en"].unique())  # optional, batched
+        building_id = matcher.match("Burj Khalifa")
+    """
+
+    def __init__(
+        self,
+        rows: Iterable[tuple[int, str | None]],
+        threshold: int = DEFAULT_THRESHOLD,
+        model=None,
+    ):
+        self.threshold = threshold
+        self.model = model
+        rows = sorted((pk, normalize_name(name)) for pk, name in rows if name)
+        self.ids = np.array([pk for pk, _ in rows], dtype=np.int64)
+        self.names: list[str] = [name for _, name in rows]
+        self.exact: dict[str, int] = {}
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        for position, name in enumerate(self.names):
+            self.exact.setdefault(name, int(self.ids[position]))
+            for trigram in _trigrams(name):
+                self.postings[trigram].append(position)
+        self._memo: dict[str, int | None] = {}
+        self._instances: dict[int, object] = {}
+        self.stats = Counter()
+
+    @classmethod
+    def from_model(cls, model, field: str = "english_name", **kwargs):
+        return cls(model.objects.values_list("id", field), model=model, **kwargs)
+
+    def add(self, pk: int, name: str | None):
+        """Registers a row created during the import (its id is the largest so far)."""
+        name = normalize_name(name)
+        if not name:
+            return
+        position = len(self.names)
+        self.ids = np.append(self.ids, pk)
+        self.names.append(name)
+        self.exact.setdefault(name, pk)
+        for trigram in _trigrams(name):
+            self.postings[trigram].append(position)
+        # Ранее не найденные имена могут совпасть с новой строкой
+        self._memo = {
+            raw: found for raw, found in self._memo.items() if found is not None
+        }
+
+    # ------------------------------------------------------------------ #
+
+    def _candidates(self, query: str) -> list[int]:
+        """Positions of the names sharing the most trigrams with `query` (id order)."""
+        if len(query) < 3:
+            return list(range(len(self.names)))
+        shared = Counter()
+        for trigram in _trigrams(query):
+            shared.update(self.postings.get(trigram, ()))
+        best = shared.most_common(MAX_CANDIDATES)
+        return sorted(position for position, _ in best)
+
+    def _remember(self, raw_name: str, pk: int | None, how: str) -> int | None:
+        self._memo[raw_name] = pk
+        self.stats[how] += 1
+        return pk
+
+    def match(self, raw_name: str | None) -> int | None:
+        """Id of the best match of `raw_name` (score >= threshold) or None."""
+        if not raw_name:
+            return None
+        if raw_name in self._memo:
+            return self._memo[raw_name]
+        query = normalize_name(raw_name)
+        if query in self.exact:
+            return self._remember(raw_name, self.exact[query], "exact")
+        candidates = self._candidates(query)
+        result = process.extractOne(
+            query,
+            [self.names[i] for i in candidates],
+            scorer=fuzz.WRatio,
+            score_cutoff=self.threshold,
+        )
+        if result is None:
+            return self._remember(raw_name, None, "missing")
+        _, _, index = result
+        return self._remember(raw_name, int(self.ids[candidates[index]]), "fuzzy")
+
+    def match_many(self, raw_names: Iterable[str | None]) -> dict[str, int | None]:
+        """
+        Matches many names at once: exact ones by dict lookup, the remaining
+        distinct names in batches of BATCH_SIZE with one ``process.cdist`` each
+        (restricted to every name's own trigram candidates).
+        """
+        raw_names = list(dict.fromkeys(raw_names))
+        pending = []
+        for raw_name in raw_names:
+            if not raw_name or raw_name in self._memo:
+                continue
+            query = normalize_name(raw_name)
+            if query in self.exact:
+                self._remember(raw_name, self.exact[query], "exact")
+            else:
+                pending.append((raw_name, query))
+
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = pending[start : start + BATCH_SIZE]
+            candidates = [self._candidates(query) for _, query in batch]
+            columns = sorted(set().union(*candidates))
+            if not columns:
+                for raw_name, _ in batch:
+                    self._remember(raw_name, None, "missing")
+                continue
+            column_of = {position: col for col, position in enumerate(columns)}
+            scores = process.cdist(
+                [query for _, query in batch],
+                [self.names[i] for i in columns],
+                scorer=fuzz.WRatio,
+                score_cutoff=self.threshold,
+                dtype=np.float32,
+                workers=-1,
+            )
+            allowed = np.zeros(scores.shape, dtype=bool)
+            for row, positions in enumerate(candidates):
+                allowed[row, [column_of[p] for p in positions]] = True
+            # без округления баллов: победитель и порог — как у extractOne
+            scores[~allowed] = 0
+            best = scores.argmax(axis=1)
+            for row, (raw_name, _) in enumerate(batch):
+                col = best[row]
+                if scores[row, col] >= self.threshold:
+                    self._remember(raw_name, int(self.ids[columns[col]]), "fuzzy")
+                else:
+                    self._remember(raw_name, None, "missing")
+
+        return {
+            raw_name: self._memo.get(raw_name) for raw_name in raw_names if raw_name
+        }
+
+    def instance(self, raw_name: str | None):
+        """Model instance of the match (memoized per id); needs `model`."""
+        pk = self.match(raw_name)
+        if pk is None:
+            return None
+        if pk not in self._instances:
+            self._instances[pk] = self.model.objects.filter(pk=pk).first()
+        return self._instances[pk]
+
+    def log_stats(self):
+        logger.info(
+            "Name matcher (%s names): %s exact, %s fuzzy, %s not found",
+            len(self.names),
+            self.stats["exact"],
+            self.stats["fuzzy"],
+            self.stats["missing"],
+        )
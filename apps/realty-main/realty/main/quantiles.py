@@ -0,0 +1,134 @@
+"""
+Quantiles (median, p25 / p75 / p90, ...) of a QuerySet column without
+loading the column into Python.
+
+On PostgreSQL every quantile is an exact ``percentile_cont(q) WITHIN GROUP
+(ORDER BY field)`` aggregate, all of them in one statement. Other backends
+(SQLite in development) stream the column through a chunked cursor into a
+mergeable sketch (see sketch.py) and read the quantiles from it, so memory
+is bounded by the number of sketch buckets and the result is within ±1%.
+
+scoped_quantiles() answers several subsets ("scopes", given as Q filters)
+of one QuerySet at once: FILTER (WHERE ...) aggregates on PostgreSQL, one
+scan with a sketch per scope elsewhere.
+
+NULLs are ignored, like percentile_cont does.
+"""
+
+from collections import Counter
+from collections.abc import Iterable
+
+from django.db import connections
+from django.db.models import Aggregate
+from django.db.models import BooleanField
+from django.db.models import Case
+from django.db.models import FloatField
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+
+from .sketch import sketch_add
+from .sketch import sketch_count
+from .sketch import sketch_quantile
+
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+CHUNK_SIZE = 5000
+
+
+class PercentileCont(Aggregate):
+    """percentile_cont(q) WITHIN GROUP (ORDER BY expression), PostgreSQL only."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile: float, **extra):
+        percentile = float(percentile)
+        if not 0.0 <= percentile <= 1.0:
+            raise ValueError("percentile must be between 0 and 1")
+        super().__init__(expression, percentile=repr(percentile), **extra)
+
+
+def supports_percentile_cont(qs) -> bool:
+    return connections[qs.db].vendor == "postgresql"
+
+
+def scope_flags(scopes: dict[str, Q]) -> dict[str, Case]:
+    """
+    Boolean annotations "_in_<scope>" for the non-empty scope filters
+    (an empty Q() means the whole QuerySet and needs no flag).
+    """
+    return {
+        f"_in_{name}": Case(
+            When(condition, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+        for name, condition in scopes.items()
+        if condition
+    }
+
+
+def _sketch_quantiles(qs, field: str, scopes, levels):
+    flags = scope_flags(scopes)
+    rows = (
+        qs.order_by()
+        .filter(**{f"{field}__isnull": False})
+        .annotate(**flags)
+        .values_list(field, *flags)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    sketches = {name: Counter() for name in scopes}
+    for value, *inside in rows:
+        member = dict(zip(flags, inside, strict=True))
+        for name, condition in scopes.items():
+            if not condition or member[f"_in_{name}"]:
+                sketch_add(sketches[name], float(value))
+
+    result = {}
+    for name, sketch in sketches.items():
+        if sketch_count(sketch):
+            result[name] = {q: sketch_quantile(sketch, q) for q in levels}
+        else:
+            result[name] = {q: None for q in levels}
+    return result
+
+
+def scoped_quantiles(
+    qs,
+    field: str,
+    scopes: dict[str, Q],
+    levels: Iterable[float] = DEFAULT_QUANTILES,
+) -> dict[str, dict[float, float | None]]:
+    """
+    {scope: {q: q-quantile of `field`}} for every scope filter of `qs`, in
+    one statement on PostgreSQL and one scan elsewhere.
+    """
+    levels = tuple(levels)
+    if not supports_percentile_cont(qs):
+        return _sketch_quantiles(qs, field, scopes, levels)
+    agg = qs.order_by().aggregate(
+        **{
+            f"{name}__q{i}": PercentileCont(field, q, filter=condition or None)
+            for name, condition in scopes.items()
+            for i, q in enumerate(levels)
+        }
+    )
+    return {
+        name: {q: agg[f"{name}__q{i}"] for i, q in enumerate(levels)} for name in scopes
+    }
+
+
+def quantiles(
+    qs, field: str, levels: Iterable[float] = DEFAULT_QUANTILES
+) -> dict[float, float | None]:
+    """
+    {q: q-quantile of `field`} over `qs` for every q in `levels`; None for
+    every q when `qs` has no non-NULL values.
+    """
+    return scoped_quantiles(qs, field, {"all": Q()}, levels)["all"]
+
+
+def median(qs, field: str) -> float | None:
+    return quantiles(qs, field, (0.5,))[0.5]
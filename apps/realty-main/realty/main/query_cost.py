@@ -0,0 +1,119 @@
+"""
+Query cost limit of the GraphQL schema (schema.py).
+
+The cost of a query is the number of fields it can resolve: every field
+costs 1 plus the cost of its selection times the number of items it can
+return:
+
+  - paginated fields (with a `first` argument) multiply by `first`,
+    PAGE_SIZE when it is omitted and MAX_PAGE_SIZE when it is a variable;
+  - fields taking a list argument (e.g. ids) multiply by its length,
+    MAX_LIST_ARGUMENT when it is a variable.
+
+Fragments are expanded, aliases count separately. A query costing more
+than MAX_QUERY_COST fails validation before anything is resolved.
+"""
+
+from graphql import FieldNode
+from graphql import FragmentSpreadNode
+from graphql import GraphQLError
+from graphql import GraphQLList
+from graphql import InlineFragmentNode
+from graphql import IntValueNode
+from graphql import ListValueNode
+from graphql import OperationType
+from graphql import ValidationRule
+from graphql import get_named_type
+from graphql import get_nullable_type
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_LIST_ARGUMENT = 100
+MAX_QUERY_COST = 5000
+
+
+def _argument_value(field: FieldNode, name: str):
+    for argument in field.arguments or ():
+        if argument.name.value == name:
+            return argument.value
+    return None
+
+
+def field_multiplier(field: FieldNode, field_def) -> int:
+    """How many items `field` can return (see the module docstring)."""
+    if "first" in field_def.args:
+        value = _argument_value(field, "first")
+        if value is None:
+            return PAGE_SIZE
+        if isinstance(value, IntValueNode):
+            return max(min(int(value.value), MAX_PAGE_SIZE), 0)
+        return MAX_PAGE_SIZE
+    multiplier = 1
+    for name, arg_def in field_def.args.items():
+        if not isinstance(get_nullable_type(arg_def.type), GraphQLList):
+            continue
+        value = _argument_value(field, name)
+        if isinstance(value, ListValueNode):
+            multiplier = max(multiplier, len(value.values))
+        elif value is not None:
+            multiplier = max(multiplier, MAX_LIST_ARGUMENT)
+    return multiplier
+
+
+class QueryCostLimiter(ValidationRule):
+    def enter_operation_definition(self, node, *_args):
+        root = {
+            OperationType.QUERY: self.context.schema.query_type,
+            OperationType.MUTATION: self.context.schema.mutation_type,
+            OperationType.SUBSCRIPTION: self.context.schema.subscription_type,
+        }[node.operation]
+        cost = self.selection_cost(node.selection_set, root, frozenset())
+        if cost > MAX_QUERY_COST:
+            self.report_error(
+                GraphQLError(
+                    f"Query cost {cost} exceeds the limit of {MAX_QUERY_COST}.",
+                    node,
+                )
+            )
+
+    def selection_cost(self, selection_set, parent_type, fragments) -> int:
+        if selection_set is None or parent_type is None:
+            return 0
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                cost += self.field_cost(selection, parent_type, fragments)
+            elif isinstance(selection, InlineFragmentNode):
+                cost += self.selection_cost(
+                    selection.selection_set,
+                    self._type(selection.type_condition, parent_type),
+                    fragments,
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.context.get_fragment(name)
+                # циклы фрагментов отклоняет стандартное правило NoFragmentCycles
+                if fragment is None or name in fragments:
+                    continue
+                cost += self.selection_cost(
+                    fragment.selection_set,
+                    self._type(fragment.type_condition, parent_type),
+                    fragments | {name},
+                )
+        return cost
+
+    def field_cost(self, field: FieldNode, parent_type, fragments) -> int:
+        fields = getattr(parent_type, "fields", None) or {}
+        field_def = fields.get(field.name.value)
+        if field_def is None:
+            # __typename и неизвестные поля (их отклонят другие правила)
+            return 1
+        child_cost = self.selection_cost(
+            field.selection_set, get_named_type(field_def.type), fragments
+        )
+        return 1 + field_multiplier(field, field_def) * child_cost
+
+    def _type(self, type_condition, default) -> object | None:
+        if type_condition is None:
+            return default
+        return self.context.schema.get_type(type_condition.name.value)
@@ -0,0 +1,456 @@
+"""
+Daily rollup of the transactions (TransactionDailyRollup).
+
+One row per (transaction_type, area, building, project, number_of_rooms, day)
+with mergeable aggregates: count, sum/min/max price, sum of sqm, ROI sums and
+a price quantile sketch (see sketch.py). Search statistics, aggregator.py and
+the GraphQL analytics can answer any period by summing a few thousand daily
+rows instead of scanning every transaction.
+
+Semantics match the search statistics: a missing price or sqm counts as 0.
+price_count / sqm_count keep how many rows had one, so transaction_totals()
+and transaction_totals_by() average over the known values only, exactly like
+Avg() on the raw rows; totals_mismatches() checks that both paths agree.
+Medians come from the merged sketches and are exact within ±1%.
+
+Rebuild:
+  - rebuild_rollup(transaction_type) — full rebuild of one type;
+  - rebuild_rollup(transaction_type, dates=...) — only the given days
+    (see dates_changed_since), used after the CSV imports.
+"""
+
+import logging
+import math
+from collections.abc import Iterable
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Sum
+from django.utils import timezone
+
+from .metrics import empty_metrics
+from .metrics import PeriodArraysMixin
+from .models import MergedRentalTransaction
+from .models import MergedTransaction
+from .models import TransactionDailyRollup
+from .sketch import merge_sketches
+from .sketch import sketch_from_values
+from .sketch import sketch_quantile
+from .utils import _resolve_search_filter
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_TYPES = ("sales", "rental")
+
+# Сколько дней пересчитываем за одну транзакцию (delete + bulk_create)
+DAYS_PER_BATCH = 31
+BULK_BATCH_SIZE = 2000
+
+
+def _source_queryset(transaction_type: str):
+    if transaction_type == "rental":
+        return MergedRentalTransaction.objects.all()
+    return MergedTransaction.objects.filter(transaction_type="sales")
+
+
+def _source_fields(transaction_type: str) -> tuple:
+    # (area, building, project, rooms, date, price, sqm, roi)
+    if transaction_type == "rental":
+        project_field, roi_field = "project_id", None
+    else:
+        project_field, roi_field = "building__project_id", "roi"
+    fields = (
+        "area_id",
+        "building_id",
+        project_field,
+        "number_of_rooms",
+        "date_of_transaction",
+        "transaction_price",
+        "sqm",
+    )
+    return fields + ((roi_field,) if roi_field else ())
+
+
+def _rollup_rows(transaction_type: str, rows: Iterable[tuple], built_at: datetime):
+    """Groups source rows by (area, building, project, rooms, day) into unsaved rollup objects."""
+    groups: dict[tuple, dict] = {}
+    for row in rows:
+        area_id, building_id, project_id, rooms, tx_date, price, sqm = row[:7]
+        roi = row[7] if len(row) > 7 else None
+        if tx_date is None:
+            continue
+        has_price = price is not None
+        price = float(price) if has_price else 0.0
+        key = (area_id, building_id, project_id, rooms, tx_date)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "count": 0,
+                "sum_price": 0.0,
+                "sum_sqm": 0.0,
+                "min_price": price,
+                "max_price": price,
+                "price_count": 0,
+                "sqm_count": 0,
+                "sum_roi": 0.0,
+                "roi_count": 0,
+                "prices": [],
+            }
+        group["count"] += 1
+        group["sum_price"] += price
+        group["sum_sqm"] += sqm or 0.0
+        group["price_count"] += has_price
+        group["sqm_count"] += sqm is not None
+        group["min_price"] = min(group["min_price"], price)
+        group["max_price"] = max(group["max_price"], price)
+        if roi is not None:
+            group["sum_roi"] += roi
+            group["roi_count"] += 1
+        group["prices"].append(price)
+
+    for (area_id, building_id, project_id, rooms, tx_date), group in groups.items():
+        yield TransactionDailyRollup(
+            transaction_type=transaction_type,
+            area_id=area_id,
+            building_id=building_id,
+            project_id=project_id,
+            number_of_rooms=rooms,
+            date=tx_date,
+            count=group["count"],
+            sum_price=group["sum_price"],
+            sum_sqm=group["sum_sqm"],
+            price_count=group["price_count"],
+            sqm_count=group["sqm_count"],
+            min_price=group["min_price"],
+            max_price=group["max_price"],
+            sum_roi=group["sum_roi"],
+            roi_count=group["roi_count"],
+            price_sketch=sketch_from_values(group["prices"]),
+            built_at=built_at,
+        )
+
+
+def _rebuild_range(transaction_type: str, start: date, end: date, built_at) -> int:
+    """Replaces the rollup rows of start <= day <= end. Returns the number of rows written."""
+    source = _source_queryset(transaction_type).filter(
+        date_of_transaction__gte=start, date_of_transaction__lte=end
+    )
+    rows = source.order_by().values_list(*_source_fields(transaction_type))
+    objs = list(
+        _rollup_rows(transaction_type, rows.iterator(chunk_size=10000), built_at)
+    )
+    with transaction.atomic():
+        TransactionDailyRollup.objects.filter(
+            transaction_type=transaction_type, date__gte=start, date__lte=end
+        ).delete()
+        TransactionDailyRollup.objects.bulk_create(objs, batch_size=BULK_BATCH_SIZE)
+    return len(objs)
+
+
+def _date_ranges(days: Iterable[date]) -> list[tuple]:
+    """Collapses a set of days into (start, end) ranges of at most DAYS_PER_BATCH days."""
+    ranges = []
+    for day in sorted(set(days)):
+        if ranges:
+            start, end = ranges[-1]
+            if day - end <= timedelta(days=1) and (day - start).days < DAYS_PER_BATCH:
+                ranges[-1] = (start, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def dates_changed_since(transaction_type: str, since: datetime) -> list[date]:
+    """Days whose source transactions were created/updated at or after `since`."""
+    return list(
+        _source_queryset(transaction_type)
+        .filter(updated_at__gte=since, date_of_transaction__isnull=False)
+        .order_by()
+        .values_list("date_of_transaction", flat=True)
+        .distinct()
+    )
+
+
+def last_built_at(transaction_type: str) -> datetime | None:
+    return TransactionDailyRollup.objects.filter(
+        transaction_type=transaction_type
+    ).aggregate(last=Max("built_at"))["last"]
+
+
+def rebuild_rollup(transaction_type: str, dates: Iterable[date] | None = None) -> int:
+    """
+    Rebuilds the rollup of one transaction type.
+
+    Without `dates` every day of the source is recomputed (and rows of days that
+    no longer have transactions are dropped); with `dates` only those days.
+    Deleted source rows are only noticed by a full rebuild.
+    Returns the number of rollup rows written.
+    """
+    built_at = timezone.now()
+    if dates is None:
+        bounds = _source_queryset(transaction_type).aggregate(
+            first=Min("date_of_transaction"), last=Max("date_of_transaction")
+        )
+        stale = TransactionDailyRollup.objects.filter(transaction_type=transaction_type)
+        if bounds["first"] is None:
+            stale.delete()
+            return 0
+        stale.exclude(date__gte=bounds["first"], date__lte=bounds["last"]).delete()
+        ranges = []
+        start = bounds["first"]
+        while start <= bounds["last"]:
+            end = min(start + timedelta(days=DAYS_PER_BATCH - 1), bounds["last"])
+            ranges.append((start, end))
+            start = end + timedelta(days=1)
+    else:
+        ranges = _date_ranges(dates)
+
+    written = 0
+    for start, end in ranges:
+        written += _rebuild_range(transaction_type, start, end, built_at)
+    logger.info(
+        "Rollup %s: %s rows over %s date ranges", transaction_type, written, len(ranges)
+    )
+    return written
+
+
+def refresh_rollup(transaction_type: str) -> int:
+    """
+    Incremental rebuild after an import: recomputes the days touched since the
+    previous build (or everything if the rollup of this type is still empty).
+    """
+    since = last_built_at(transaction_type)
+    if since is None:
+        return rebuild_rollup(transaction_type)
+    return rebuild_rollup(
+        transaction_type, dates_changed_since(transaction_type, since)
+    )
+
+
+# --------------------------------------------------------------------------- #
+#  Reading
+# --------------------------------------------------------------------------- #
+
+
+def rollup_is_ready(transaction_type: str) -> bool:
+    return TransactionDailyRollup.objects.filter(
+        transaction_type=transaction_type
+    ).exists()
+
+
+def _filter_rollup_queryset(
+    transaction_type: str,
+    search_substring: str | None,
+    property_components: list[str] | None,
+):
+    """Rollup counterpart of utils._filter_transactions_queryset (without periods)."""
+    qs = TransactionDailyRollup.objects.filter(
+        transaction_type="rental" if transaction_type == "rental" else "sales"
+    )
+    search_filter = _resolve_search_filter(search_substring)
+    if search_filter is None:
+        return qs.none()
+    qs = qs.filter(**search_filter)
+    if property_components and len(property_components) > 0:
+        qs = qs.filter(number_of_rooms__in=property_components)
+    return qs
+
+
+ROLLUP_FIELDS = (
+    "date",
+    "building_id",
+    "count",
+    "sum_price",
+    "sum_sqm",
+    "min_price",
+    "max_price",
+    "price_sketch",
+)
+
+
+@dataclass
+class RollupArrays(PeriodArraysMixin):
+    date: np.ndarray  # datetime64[D]
+    building_id: np.ndarray  # int64, missing -> 0
+    count: np.ndarray  # int64
+    sum_price: np.ndarray  # float64
+    sum_sqm: np.ndarray  # float64
+    min_price: np.ndarray  # float64
+    max_price: np.ndarray  # float64
+    sketches: list[dict]
+
+    def __len__(self):
+        return len(self.count)
+
+    def metrics(self, masks: Sequence[np.ndarray]) -> list[dict[str, float]]:
+        """Same keys as metrics.compute_metrics; the median comes from the sketches."""
+        results = []
+        for mask in masks:
+            mask = np.asarray(mask, dtype=bool)
+            count = int(self.count[mask].sum()) if len(self) else 0
+            if not count:
+                results.append(empty_metrics())
+                continue
+            sum_price = float(self.sum_price[mask].sum())
+            sum_sqm = float(self.sum_sqm[mask].sum())
+            median = sketch_quantile(
+                merge_sketches(self.sketches[i] for i in np.flatnonzero(mask)), 0.5
+            )
+            avg_price = sum_price / count
+            avg_area = sum_sqm / count
+            results.append(
+                {
+                    "count": count,
+                    "sum_price": sum_price,
+                    "avg_price": avg_price,
+                    "median_price": median,
+                    "min_price": float(self.min_price[mask].min()),
+                    "max_price": float(self.max_price[mask].max()),
+                    "sum_sqm": sum_sqm,
+                    "avg_area": avg_area,
+                    "avg_price_per_sqft": avg_price / avg_area if avg_area > 0 else 0.0,
+                }
+            )
+        return results
+
+
+def load_rollup_arrays(qs) -> RollupArrays:
+    rows = list(qs.order_by().values_list(*ROLLUP_FIELDS))
+    if not rows:
+        rows_by_field = [()] * len(ROLLUP_FIELDS)
+    else:
+        rows_by_field = list(zip(*rows, strict=True))
+    dates, building_ids, counts, sum_prices, sum_sqms, mins, maxs, sketches = (
+        rows_by_field
+    )
+    return RollupArrays(
+        date=np.array(dates, dtype="datetime64[D]"),
+        building_id=np.array([b or 0 for b in building_ids], dtype=np.int64),
+        count=np.array(counts, dtype=np.int64),
+        sum_price=np.array(sum_prices, dtype=np.float64),
+        sum_sqm=np.array(sum_sqms, dtype=np.float64),
+        min_price=np.array([m or 0.0 for m in mins], dtype=np.float64),
+        max_price=np.array([m or 0.0 for m in maxs], dtype=np.float64),
+        sketches=list(sketches),
+    )
+
+
+# Агрегаты итогов: из rollup и из сырых сделок. Средние — только по сделкам
+# с известной ценой / площадью (как Avg), поэтому оба пути дают одно и то же.
+ROLLUP_TOTALS = {
+    "total": Sum("count"),
+    "sum_price": Sum("sum_price"),
+    "price_count": Sum("price_count"),
+    "sum_sqm": Sum("sum_sqm"),
+    "sqm_count": Sum("sqm_count"),
+}
+RAW_TOTALS = {
+    "total": Count("id"),
+    "avg_price": Avg("transaction_price"),
+    "avg_sqm": Avg("sqm"),
+}
+
+
+def _rollup_totals(row: dict) -> dict[str, float]:
+    price_count = row["price_count"] or 0
+    sqm_count = row["sqm_count"] or 0
+    return {
+        "total": row["total"] or 0,
+        "avg_price": (row["sum_price"] or 0.0) / price_count if price_count else 0.0,
+        "avg_sqm": (row["sum_sqm"] or 0.0) / sqm_count if sqm_count else 0.0,
+    }
+
+
+def _raw_totals(row: dict) -> dict[str, float]:
+    return {
+        "total": row["total"] or 0,
+        "avg_price": float(row["avg_price"] or 0),
+        "avg_sqm": float(row["avg_sqm"] or 0),
+    }
+
+
+def transaction_totals(transaction_type: str, **filters) -> dict[str, float]:
+    """
+    {"total", "avg_price", "avg_sqm"} of one transaction type for the GraphQL
+    analytics. `filters` use the field names shared by the rollup and the
+    transaction tables (building, building__area, building__project, ...).
+    Answers from the rollup when it has been built, otherwise from the raw
+    rows; both give the same numbers.
+    """
+    if rollup_is_ready(transaction_type):
+        agg = TransactionDailyRollup.objects.filter(
+            transaction_type=transaction_type, **filters
+        ).aggregate(**ROLLUP_TOTALS)
+        return _rollup_totals(agg)
+    agg = _source_queryset(transaction_type).filter(**filters).aggregate(**RAW_TOTALS)
+    return _raw_totals(agg)
+
+
+def _rollup_totals_by(transaction_type: str, group_field: str, **filters) -> dict:
+    rows = (
+        TransactionDailyRollup.objects.filter(
+            transaction_type=transaction_type, **filters
+        )
+        .values(group_field)
+        .annotate(**ROLLUP_TOTALS)
+        .order_by()
+    )
+    return {row[group_field]: _rollup_totals(row) for row in rows}
+
+
+def _raw_totals_by(transaction_type: str, group_field: str, **filters) -> dict:
+    rows = (
+        _source_queryset(transaction_type)
+        .filter(**filters)
+        .values(group_field)
+        .annotate(**RAW_TOTALS)
+        .order_by()
+    )
+    return {row[group_field]: _raw_totals(row) for row in rows}
+
+
+def transaction_totals_by(
+    transaction_type: str, group_field: str, keys: Iterable
+) -> dict[object, dict[str, float]]:
+    """
+    transaction_totals() of many entities with one GROUP BY `group_field`
+    query (building, building__area, building__project). Keys without
+    transactions get zero totals.
+    """
+    keys = list(keys)
+    result = {key: {"total": 0, "avg_price": 0.0, "avg_sqm": 0.0} for key in keys}
+    filters = {f"{group_field}__in": keys}
+    if rollup_is_ready(transaction_type):
+        result.update(_rollup_totals_by(transaction_type, group_field, **filters))
+    else:
+        result.update(_raw_totals_by(transaction_type, group_field, **filters))
+    return result
+
+
+def totals_mismatches(transaction_type: str, group_field: str) -> list[tuple]:
+    """
+    (key, rollup totals, raw totals) of every `group_field` group whose
+    rollup totals differ from the raw transactions (averages compared with
+    a relative tolerance of 1e-9). Empty when the rollup is consistent.
+    """
+    rollup = _rollup_totals_by(transaction_type, group_field)
+    raw = _raw_totals_by(transaction_type, group_field)
+    empty = {"total": 0, "avg_price": 0.0, "avg_sqm": 0.0}
+    mismatches = []
+    for key in rollup.keys() | raw.keys():
+        got, expected = rollup.get(key, empty), raw.get(key, empty)
+        if got["total"] != expected["total"] or not all(
+            math.isclose(got[name], expected[name], rel_tol=1e-9, abs_tol=1e-6)
+            for name in ("avg_price", "avg_sqm")
+        ):
+            mismatches.append((key, got, expected))
+    return mismatches
@@ -1,11 +1,42 @@
+"""
+GraphQL schema of the market data.
+
+- list fields are Relay-style connections with keyset (pk) cursors:
+  `first` (PAGE_SIZE by default, at most MAX_PAGE_SIZE) and `after`;
+- analytics of areas / buildings / projects go through per-request
+  DataLoaders (loaders.py): one GROUP BY query per model for all the ids
+  a request asks for, including the batch fields (`buildingsAnalytics`...);
+- QueryCostLimiter (query_cost.py) and QueryDepthLimiter bound the cost of
+  one request.
+
+The resolvers are async: the schema is served by AsyncGraphQLView at
+/main/graphql/ (realty/main/urls.py).
+"""
+
 import strawberry
-from strawberry_django import auto
-from typing import List, Optional
-from django.db.models import Avg, Count, Sum, Min, Max
+import strawberry_django
+from asgiref.sync import sync_to_async
+from strawberry import auto
+from strawberry.extensions import AddValidationRules
+from strawberry.extensions import QueryDepthLimiter
+from strawberry.relay import Connection
+from strawberry.relay import Edge
+from strawberry.relay import PageInfo
+from strawberry.relay import from_base64
+from strawberry.relay import to_base64
+from .loaders import get_loaders
 from .models import Area, Building, Project, MergedTransaction, MergedRentalTransaction
+from .query_cost import MAX_LIST_ARGUMENT
+from .query_cost import MAX_PAGE_SIZE
+from .query_cost import PAGE_SIZE
+from .query_cost import QueryCostLimiter
+from .rollup import transaction_totals
 
+CURSOR_PREFIX = "pk"
+MAX_QUERY_DEPTH = 8
 
-@strawberry.django.type(Area)
+
+@strawberry_django.type(Area)
 class AreaType:
     id: auto
     name_en: auto
@@ -13,7 +44,7 @@ class AreaType:
     area_idx: auto
 
 
-@strawberry.django.type(Building)
+@strawberry_django.type(Building)
 class BuildingType:
     id: auto
     english_name: auto
@@ -24,7 +55,7 @@ class BuildingType:
     project: auto
 
 
-@strawberry.django.type(Project)
+@strawberry_django.type(Project)
 class ProjectType:
     id: auto
     english_name: auto
@@ -35,20 +66,19 @@ class ProjectType:
     developer: auto
 
 
-@strawberry.django.type(MergedTransaction)
+@strawberry_django.type(MergedTransaction)
 class TransactionType:
     id: auto
-    contract_amount: auto
-    contract_date: auto
+    transaction_price: auto
+    date_of_transaction: auto
     building: BuildingType
-    project: ProjectType
     area: AreaType
     number_of_rooms: auto
     sqm: auto
     meter_sale_price: auto
 
 
-@strawberry.django.type(MergedRentalTransaction)
+@strawberry_django.type(MergedRentalTransaction)
 class RentalTransactionType:
     id: auto
     annual_amount: auto
@@ -110,172 +140,229 @@ class MarketOverview:
     rent_trend: str
 
 
+def _decode_cursor(cursor: str) -> int:
+    try:
+        prefix, pk = from_base64(cursor)
+        if prefix != CURSOR_PREFIX:
+            raise ValueError(prefix)
+        return int(pk)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}") from None
+
+
+def _paginate(qs, first: int | None, after: str | None) -> Connection:
+    """Keyset page of `qs` ordered by pk: `first` rows after the `after` cursor."""
+    first = PAGE_SIZE if first is None else first
+    if not 0 <= first <= MAX_PAGE_SIZE:
+        raise ValueError(f"first must be between 0 and {MAX_PAGE_SIZE}")
+    if after:
+        qs = qs.filter(pk__gt=_decode_cursor(after))
+    # одна лишняя строка говорит, есть ли следующая страница
+    rows = list(qs.order_by("pk")[: first + 1])
+    edges = [
+        Edge(cursor=to_base64(CURSOR_PREFIX, row.pk), node=row) for row in rows[:first]
+    ]
+    return Connection(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=len(rows) > first,
+            has_previous_page=after is not None,
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
+    )
+
+
+def _check_ids(ids: list[int]) -> list[int]:
+    if len(ids) > MAX_LIST_ARGUMENT:
+        raise ValueError(f"At most {MAX_LIST_ARGUMENT} ids per request")
+    return ids
+
+
+def _area_analytics(row) -> AreaAnalytics:
+    sales, rents = row["sales"], row["rents"]
+    return AreaAnalytics(
+        area=row["area"],
+        total_transactions=sales["total"] or 0,
+        total_rental_transactions=rents["total"] or 0,
+        avg_price=float(sales["avg_price"] or 0),
+        avg_rent=float(rents["avg_price"] or 0),
+        avg_sqm=float(sales["avg_sqm"] or 0),
+        building_count=row["building_count"],
+        project_count=row["project_count"],
+    )
+
+
+def _building_analytics(row) -> BuildingAnalytics:
+    sales, rents = row["sales"], row["rents"]
+    # Расчет ROI (упрощенный)
+    avg_price = sales["avg_price"] or 0
+    avg_rent = rents["avg_price"] or 0
+    roi = (avg_rent * 12 / avg_price * 100) if avg_price > 0 else 0
+    return BuildingAnalytics(
+        building=row["building"],
+        total_transactions=sales["total"] or 0,
+        total_rental_transactions=rents["total"] or 0,
+        avg_price=float(avg_price),
+        avg_rent=float(avg_rent),
+        avg_sqm=float(sales["avg_sqm"] or 0),
+        # Срок экспозиции в сделках DLD не хранится
+        days_on_market=0,
+        roi=float(roi),
+    )
+
+
+def _project_analytics(row) -> ProjectAnalytics:
+    sales, rents = row["sales"], row["rents"]
+    total_units = row["project"].total_units or 0
+    occupancy_rate = (sales["total"] / total_units * 100) if total_units > 0 else 0
+    return ProjectAnalytics(
+        project=row["project"],
+        total_transactions=sales["total"] or 0,
+        total_rental_transactions=rents["total"] or 0,
+        avg_price=float(sales["avg_price"] or 0),
+        avg_rent=float(rents["avg_price"] or 0),
+        avg_sqm=float(sales["avg_sqm"] or 0),
+        building_count=row["building_count"],
+        occupancy_rate=float(occupancy_rate),
+    )
+
+
+def _market_overview() -> MarketOverview:
+    # Общая статистика рынка
+    total_areas = Area.objects.count()
+    total_buildings = Building.objects.count()
+    total_projects = Project.objects.count()
+
+    # Статистика по сделкам (по дневным агрегатам, если они построены)
+    transaction_stats = transaction_totals("sales")
+    rental_stats = transaction_totals("rental")
+
+    # Упрощенные тренды (можно заменить на реальную логику)
+    price_trend = "stable"  # placeholder
+    rent_trend = "stable"  # placeholder
+
+    return MarketOverview(
+        total_areas=total_areas,
+        total_buildings=total_buildings,
+        total_projects=total_projects,
+        total_transactions=transaction_stats["total"] or 0,
+        total_rental_transactions=rental_stats["total"] or 0,
+        avg_price=float(transaction_stats["avg_price"] or 0),
+        avg_rent=float(rental_stats["avg_price"] or 0),
+        avg_sqm=float(transaction_stats["avg_sqm"] or 0),
+        price_trend=price_trend,
+        rent_trend=rent_trend,
+    )
+
+
 @strawberry.type
 class Query:
     @strawberry.field
-    def areas(self, info) -> List[AreaType]:
-        return Area.objects.all()
-    
-    @strawberry.field
-    def buildings(self, info) -> List[BuildingType]:
-        return Building.objects.select_related('area', 'project').all()
-    
-    @strawberry.field
-    def projects(self, info) -> List[ProjectType]:
-        return Project.objects.all()
-    
+    async def areas(
+        self,
+        info: strawberry.Info,
+        first: int | None = None,
+        after: str | None = None,
+    ) -> Connection[AreaType]:
+        return await sync_to_async(_paginate)(Area.objects.all(), first, after)
+
     @strawberry.field
-    def transactions(self, info) -> List[TransactionType]:
-        return MergedTransaction.objects.select_related('building', 'project', 'area').all()
-    
+    async def buildings(
+        self,
+        info: strawberry.Info,
+        first: int | None = None,
+        after: str | None = None,
+    ) -> Connection[BuildingType]:
+        qs = Building.objects.select_related("area", "project")
+        return await sync_to_async(_paginate)(qs, first, after)
+
     @strawberry.field
-    def rental_transactions(self, info) -> List[RentalTransactionType]:
-        return MergedRentalTransaction.objects.select_related('building', 'project', 'area').all()
-    
+    async def projects(
+        self,
+        info: strawberry.Info,
+        first: int | None = None,
+        after: str | None = None,
+    ) -> Connection[ProjectType]:
+        return await sync_to_async(_paginate)(Project.objects.all(), first, after)
+
     @strawberry.field
-    def area_analytics(self, info, area_id: int) -> AreaAnalytics:
-        area = Area.objects.get(id=area_id)
-        
-        # Аналитика по сделкам
-        transactions = MergedTransaction.objects.filter(building__area=area)
-        rental_transactions = MergedRentalTransaction.objects.filter(building__area=area)
-        
-        # Агрегированные метрики
-        transaction_stats = transactions.aggregate(
-            total=Count('id'),
-            avg_price=Avg('contract_amount'),
-            avg_sqm=Avg('sqm')
+    async def transactions(
+        self,
+        info: strawberry.Info,
+        first: int | None = None,
+        after: str | None = None,
+    ) -> Connection[TransactionType]:
+        qs = MergedTransaction.objects.select_related(
+            "building__area", "building__project", "area"
         )
-        
-        rental_stats = rental_transactions.aggregate(
-            total=Count('id'),
-            avg_rent=Avg('annual_amount')
-        )
-        
-        building_count = Building.objects.filter(area=area).count()
-        project_count = Project.objects.filter(buildings__area=area).distinct().count()
-        
-        return AreaAnalytics(
-            area=area,
-            total_transactions=transaction_stats['total'] or 0,
-            total_rental_transactions=rental_stats['total'] or 0,
-            avg_price=float(transaction_stats['avg_price'] or 0),
-            avg_rent=float(rental_stats['avg_rent'] or 0),
-            avg_sqm=float(transaction_stats['avg_sqm'] or 0),
-            building_count=building_count,
-            project_count=project_count
-        )
-    
+        return await sync_to_async(_paginate)(qs, first, after)
+
     @strawberry.field
-    def building_analytics(self, info, building_id: int) -> BuildingAnalytics:
-        building = Building.objects.get(id=building_id)
-        
-        # Аналитика по сделкам
-        transactions = MergedTransaction.objects.filter(building=building)
-        rental_transactions = MergedRentalTransaction.objects.filter(building=building)
-        
-        # Агрегированные метрики
-        transaction_stats = transactions.aggregate(
-            total=Count('id'),
-            avg_price=Avg('contract_amount'),
-            avg_sqm=Avg('sqm'),
-            avg_days=Avg('days_on_market')
-        )
-        
-        rental_stats = rental_transactions.aggregate(
-            total=Count('id'),
-            avg_rent=Avg('annual_amount')
-        )
-        
-        # Расчет ROI (упрощенный)
-        avg_price = transaction_stats['avg_price'] or 0
-        avg_rent = rental_stats['avg_rent'] or 0
-        roi = (avg_rent * 12 / avg_price * 100) if avg_price > 0 else 0
-        
-        return BuildingAnalytics(
-            building=building,
-            total_transactions=transaction_stats['total'] or 0,
-            total_rental_transactions=rental_stats['total'] or 0,
-            avg_price=float(avg_price),
-            avg_rent=float(avg_rent),
-            avg_sqm=float(transaction_stats['avg_sqm'] or 0),
-            days_on_market=int(transaction_stats['avg_days'] or 0),
-            roi=float(roi)
+    async def rental_transactions(
+        self,
+        info: strawberry.Info,
+        first: int | None = None,
+        after: str | None = None,
+    ) -> Connection[RentalTransactionType]:
+        qs = MergedRentalTransaction.objects.select_related(
+            "building__area", "building__project", "project", "area"
         )
+        return await sync_to_async(_paginate)(qs, first, after)
 
     @strawberry.field
-    def project_analytics(self, info, project_id: int) -> ProjectAnalytics:
-        project = Project.objects.get(id=project_id)
-        
-        # Аналитика по сделкам
-        transactions = MergedTransaction.objects.filter(building__project=project)
-        rental_transactions = MergedRentalTransaction.objects.filter(building__project=project)
-        
-        # Агрегированные метрики
-        transaction_stats = transactions.aggregate(
-            total=Count('id'),
-            avg_price=Avg('contract_amount'),
-            avg_sqm=Avg('sqm')
-        )
-        
-        rental_stats = rental_transactions.aggregate(
-            total=Count('id'),
-            avg_rent=Avg('annual_amount')
-        )
-        
-        building_count = Building.objects.filter(project=project).count()
-        total_units = project.total_units or 0
-        occupancy_rate = (transaction_stats['total'] / total_units * 100) if total_units > 0 else 0
-        
-        return ProjectAnalytics(
-            project=project,
-            total_transactions=transaction_stats['total'] or 0,
-            total_rental_transactions=rental_stats['total'] or 0,
-            avg_price=float(transaction_stats['avg_price'] or 0),
-            avg_rent=float(rental_stats['avg_rent'] or 0),
-            avg_sqm=float(transaction_stats['avg_sqm'] or 0),
-            building_count=building_count,
-            occupancy_rate=float(occupancy_rate)
-        )
+    async def area_analytics(
+        self, info: strawberry.Info, area_id: int
+    ) -> AreaAnalytics:
+        row = await get_loaders(info).area_analytics.load(area_id)
+        return _area_analytics(row)
 
     @strawberry.field
-    def market_overview(self, info) -> MarketOverview:
-        # Общая статистика рынка
-        total_areas = Area.objects.count()
-        total_buildings = Building.objects.count()
-        total_projects = Project.objects.count()
-        
-        # Статистика по сделкам
-        transactions = MergedTransaction.objects.all()
-        rental_transactions = MergedRentalTransaction.objects.all()
-        
-        transaction_stats = transactions.aggregate(
-            total=Count('id'),
-            avg_price=Avg('contract_amount'),
-            avg_sqm=Avg('sqm')
-        )
-        
-        rental_stats = rental_transactions.aggregate(
-            total=Count('id'),
-            avg_rent=Avg('annual_amount')
-        )
-        
-        # Упрощенные тренды (можно заменить на реальную логику)
-        price_trend = "stable"  # placeholder
-        rent_trend = "stable"   # placeholder
-        
-        return MarketOverview(
-            total_areas=total_areas,
-            total_buildings=total_buildings,
-            total_projects=total_projects,
-            total_transactions=transaction_stats['total'] or 0,
-            total_rental_transactions=rental_stats['total'] or 0,
-            avg_price=float(transaction_stats['avg_price'] or 0),
-            avg_rent=float(rental_stats['avg_rent'] or 0),
-            avg_sqm=float(transaction_stats['avg_sqm'] or 0),
-            price_trend=price_trend,
-            rent_trend=rent_trend
-        )
+    async def areas_analytics(
+        self, info: strawberry.Info, area_ids: list[int]
+    ) -> list[AreaAnalytics]:
+        rows = await get_loaders(info).area_analytics.load_many(_check_ids(area_ids))
+        return [_area_analytics(row) for row in rows]
+
+    @strawberry.field
+    async def building_analytics(
+        self, info: strawberry.Info, building_id: int
+    ) -> BuildingAnalytics:
+        row = await get_loaders(info).building_analytics.load(building_id)
+        return _building_analytics(row)
+
+    @strawberry.field
+    async def buildings_analytics(
+        self, info: strawberry.Info, building_ids: list[int]
+    ) -> list[BuildingAnalytics]:
+        loader = get_loaders(info).building_analytics
+        rows = await loader.load_many(_check_ids(building_ids))
+        return [_building_analytics(row) for row in rows]
+
+    @strawberry.field
+    async def project_analytics(
+        self, info: strawberry.Info, project_id: int
+    ) -> ProjectAnalytics:
+        row = await get_loaders(info).project_analytics.load(project_id)
+        return _project_analytics(row)
+
+    @strawberry.field
+    async def projects_analytics(
+        self, info: strawberry.Info, project_ids: list[int]
+    ) -> list[ProjectAnalytics]:
+        loader = get_loaders(info).project_analytics
+        rows = await loader.load_many(_check_ids(project_ids))
+        return [_project_analytics(row) for row in rows]
+
+    @strawberry.field
+    async def market_overview(self, info: strawberry.Info) -> MarketOverview:
+        return await sync_to_async(_market_overview)()
 
 
-schema = strawberry.Schema(query=Query)
+schema = strawberry.Schema(
+    query=Query,
+    extensions=[
+        AddValidationRules([QueryCostLimiter]),
+        QueryDepthLimiter(max_depth=MAX_QUERY_DEPTH),
+    ],
+)
@@ -0,0 +1,87 @@
+"""
+Mergeable quantile sketch (DDSketch-style log buckets) for the daily rollups.
+
+A sketch is a plain JSON-serializable dict ``{bucket_key: count}``:
+positive values fall into logarithmic buckets with a relative accuracy of
+``RELATIVE_ACCURACY`` (any quantile is returned within ±1% of a true value),
+zero / negative / missing values are counted under ``ZERO_KEY``.
+
+Sketches of several days (or buildings) are merged by adding bucket counts,
+so a median over any date range can be answered from the daily rows without
+touching the raw transactions.
+"""
+
+import math
+from collections import Counter
+from collections.abc import Iterable
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+ZERO_KEY = "z"
+
+Sketch = dict[str, int]
+
+
+def _bucket_key(value: float | None) -> str:
+    if value is None or value <= 0:
+        return ZERO_KEY
+    return str(math.ceil(math.log(value) / _LOG_GAMMA))
+
+
+def _bucket_value(key: str) -> float:
+    if key == ZERO_KEY:
+        return 0.0
+    index = int(key)
+    # Середина корзины (gamma^(i-1), gamma^i] с относительной ошибкой <= accuracy
+    return 2.0 * GAMMA**index / (GAMMA + 1)
+
+
+def sketch_from_values(values: Iterable[float | None]) -> Sketch:
+    """Builds a sketch from raw values (None counts as 0, like the search stats do)."""
+    return dict(Counter(_bucket_key(v) for v in values))
+
+
+def sketch_add(sketch: Counter, value: float | None) -> None:
+    """Adds one value to a sketch that is being built as a Counter."""
+    sketch[_bucket_key(value)] += 1
+
+
+def merge_sketches(sketches: Iterable[Sketch | None]) -> Sketch:
+    merged: Counter = Counter()
+    for sketch in sketches:
+        if sketch:
+            merged.update(sketch)
+    return dict(merged)
+
+
+def sketch_count(sketch: Sketch | None) -> int:
+    return sum(sketch.values()) if sketch else 0
+
+
+def sketch_quantile(sketch: Sketch | None, q: float) -> float:
+    """
+    Approximate q-quantile (0 <= q <= 1) of a sketch; 0.0 for an empty sketch.
+    Interpolates between neighbouring ranks like ``statistics.median`` does
+    for an even number of values.
+    """
+    total = sketch_count(sketch)
+    if not total:
+        return 0.0
+    rank = q * (total - 1)
+    lower_rank = math.floor(rank)
+    upper_rank = min(lower_rank + 1, total - 1)
+    keys = sorted(
+        sketch,
+        key=lambda k: -math.inf if k == ZERO_KEY else int(k),
+    )
+    lower = upper = None
+    seen = 0
+    for key in keys:
+        seen += sketch[key]
+        if lower is None and seen > lower_rank:
+            lower = _bucket_value(key)
+        if seen > upper_rank:
+            upper = _bucket_value(key)
+            break
+    return lower + (upper - lower) * (rank - lower_rank)
@@ -1,22 +1,24 @@
 import hashlib
 import json
-import statistics
-from collections import defaultdict
-from typing import Dict
-from typing import Iterable
-from typing import List
-from typing import Optional
-from typing import Union
-
-from django.core.cache import cache
-from django.db.models import Q
-
-from .models import Area
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Sequence
+from datetime import date
+from typing import Any
+
+from django.conf import settings
+
 from .models import Building
-from .models import BuildingLiquidityParameterOne
 from .models import Project
 from .models import SearchTransactionsLog
-from .utils import _build_transactions_queryset
+from . import stats_cache
+from .entity_index import get_entity_index
+from .liquidity import LiquidityEngine
+from .metrics import load_transaction_arrays
+from .rollup import _filter_rollup_queryset
+from .rollup import load_rollup_arrays
+from .rollup import rollup_is_ready
+from .utils import _filter_transactions_queryset
 from .utils import _get_period_range
 
 
@@ -37,7 +39,7 @@ def calculate_total_units_sum(buildings: Iterable[Building]) -> float:
     return total
 
 
-def compute_total_buildings(search_substring: Optional[str]) -> Dict[str, float]:
+def compute_total_buildings(search_substring: str | None) -> dict[str, float]:
     """
     Computes the total number of buildings and the total units sum based on the search substring:
 
@@ -82,19 +84,21 @@ def compute_total_buildings(search_substring: Optional[str]) -> Dict[str, float]
     #     return {"building_count": building_count, "units_sum": units_sum}
     if search_substring and search_substring.strip():
         search_str = search_substring.strip()
-        area_qs = Area.objects.filter(
-            Q(name_en__icontains=search_str) | Q(name_ar__icontains=search_str)
-        )
-        if area_qs.exists():
-            building_qs = Building.objects.filter(area__in=area_qs)
+        index = get_entity_index()
+        area_ids = index.find("area", search_str, include_arabic=True)
+        if area_ids:
+            building_qs = Building.objects.filter(area_id__in=area_ids)
             building_count = building_qs.count()
-            units_sum = calculate_total_units_sum(building_qs)
+            units_sum = calculate_total_units_sum(building_qs.select_related("project"))
             return {"building_count": building_count, "units_sum": units_sum}
         else:
-            building_qs = Building.objects.filter(english_name__icontains=search_str)
-            if building_qs.exists():
+            building_ids = index.find("building", search_str)
+            if building_ids:
+                building_qs = Building.objects.filter(id__in=building_ids)
                 building_count = building_qs.count()
-                units_sum = calculate_total_units_sum(building_qs)
+                units_sum = calculate_total_units_sum(
+                    building_qs.select_related("project")
+                )
                 return {"building_count": building_count, "units_sum": units_sum}
             else:
                 project_qs = Project.objects.all()
@@ -108,14 +112,109 @@ def compute_total_buildings(search_substring: Optional[str]) -> Dict[str, float]
         return {"building_count": building_count, "units_sum": units_sum}
 
 
+def _is_cacheable_search(search_substring: str) -> bool:
+    """True if the search substring matches an existing building, project or area."""
+    search_str = search_substring.strip()
+    index = get_entity_index()
+    return bool(
+        index.find("building", search_str)
+        or index.find("project", search_str)
+        or index.find("area", search_str, include_arabic=True)
+    )
+
+
+def _reference_areas(search_substring: str | None) -> tuple[bool, list[int]]:
+    """
+    Determines if the search is for a building/project (its VERSUS reference is
+    then the area) and returns (is_building_or_project_search, reference_area_ids).
+    """
+    if not (search_substring and search_substring.strip()):
+        return False, []
+    search_str = search_substring.strip()
+    index = get_entity_index()
+    # Check if it's a building search
+    building_ids = index.find("building", search_str)
+    if building_ids:
+        # Get the areas of the buildings
+        building_qs = Building.objects.filter(id__in=building_ids)
+        return True, list(building_qs.values_list("area_id", flat=True).distinct())
+
+    # Check if it's a project search
+    project_ids = index.find("project", search_str)
+    if project_ids:
+        # Get buildings associated with this project, then get their areas
+        buildings_in_projects = Building.objects.filter(project_id__in=project_ids)
+        return True, list(
+            buildings_in_projects.values_list("area_id", flat=True).distinct()
+        )
+    return False, []
+
+
+class SearchContext:
+    """
+    Shared state of several calc_and_save_search_log calls for the same search
+    and different periods (see calc_search_logs_for_periods).
+
+    The searched transactions are loaded once for `window` (covering every
+    period and its previous period), the reference (All Dubai / area) ones once
+    for `reference_window`, and each period only masks those arrays. Entity
+    lookups are memoized and all periods share one LiquidityEngine.
+    """
+
+    def __init__(self, window: tuple[date, date], reference_window: tuple[date, date]):
+        self.window = window
+        self.reference_window = reference_window
+        self.liquidity_engine = LiquidityEngine()
+        self._memo: dict[tuple, Any] = {}
+
+    def memoized(self, key, compute: Callable[[], Any]) -> Any:
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+
+def _load_period_arrays(
+    transaction_type: str,
+    search_substring: str | None,
+    property_components: list[str] | None,
+    start,
+    end,
+    use_rollup: bool = False,
+    **filters,
+):
+    """
+    Loads start <= day <= end as metric arrays: per-transaction rows
+    (metrics.TransactionArrays) or daily rollup rows (rollup.RollupArrays).
+    Both expose period_mask / month_buildings / metrics.
+    """
+    if use_rollup:
+        return load_rollup_arrays(
+            _filter_rollup_queryset(
+                transaction_type, search_substring, property_components
+            ).filter(date__gte=start, date__lte=end, **filters)
+        )
+    return load_transaction_arrays(
+        _filter_transactions_queryset(
+            transaction_type=transaction_type,
+            search_substring=search_substring,
+            property_components=property_components,
+            periods=None,
+        ).filter(
+            date_of_transaction__gte=start, date_of_transaction__lte=end, **filters
+        )
+    )
+
+
 def calc_and_save_search_log(
     transaction_type: str,
-    search_substring: Optional[str],
-    property_components: Optional[List[str]],
-    period_str: Optional[str] = None,
+    search_substring: str | None,
+    property_components: list[str] | None,
+    period_str: str | None = None,
     return_dict: bool = False,  # if True, return dict of aggregated values instead of log_obj
     use_cache: bool = True,  # if True, use cache for expensive calculations
-) -> Union[SearchTransactionsLog, dict]:
+    use_rollup: bool | None = None,  # None -> settings.STATS_USE_ROLLUP
+    _context: SearchContext | None = None,  # see calc_search_logs_for_periods
+) -> SearchTransactionsLog | dict:
     """
     1) Builds a queryset of MergedTransaction for the given filters.
     2) Splits the data into a 'current period' and a 'previous period' (e.g. current month vs. previous month).
@@ -157,53 +256,53 @@ def calc_and_save_search_log(
        - This applies to: AVERAGE_PRICE, MEDIAN_PRICE, AVERAGE_PRICE_PER_SQM, PRICE_RANGE, DEALS_VOLUME, LIQUIDITY
 
     6) CACHING:
-       - Expensive calculations (especially reference values and versus metrics) are cached for a day
+       - Expensive calculations (especially reference values and versus metrics) are cached
+         in the versioned namespace of the transaction type (stats_cache.py) until the next import
        - Cache key is based on the input parameters and period boundaries
+
+    7) ROLLUP:
+       - With use_rollup (default: settings.STATS_USE_ROLLUP) the metrics are read from
+         TransactionDailyRollup instead of the raw transactions, once it has been built.
+         Medians are then approximate (±1%, see sketch.py).
     """
+
+    def memoized(key, compute):
+        if _context is None:
+            return compute()
+        return _context.memoized(key, compute)
+
     # First check if search_substring matches an existing building, project, or area
     # Only cache results for valid entities, not arbitrary user searches
-    should_use_cache = False
     if use_cache and search_substring and search_substring.strip():
-        search_str = search_substring.strip()
-        # Check if it's a valid building
-        building_exists = Building.objects.filter(
-            english_name__icontains=search_str
-        ).exists()
-        if building_exists:
-            should_use_cache = True
-
-        # Check if it's a valid project
-        if not should_use_cache:
-            project_exists = Project.objects.filter(
-                english_name__icontains=search_str
-            ).exists()
-            if project_exists:
-                should_use_cache = True
-
-        # Check if it's a valid area
-        if not should_use_cache:
-            area_exists = Area.objects.filter(
-                Q(name_en__icontains=search_str) | Q(name_ar__icontains=search_str)
-            ).exists()
-            if area_exists:
-                should_use_cache = True
+        should_use_cache = memoized(
+            "cacheable", lambda: _is_cacheable_search(search_substring)
+        )
     else:
         # If no search substring is provided, we're getting all Dubai data
         # which is definitely worth caching
         should_use_cache = use_cache
 
-    # Generate a cache key based on input parameters
+    # Generate a cache key based on input parameters. Entries live in the
+    # versioned namespace of the transaction type (see stats_cache.py), so an
+    # import invalidates them; the period bounds are part of the key because
+    # "1 month" etc. are relative to today.
+    period_bounds = _get_period_range(period_str if period_str else "1 month")
     cache_key_params = {
         "transaction_type": transaction_type,
         "search_substring": search_substring,
         "property_components": property_components if property_components else [],
         "period_str": period_str if period_str else "1 month",
+        "period_bounds": [d.isoformat() for d in period_bounds],
     }
-    cache_key = f"stats_aggregation_{hashlib.md5(json.dumps(cache_key_params, sort_keys=True).encode()).hexdigest()}"
+    cache_key = hashlib.md5(
+        json.dumps(cache_key_params, sort_keys=True).encode()
+    ).hexdigest()
 
     # Try to get the cached result
     if should_use_cache:
-        cached_result = cache.get(cache_key)
+        cached_result = stats_cache.cache_get(
+            "stats_aggregation", transaction_type, cache_key
+        )
         if cached_result:
             # If we need to save to the database but have a cached result, just create the DB entry
             if not return_dict:
@@ -226,55 +325,60 @@ def calc_and_save_search_log(
                 return log_obj
             return cached_result
 
-    # 1) Build the base queryset (without date filtering)
-    qs_all = _build_transactions_queryset(
-        transaction_type=transaction_type,
-        search_substring=search_substring,
-        property_components=property_components,
-        periods=None,
-    ).select_related("building__project")
+    # 1) Pick the source: the daily rollup (when enabled and built) or the raw transactions
+    if use_rollup is None:
+        use_rollup = getattr(settings, "STATS_USE_ROLLUP", False)
+    use_rollup = use_rollup and memoized(
+        ("rollup", transaction_type), lambda: rollup_is_ready(transaction_type)
+    )
+
+    def load_arrays(search, start, end, window=None, **filters):
+        """Loads start..end, or the whole shared window once when called with a context."""
+        if _context is not None:
+            start, end = window
+
+        def loader():
+            loaded = _load_period_arrays(
+                transaction_type,
+                search,
+                property_components,
+                start,
+                end,
+                use_rollup=use_rollup,
+                **filters,
+            )
+            if _context is not None:
+                # Register the whole window, so the first evaluate() of the
+                # shared engine loads the liquidity rows of every period at once
+                _context.liquidity_engine.add_month_buildings(
+                    loaded.month_buildings(loaded.period_mask(start, end))
+                )
+            return loaded
+
+        key = ("arrays", search, tuple((k, tuple(v)) for k, v in filters.items()))
+        return memoized(key, loader)
 
     # Determine period (default "1 month")
     if not period_str:
         period_str = "1 month"
 
     # 2) Get current period and previous period boundaries
-    start_current, end_current = _get_period_range(period_str)
+    start_current, end_current = period_bounds
     delta_current = end_current - start_current
     end_previous = start_current
     start_previous = end_previous - delta_current
 
-    # 3) Split the queryset into current and previous period lists
-    qs_current = qs_all.filter(
-        date_of_transaction__gte=start_current, date_of_transaction__lte=end_current
+    # 3) Load both periods with one query as NumPy arrays (only the columns the
+    # metrics need, see metrics.py / rollup.py) and split them with masks.
+    arrays = load_arrays(
+        search_substring,
+        start_previous,
+        end_current,
+        window=_context.window if _context else None,
     )
-    qs_previous = qs_all.filter(
-        date_of_transaction__gte=start_previous, date_of_transaction__lte=end_previous
-    )
-    current_list = list(qs_current)
-    prev_list = list(qs_previous)
-
-    # Helper functions:
-    def average_price(objs):
-        prices = [float(o.transaction_price or 0) for o in objs]
-        return sum(prices) / len(prices) if prices else 0.0
-
-    def median_price(objs):
-        prices = [float(o.transaction_price or 0) for o in objs]
-        return statistics.median(prices) if prices else 0.0
-
-    def avg_area(objs):
-        areas = [float(o.sqm or 0) for o in objs]
-        return sum(areas) / len(areas) if areas else 0.0
-
-    def price_range_span(objs):
-        prices = [float(o.transaction_price or 0) for o in objs]
-        if prices:
-            return min(prices), max(prices)
-        return (0.0, 0.0)
-
-    def sum_deals_volume(objs):
-        return sum(float(o.transaction_price or 0) for o in objs)
+    current_mask = arrays.period_mask(start_current, end_current)
+    prev_mask = arrays.period_mask(start_previous, end_previous)
+    curr, prev = arrays.metrics([current_mask, prev_mask])
 
     def percent_change(current, previous):
         if previous == 0 and current > 0:
@@ -289,29 +393,22 @@ def calc_and_save_search_log(
         return 100.0 * (value / reference_value)
 
     # 4) Compute metrics for the current period
-    curr_avg_price = average_price(current_list)
-    curr_count = len(current_list)
-    curr_median = median_price(current_list)
-    curr_avg_area = avg_area(current_list)
-    curr_avg_price_per_sqft = (
-        curr_avg_price / curr_avg_area if curr_avg_area > 0 else 0.0
-    )
-    curr_min_price, curr_max_price = price_range_span(current_list)
+    curr_avg_price = curr["avg_price"]
+    curr_count = curr["count"]
+    curr_median = curr["median_price"]
+    curr_avg_price_per_sqft = curr["avg_price_per_sqft"]
+    curr_min_price, curr_max_price = curr["min_price"], curr["max_price"]
     price_range_str = f"({curr_min_price}, {curr_max_price})"
     curr_price_range_span = curr_max_price - curr_min_price
-    curr_deals_volume = sum_deals_volume(current_list)
+    curr_deals_volume = curr["sum_price"]
 
     # 5) Compute metrics for the previous period
-    prev_avg_price = average_price(prev_list)
-    prev_count = len(prev_list)
-    prev_median = median_price(prev_list)
-    prev_avg_area = avg_area(prev_list)
-    prev_avg_price_per_sqft = (
-        prev_avg_price / prev_avg_area if prev_avg_area > 0 else 0.0
-    )
-    prev_min_price, prev_max_price = price_range_span(prev_list)
-    prev_price_range_span = prev_max_price - prev_min_price
-    prev_deals_volume = sum_deals_volume(prev_list)
+    prev_avg_price = prev["avg_price"]
+    prev_count = prev["count"]
+    prev_median = prev["median_price"]
+    prev_avg_price_per_sqft = prev["avg_price_per_sqft"]
+    prev_price_range_span = prev["max_price"] - prev["min_price"]
+    prev_deals_volume = prev["sum_price"]
 
     # Compute percentage differences
     averagePrice_dynamic = percent_change(curr_avg_price, prev_avg_price)
@@ -326,71 +423,26 @@ def calc_and_save_search_log(
     # Define count_change_percent as the same as deals_dynamic (percent change in transaction count)
     count_change_percent = deals_dynamic
 
-    # 6) Compute special liquidity for the current period.
-    #
-    # Логика:
-    #  - Собираем все (year, month) для транзакций из current_list
-    #  - Для каждого (year, month) находим УНИКАЛЬНЫЕ building_ids
-    #  - Для каждого building, если total_units>0, берём liquidity_parameter_one
-    #    и считаем ratio = liq / total_units
-    #  - Считаем среднее ratio по зданиям этого месяца => monthly_avg
-    #  - Собираем monthly_avg в список monthly_values
-    #  - liquidity_value = среднее(monthly_values) (если не пустой)
+    # 6) Special liquidity (see liquidity.py for the definition).
     #
-
-    def compute_liquidity_value_for_period(tx_list: List):
-        # 1) Группируем транзакции по (year, month)
-        month_buildings_map = defaultdict(set)
-        for tx in tx_list:
-            if tx.building_id and tx.date_of_transaction:
-                yy = tx.date_of_transaction.year
-                mm = tx.date_of_transaction.month
-                month_buildings_map[(yy, mm)].add(tx.building_id)
-
-        # 2) Для каждого (year, month), собираем ratio = liq_param / total_units
-        monthly_averages = []
-        for (yy, mm), bld_ids in month_buildings_map.items():
-            ratios = []
-            for b_id in bld_ids:
-                bld_liq = BuildingLiquidityParameterOne.objects.filter(
-                    building_id=b_id, year=yy, month=mm
-                ).first()
-                if not bld_liq:
-                    continue
-                liquidity_val = float(bld_liq.liquidity_parameter_one or 0)
-                # Посмотрим на total_units
-                building_obj = (
-                    Building.objects.filter(pk=b_id).select_related("project").first()
-                )
-                if not building_obj:
-                    continue
-                # Считаем реальный total_units
-                if building_obj.total_units and building_obj.total_units > 0:
-                    tu = building_obj.total_units
-                elif building_obj.project and building_obj.project.total_units:
-                    tu = building_obj.project.total_units
-                else:
-                    tu = 0
-
-                if tu > 0:  # только если >0
-                    ratio = liquidity_val / tu  # liq / total_units
-                    ratios.append(ratio)
-            if ratios:
-                monthly_avg = sum(ratios) / len(ratios)
-                monthly_averages.append(monthly_avg)
-
-        if monthly_averages:
-            return sum(monthly_averages) / len(monthly_averages)
-        else:
-            return 0.0
-
-    liquidity_value = compute_liquidity_value_for_period(current_list)
-    liquidity_value_prev = compute_liquidity_value_for_period(prev_list)
-    liquidity_dynamic = percent_change(liquidity_value, liquidity_value_prev)
+    # Every period that needs a liquidity value (current, previous and, if not
+    # cached, the reference ones) is registered on one LiquidityEngine first and
+    # evaluated with a single bulk load further below.
+    liquidity_engine = _context.liquidity_engine if _context else LiquidityEngine()
+    liq_current_idx = liquidity_engine.add_month_buildings(
+        arrays.month_buildings(current_mask)
+    )
+    liq_prev_idx = liquidity_engine.add_month_buildings(
+        arrays.month_buildings(prev_mask)
+    )
+    liq_all_dubai_idx = None
+    liq_area_idx = None
 
     # 7) Other aggregated fields:
     # Use the new helper function to compute total_buildings based on searchSubstring.
-    total_buildings_dict = compute_total_buildings(search_substring)
+    total_buildings_dict = memoized(
+        "total_buildings", lambda: compute_total_buildings(search_substring)
+    )
 
     total_buildings = total_buildings_dict["building_count"]
     total_units_sum = total_buildings_dict["units_sum"]
@@ -404,13 +456,15 @@ def calc_and_save_search_log(
     # This is the expensive part that benefits most from caching
 
     # Generate cache key for reference values
-    reference_cache_key = f"reference_values_{transaction_type}_{start_current.isoformat()}_{end_current.isoformat()}_"
+    reference_cache_key = f"{start_current.isoformat()}_{end_current.isoformat()}_"
     reference_cache_key += f"{hashlib.md5(json.dumps(property_components if property_components else [], sort_keys=True).encode()).hexdigest()}"
 
     # Try to get cached reference values
     cached_reference = None
     if should_use_cache:
-        cached_reference = cache.get(reference_cache_key)
+        cached_reference = stats_cache.cache_get(
+            "reference_values", transaction_type, reference_cache_key
+        )
 
     if cached_reference:
         # Use cached reference values
@@ -428,7 +482,9 @@ def calc_and_save_search_log(
             area_reference_cache_key = (
                 f"{reference_cache_key}_{hashlib.md5(search_str.encode()).hexdigest()}"
             )
-            area_cached_reference = cache.get(area_reference_cache_key)
+            area_cached_reference = stats_cache.cache_get(
+                "reference_values", transaction_type, area_reference_cache_key
+            )
 
             if area_cached_reference:
                 is_building_or_project_search = area_cached_reference[
@@ -448,74 +504,37 @@ def calc_and_save_search_log(
                     reference_liquidity = area_cached_reference["liquidity"]
     else:
         # Determine if the search is for a building/project or an area
-        is_building_or_project_search = False
-        reference_area_ids = []
-
-        if search_substring and search_substring.strip():
-            search_str = search_substring.strip()
-            # Check if it's a building search
-            building_qs = Building.objects.filter(english_name__icontains=search_str)
-            if building_qs.exists():
-                is_building_or_project_search = True
-                # Get the areas of the buildings
-                reference_area_ids = list(
-                    building_qs.values_list("area_id", flat=True).distinct()
-                )
-
-            # Check if it's a project search
-            if not is_building_or_project_search:
-                project_qs = Project.objects.filter(english_name__icontains=search_str)
-                if project_qs.exists():
-                    is_building_or_project_search = True
-                    # Get buildings associated with this project, then get their areas
-                    buildings_in_projects = Building.objects.filter(
-                        project__in=project_qs
-                    )
-                    reference_area_ids = list(
-                        buildings_in_projects.values_list(
-                            "area_id", flat=True
-                        ).distinct()
-                    )
+        is_building_or_project_search, reference_area_ids = memoized(
+            "reference_areas", lambda: _reference_areas(search_substring)
+        )
 
         # First, cache the all Dubai reference values which are most expensive to compute
-        all_dubai_reference_transactions_qs = (
-            _build_transactions_queryset(
-                transaction_type=transaction_type,
-                search_substring=None,
-                property_components=property_components,
-                periods=None,
-            )
-            .filter(
-                date_of_transaction__gte=start_current,
-                date_of_transaction__lte=end_current,
-            )
-            .select_related("building__project")
+        all_dubai_arrays = load_arrays(
+            None,
+            start_current,
+            end_current,
+            window=_context.reference_window if _context else None,
         )
-
-        all_dubai_reference_list = list(all_dubai_reference_transactions_qs)
+        all_dubai_mask = all_dubai_arrays.period_mask(start_current, end_current)
+        (all_dubai_reference,) = all_dubai_arrays.metrics([all_dubai_mask])
 
         # Calculate all Dubai reference metrics
-        all_dubai_reference_avg_price = average_price(all_dubai_reference_list)
-        all_dubai_reference_median = median_price(all_dubai_reference_list)
-        all_dubai_reference_avg_area = avg_area(all_dubai_reference_list)
-        all_dubai_reference_avg_price_per_sqft = (
-            all_dubai_reference_avg_price / all_dubai_reference_avg_area
-            if all_dubai_reference_avg_area > 0
-            else 0.0
-        )
-        all_dubai_reference_min_price, all_dubai_reference_max_price = price_range_span(
-            all_dubai_reference_list
-        )
+        all_dubai_reference_avg_price = all_dubai_reference["avg_price"]
+        all_dubai_reference_median = all_dubai_reference["median_price"]
+        all_dubai_reference_avg_price_per_sqft = all_dubai_reference[
+            "avg_price_per_sqft"
+        ]
         all_dubai_reference_price_range_span = (
-            all_dubai_reference_max_price - all_dubai_reference_min_price
+            all_dubai_reference["max_price"] - all_dubai_reference["min_price"]
         )
-        all_dubai_reference_count = len(all_dubai_reference_list)
-        all_dubai_reference_deals_volume = sum_deals_volume(all_dubai_reference_list)
-        all_dubai_reference_liquidity = compute_liquidity_value_for_period(
-            all_dubai_reference_list
+        all_dubai_reference_count = all_dubai_reference["count"]
+        all_dubai_reference_deals_volume = all_dubai_reference["sum_price"]
+        liq_all_dubai_idx = liquidity_engine.add_month_buildings(
+            all_dubai_arrays.month_buildings(all_dubai_mask)
         )
 
-        # Cache the all Dubai reference values
+        # All Dubai reference values; "liquidity" is filled in (and the dict is
+        # cached) once the liquidity engine has been evaluated.
         all_dubai_reference_data = {
             "avg_price": all_dubai_reference_avg_price,
             "median": all_dubai_reference_median,
@@ -523,55 +542,33 @@ def calc_and_save_search_log(
             "price_range_span": all_dubai_reference_price_range_span,
             "count": all_dubai_reference_count,
             "deals_volume": all_dubai_reference_deals_volume,
-            "liquidity": all_dubai_reference_liquidity,
         }
-
-        # Always cache Dubai reference values regardless of search substring
-        # as these are expensive to compute and used by all queries
-        if use_cache:
-            cache.set(
-                reference_cache_key, all_dubai_reference_data, 60 * 60 * 24
-            )  # Cache for 1 day
+        area_reference_data = None
 
         # If this is a building/project search, calculate area-specific reference values
         if is_building_or_project_search and reference_area_ids:
             # For building/project, reference is the area
-            area_reference_transactions_qs = (
-                _build_transactions_queryset(
-                    transaction_type=transaction_type,
-                    search_substring=None,
-                    property_components=property_components,
-                    periods=None,
-                )
-                .filter(
-                    area_id__in=reference_area_ids,
-                    date_of_transaction__gte=start_current,
-                    date_of_transaction__lte=end_current,
-                )
-                .select_related("building__project")
+            area_arrays = load_arrays(
+                None,
+                start_current,
+                end_current,
+                window=_context.reference_window if _context else None,
+                area_id__in=reference_area_ids,
             )
-
-            area_reference_list = list(area_reference_transactions_qs)
+            area_mask = area_arrays.period_mask(start_current, end_current)
+            (area_reference,) = area_arrays.metrics([area_mask])
 
             # Calculate area reference metrics
-            area_reference_avg_price = average_price(area_reference_list)
-            area_reference_median = median_price(area_reference_list)
-            area_reference_avg_area = avg_area(area_reference_list)
-            area_reference_avg_price_per_sqft = (
-                area_reference_avg_price / area_reference_avg_area
-                if area_reference_avg_area > 0
-                else 0.0
-            )
-            area_reference_min_price, area_reference_max_price = price_range_span(
-                area_reference_list
-            )
+            area_reference_avg_price = area_reference["avg_price"]
+            area_reference_median = area_reference["median_price"]
+            area_reference_avg_price_per_sqft = area_reference["avg_price_per_sqft"]
             area_reference_price_range_span = (
-                area_reference_max_price - area_reference_min_price
+                area_reference["max_price"] - area_reference["min_price"]
             )
-            area_reference_count = len(area_reference_list)
-            area_reference_deals_volume = sum_deals_volume(area_reference_list)
-            area_reference_liquidity = compute_liquidity_value_for_period(
-                area_reference_list
+            area_reference_count = area_reference["count"]
+            area_reference_deals_volume = area_reference["sum_price"]
+            liq_area_idx = liquidity_engine.add_month_buildings(
+                area_arrays.month_buildings(area_mask)
             )
 
             # Use area references for versus calculations
@@ -581,26 +578,16 @@ def calc_and_save_search_log(
             reference_price_range_span = area_reference_price_range_span
             reference_count = area_reference_count
             reference_deals_volume = area_reference_deals_volume
-            reference_liquidity = area_reference_liquidity
-
-            # Cache area-specific reference values
-            # These are associated with specific areas, so we always cache them
-            if use_cache and search_substring and search_substring.strip():
-                search_str = search_substring.strip()
-                area_reference_cache_key = f"{reference_cache_key}_{hashlib.md5(search_str.encode()).hexdigest()}"
-                area_reference_data = {
-                    "is_building_or_project_search": True,
-                    "avg_price": area_reference_avg_price,
-                    "median": area_reference_median,
-                    "avg_price_per_sqft": area_reference_avg_price_per_sqft,
-                    "price_range_span": area_reference_price_range_span,
-                    "count": area_reference_count,
-                    "deals_volume": area_reference_deals_volume,
-                    "liquidity": area_reference_liquidity,
-                }
-                cache.set(
-                    area_reference_cache_key, area_reference_data, 60 * 60 * 24
-                )  # Cache for 1 day
+
+            area_reference_data = {
+                "is_building_or_project_search": True,
+                "avg_price": area_reference_avg_price,
+                "median": area_reference_median,
+                "avg_price_per_sqft": area_reference_avg_price_per_sqft,
+                "price_range_span": area_reference_price_range_span,
+                "count": area_reference_count,
+                "deals_volume": area_reference_deals_volume,
+            }
         else:
             # For area/general search, use all Dubai references
             reference_avg_price = all_dubai_reference_avg_price
@@ -609,7 +596,44 @@ def calc_and_save_search_log(
             reference_price_range_span = all_dubai_reference_price_range_span
             reference_count = all_dubai_reference_count
             reference_deals_volume = all_dubai_reference_deals_volume
-            reference_liquidity = all_dubai_reference_liquidity
+
+    # Evaluate liquidity for all registered periods with one bulk load
+    liquidity_values = liquidity_engine.evaluate()
+    liquidity_value = liquidity_values[liq_current_idx]
+    liquidity_value_prev = liquidity_values[liq_prev_idx]
+    liquidity_dynamic = percent_change(liquidity_value, liquidity_value_prev)
+
+    if liq_all_dubai_idx is not None:
+        all_dubai_reference_data["liquidity"] = liquidity_values[liq_all_dubai_idx]
+        reference_liquidity = all_dubai_reference_data["liquidity"]
+
+        # Always cache Dubai reference values regardless of search substring
+        # as these are expensive to compute and used by all queries
+        if use_cache:
+            stats_cache.cache_set(
+                "reference_values",
+                transaction_type,
+                reference_cache_key,
+                all_dubai_reference_data,
+            )
+
+    if liq_area_idx is not None:
+        area_reference_data["liquidity"] = liquidity_values[liq_area_idx]
+        reference_liquidity = area_reference_data["liquidity"]
+
+        # Cache area-specific reference values
+        # These are associated with specific areas, so we always cache them
+        if use_cache and search_substring and search_substring.strip():
+            search_str = search_substring.strip()
+            area_reference_cache_key = (
+                f"{reference_cache_key}_{hashlib.md5(search_str.encode()).hexdigest()}"
+            )
+            stats_cache.cache_set(
+                "reference_values",
+                transaction_type,
+                area_reference_cache_key,
+                area_reference_data,
+            )
 
     # Calculate versus metrics
     averagePrice_versus = calculate_versus(curr_avg_price, reference_avg_price)
@@ -655,7 +679,9 @@ def calc_and_save_search_log(
 
     # Cache the final result only if it matches a valid entity
     if should_use_cache:
-        cache.set(cache_key, result_dict, 60 * 60 * 24)  # Cache for 1 day
+        stats_cache.cache_set(
+            "stats_aggregation", transaction_type, cache_key, result_dict
+        )
 
     # 9) If return_dict is True, return the dictionary; otherwise, save and return the SearchTransactionsLog instance.
     if return_dict:
@@ -678,3 +704,49 @@ def calc_and_save_search_log(
             special_liquidity_calc=liquidity_value,
         )
         return log_obj
+
+
+# Periods of the dashboard and of the cache warmer
+SEARCH_PERIODS = ("1 month", "3 months", "6 months", "1 year", "2 years")
+
+
+def calc_search_logs_for_periods(
+    transaction_type: str,
+    search_substring: str | None,
+    property_components: list[str] | None,
+    periods: Sequence[str] = SEARCH_PERIODS,
+    return_dict: bool = True,
+    use_cache: bool = True,
+    use_rollup: bool | None = None,
+) -> dict[str, SearchTransactionsLog | dict]:
+    """
+    calc_and_save_search_log for several periods of the same search at once.
+
+    The widest window (for the default periods 4 years: "2 years" plus its
+    previous period) is fetched once and every period's current/previous
+    metrics are derived from masks over the same arrays (see SearchContext),
+    so the database is queried a few times per search instead of per period.
+
+    Returns {period_str: result of calc_and_save_search_log}.
+    """
+    bounds = [_get_period_range(period) for period in periods]
+    if not bounds:
+        return {}
+    window_end = max(end for _, end in bounds)
+    context = SearchContext(
+        window=(min(start - (end - start) for start, end in bounds), window_end),
+        reference_window=(min(start for start, _ in bounds), window_end),
+    )
+    return {
+        period: calc_and_save_search_log(
+            transaction_type=transaction_type,
+            search_substring=search_substring,
+            property_components=property_components,
+            period_str=period,
+            return_dict=return_dict,
+            use_cache=use_cache,
+            use_rollup=use_rollup,
+            _context=context,
+        )
+        for period in periods
+    }
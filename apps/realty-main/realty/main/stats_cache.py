@@ -0,0 +1,151 @@
+"""
+Versioned cache namespace for the search statistics.
+
+Every transaction type ("sales" / "rental") has a data generation counter.
+Cache keys embed the current generation, so entries stay warm until their
+data changes; a successful import calls ``bump_generation`` which moves
+readers to a new generation and evicts the previous one in bulk, without
+any per-generation key list:
+  - diskcache.DjangoCache (settings.USE_DISKCACHE): entries are tagged with
+    their generation and dropped with ``cache.evict(tag)``;
+  - django-redis: ``cache.delete_pattern`` on the ``g<generation>`` keys;
+  - other backends (LocMem, Dummy): old entries are never read again and
+    expire after TIMEOUT.
+
+Lookups are counted in ``STATS_CACHE_REQUESTS_TOTAL`` (realty/api/middleware.py):
+  - hit:   the entry of the current generation exists;
+  - stale: only an entry of an older generation was ever stored;
+  - miss:  nothing stored for this key yet.
+"""
+
+import logging
+import time
+from typing import Any
+
+from django.core.cache import cache
+from realty.api.middleware import STATS_CACHE_EVICTIONS_TOTAL
+from realty.api.middleware import STATS_CACHE_GENERATION_BUMPS_TOTAL
+from realty.api.middleware import STATS_CACHE_REQUESTS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Поколение живёт без срока. Записи инвалидирует смена поколения, а срок
+# убирает ключи прошлых периодов ("1 month" считается от сегодняшней даты),
+# если импортов давно не было, и прошлых поколений без массового удаления.
+GENERATION_TIMEOUT = None
+TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _normalize_type(transaction_type: str) -> str:
+    # calc_and_save_search_log считает всё, кроме "rental", продажами
+    return "rental" if transaction_type == "rental" else "sales"
+
+
+def _generation_key(transaction_type: str) -> str:
+    return f"stats_generation:{transaction_type}"
+
+
+def _generation_tag(transaction_type: str, generation: int) -> str:
+    return f"stats:{transaction_type}:g{generation}"
+
+
+def _seen_key(namespace: str, transaction_type: str, suffix: str) -> str:
+    return f"stats_seen:{namespace}:{transaction_type}:{suffix}"
+
+
+def get_generation(transaction_type: str) -> int:
+    """
+    Current data generation of a transaction type.
+
+    Starts from a millisecond timestamp, so a counter lost by the cache backend
+    never restarts at a generation whose entries may still be stored.
+    """
+    transaction_type = _normalize_type(transaction_type)
+    key = _generation_key(transaction_type)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), GENERATION_TIMEOUT)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def versioned_key(namespace: str, transaction_type: str, suffix: str) -> str:
+    transaction_type = _normalize_type(transaction_type)
+    generation = get_generation(transaction_type)
+    return f"{namespace}:{transaction_type}:g{generation}:{suffix}"
+
+
+def cache_get(namespace: str, transaction_type: str, suffix: str) -> Any | None:
+    """Reads an entry of the current generation and counts hit/miss/stale."""
+    transaction_type = _normalize_type(transaction_type)
+    value = cache.get(versioned_key(namespace, transaction_type, suffix))
+    if value is not None:
+        result = "hit"
+    else:
+        stored_generation = cache.get(_seen_key(namespace, transaction_type, suffix))
+        if stored_generation is not None and stored_generation != get_generation(
+            transaction_type
+        ):
+            result = "stale"
+        else:
+            result = "miss"
+    STATS_CACHE_REQUESTS_TOTAL.labels(
+        namespace=namespace, transaction_type=transaction_type, result=result
+    ).inc()
+    return value
+
+
+def cache_set(namespace: str, transaction_type: str, suffix: str, value: Any) -> None:
+    """Stores an entry in the current generation (two independent cache writes)."""
+    transaction_type = _normalize_type(transaction_type)
+    generation = get_generation(transaction_type)
+    key = f"{namespace}:{transaction_type}:g{generation}:{suffix}"
+    if hasattr(cache, "evict"):  # diskcache.DjangoCache
+        cache.set(
+            key, value, TIMEOUT, tag=_generation_tag(transaction_type, generation)
+        )
+    else:
+        cache.set(key, value, TIMEOUT)
+    cache.set(_seen_key(namespace, transaction_type, suffix), generation, TIMEOUT)
+
+
+def evict_generation(transaction_type: str, generation: int) -> int | None:
+    """
+    Deletes the entries of one generation in bulk (see the module docstring).
+    Returns the number of entries removed, None when the backend cannot do it.
+    """
+    if hasattr(cache, "evict"):  # diskcache.DjangoCache
+        return cache.evict(_generation_tag(transaction_type, generation))
+    if hasattr(cache, "delete_pattern"):  # django-redis
+        return cache.delete_pattern(f"*:{transaction_type}:g{generation}:*")
+    return None
+
+
+def bump_generation(transaction_type: str) -> int:
+    """
+    Starts a new data generation (call after a successful import) and evicts
+    the entries of the previous one. Returns the new generation.
+    """
+    transaction_type = _normalize_type(transaction_type)
+    previous = get_generation(transaction_type)
+    try:
+        generation = cache.incr(_generation_key(transaction_type))
+    except ValueError:
+        # Ключ успели вытеснить между get и incr
+        generation = previous + 1
+        cache.set(_generation_key(transaction_type), generation, GENERATION_TIMEOUT)
+
+    evicted = evict_generation(transaction_type, previous)
+    STATS_CACHE_GENERATION_BUMPS_TOTAL.labels(transaction_type=transaction_type).inc()
+    if evicted:
+        STATS_CACHE_EVICTIONS_TOTAL.labels(transaction_type=transaction_type).inc(
+            evicted
+        )
+    logger.info(
+        "Stats cache %s: generation %s -> %s, evicted %s",
+        transaction_type,
+        previous,
+        generation,
+        "nothing (entries expire)" if evicted is None else f"{evicted} entries",
+    )
+    return generation
@@ -4,111 +4,49 @@ from datetime import timedelta
 from django.utils import timezone
 from django_tasks import task
 
-from .models import Area
-from .models import Building
-from .models import Project
-from .stats import calc_and_save_search_log
+from .models import StatsWarmState
+from .warming import plan_warm_items
+from .warming import warm_item
 
 logger = logging.getLogger(__name__)
 
+# Сколько элементов (сущность × тип сделки, все периоды) в одной задаче воркера
+WARM_BATCH_SIZE = 25
+
+
+def enqueue_warm_batches(planned) -> int:
+    """
+    Fans planned [(item, signature)] out over the workers in batches of
+    WARM_BATCH_SIZE (warm_stats_cache_batch). Returns the number of batches.
+    """
+    batches = [
+        planned[i : i + WARM_BATCH_SIZE]
+        for i in range(0, len(planned), WARM_BATCH_SIZE)
+    ]
+    for number, batch in enumerate(batches):
+        # Популярные сущности — в первых пачках и с более высоким приоритетом
+        warm_stats_cache_batch.using(priority=max(-100, 50 - number)).enqueue(
+            [[*item, signature] for item, signature in batch]
+        )
+    logger.info("Enqueued %s warm items in %s batches", len(planned), len(batches))
+    return len(batches)
+
 
 @task(priority=-72)
-def compute_aggregation_for_caching():
+def compute_aggregation_for_caching(force: bool = False):
     """
     Task to pre-compute and cache aggregations for all buildings, projects, and areas.
     This helps keep the cache warm and improves performance for users.
 
-    Runs every day at midnight and computes aggregations for:
-    1. All Dubai (no search substring)
-    2. Each area by name
-    3. Each building by name
-    4. Each project by name
-
-    The task calculates aggregations for both sales and rental transaction types,
-    and for different property components where relevant.
+    Runs every day at midnight. Plans the (entity, transaction type) items that
+    changed since their last warm (see realty/main/warming.py), most searched
+    entities first, and fans them out in batches over the django-tasks workers
+    (warm_stats_cache_batch). Already warmed items are skipped, so re-running
+    the task after a crash resumes where the previous run stopped.
     """
     logger.info("Starting compute_aggregation_for_caching task")
-    transaction_types = ["sales", "rental"]
-    periods = [
-        "1 month",
-        "3 months",
-        "6 months",
-        "1 year",
-        "2 years",
-    ]
-
     try:
-        # Calculate aggregations for all Dubai (base reference values)
-        for transaction_type in transaction_types:
-            for period in periods:
-                logger.info(
-                    f"Computing aggregation for all Dubai: {transaction_type}, {period}"
-                )
-                calc_and_save_search_log(
-                    transaction_type=transaction_type,
-                    search_substring=None,
-                    property_components=None,
-                    period_str=period,
-                    return_dict=True,  # We don't need to save to DB
-                    use_cache=True,
-                )
-
-        # Calculate aggregations for each area
-        areas = Area.objects.filter(name_en__isnull=False).exclude(name_en="")
-        for area in areas:
-            for transaction_type in transaction_types:
-                for period in periods:
-                    logger.info(
-                        f"Computing aggregation for area {area.name_en}: {transaction_type}, {period}"
-                    )
-                    calc_and_save_search_log(
-                        transaction_type=transaction_type,
-                        search_substring=area.name_en,
-                        property_components=None,
-                        period_str=period,
-                        return_dict=True,
-                        use_cache=True,
-                    )
-
-        # Calculate aggregations for each building
-        buildings = Building.objects.filter(english_name__isnull=False).exclude(
-            english_name=""
-        )
-        for building in buildings:
-            for transaction_type in transaction_types:
-                for period in periods:
-                    logger.info(
-                        f"Computing aggregation for building {building.english_name}: {transaction_type}, {period}"
-                    )
-                    calc_and_save_search_log(
-                        transaction_type=transaction_type,
-                        search_substring=building.english_name,
-                        property_components=None,
-                        period_str=period,
-                        return_dict=True,
-                        use_cache=True,
-                    )
-
-        # Calculate aggregations for each project
-        projects = Project.objects.filter(english_name__isnull=False).exclude(
-            english_name=""
-        )
-        for project in projects:
-            for transaction_type in transaction_types:
-                for period in periods:
-                    logger.info(
-                        f"Computing aggregation for project {project.english_name}: {transaction_type}, {period}"
-                    )
-                    calc_and_save_search_log(
-                        transaction_type=transaction_type,
-                        search_substring=project.english_name,
-                        property_components=None,
-                        period_str=period,
-                        return_dict=True,
-                        use_cache=True,
-                    )
-
-        logger.info("Completed compute_aggregation_for_caching task")
+        enqueue_warm_batches(plan_warm_items(force=force))
     except Exception as e:
         logger.error(f"Error in compute_aggregation_for_caching task: {e}")
 
@@ -117,3 +55,24 @@ def compute_aggregation_for_caching():
         hour=0, minute=0, second=0, microsecond=0
     ) + timedelta(days=1)
     compute_aggregation_for_caching.using(run_after=next_run).enqueue()
+
+
+@task()
+def warm_stats_cache_batch(items: list):
+    """
+    Warms one batch of [transaction_type, entity_kind, entity_name, signature] items.
+    A failing item is recorded and skipped, the rest of the batch goes on.
+    """
+    # Пачка могла быть поставлена дважды (повторный запуск планировщика)
+    done = set(
+        StatsWarmState.objects.filter(
+            signature__in=[item[3] for item in items]
+        ).values_list("transaction_type", "entity_kind", "entity_name", "signature")
+    )
+    failed = 0
+    for transaction_type, kind, name, signature in items:
+        if (transaction_type, kind, name, signature) in done:
+            continue
+        if not warm_item((transaction_type, kind, name), signature):
+            failed += 1
+    logger.info("Warmed %s items (%s failed)", len(items) - failed, failed)
@@ -1,5 +1,7 @@
 from django.urls import path
 from django.views.decorators.cache import cache_page
+from django.views.decorators.csrf import csrf_exempt
+from strawberry.django.views import AsyncGraphQLView
 from realty.pfimport.views import pf_listings_rent_view
 from realty.pfimport.views import pf_listings_sale_view
 
@@ -13,6 +15,7 @@ from realty.pfimport.creative_views import (
     pf_listings_sale_view as creative_pf_listings_sale_view_2,
 )
 from . import views
+from .schema import schema
 
 urlpatterns = [
     path("", views.rental_transactions_list, name="rental_transactions_list"),
@@ -22,6 +25,11 @@ urlpatterns = [
     #   path('stats/', views.rental_transactions_stats, name='rental_transactions_stats'),#rental_transactions_stats_another
     # path('transactions/<int:pk>/', views.rental_transaction_detail, name='rental_transaction_detail'),
     # path('details/<str:metric>/', views.rental_transaction_metric_detail, name='rental_transaction_metric_detail'),
+    path(
+        "graphql/",
+        csrf_exempt(AsyncGraphQLView.as_view(schema=schema)),
+        name="graphql",
+    ),
     path(
         "pf-listings/sale/",
         cache_page(3600)(pf_listings_sale_view),
@@ -1,17 +1,13 @@
 # utils.py
+from datetime import date
 from datetime import datetime
 from enum import Enum
-from typing import List
-from typing import Optional
-from typing import Union
 
 import strawberry
 from dateutil.relativedelta import relativedelta
-from realty.main.models import Area
-from realty.main.models import Building
+from realty.main.entity_index import get_entity_index
 from realty.main.models import MergedRentalTransaction
 from realty.main.models import MergedTransaction
-from realty.main.models import Project
 
 
 valid_periods = {
@@ -22,8 +18,28 @@ valid_periods = {
     "6 months": relativedelta(months=6),
     "1 year": relativedelta(years=1),
     "2 years": relativedelta(years=2),
+    "10 years": relativedelta(years=10),
 }
 
+# Старые написания меток (ссылки со старым списком периодов, метки импорта)
+PERIOD_ALIASES = {
+    "3 month": "3 months",
+    "6 month": "6 months",
+    "2 year": "2 years",
+}
+
+# Возрастные «корзины» сделки: (макс. возраст в днях, метка). Раньше метка
+# считалась при импорте и хранилась в MergedRentalTransaction.period.
+AGE_PERIODS = [
+    (7, "1 week"),
+    (30, "1 month"),
+    (90, "3 month"),
+    (180, "6 month"),
+    (365, "1 year"),
+    (730, "2 years"),
+]
+OLDEST_AGE_PERIOD = "older than 2 years"
+
 
 @strawberry.enum
 class Period(Enum):
@@ -35,8 +51,13 @@ class Period(Enum):
     YEAR2 = strawberry.enum_value("2 years")
 
 
-def _get_period_range(period: str):
-    now = datetime.now().date()
+def _get_period_range(period: str, today: date | None = None):
+    """
+    Метка периода → (start, end) по date_of_transaction, считая от `today`.
+    Диапазоны вложены: "6 months" включает сделки "3 months", "1 month" и т.д.
+    """
+    now = today or datetime.now().date()
+    period = PERIOD_ALIASES.get(period, period)
     if period == "YTD":
         start = datetime(now.year, 1, 1).date()
         return start, now
@@ -49,9 +70,20 @@ def _get_period_range(period: str):
     return start, end
 
 
+def age_period(date_of_transaction: date | None, today: date | None = None):
+    """Метка возраста сделки ("1 week", ..., "older than 2 years") на `today`."""
+    if not date_of_transaction:
+        return None
+    diff_days = ((today or datetime.now().date()) - date_of_transaction).days
+    for max_days, label in AGE_PERIODS:
+        if diff_days <= max_days:
+            return label
+    return OLDEST_AGE_PERIOD
+
+
 # Обёртка, имитирующая поведение QuerySet (для offset pagination)
 class FakeQuerySet:
-    def __init__(self, data: List, model=None):
+    def __init__(self, data: list, model=None):
         self._data = data
         self.model = model
 
@@ -88,12 +120,66 @@ class FakeQuerySet:
         return self
 
 
+def _resolve_search_filter(search_substring: str | None) -> dict | None:
+    """
+    Переводит строку поиска в фильтр по сделкам (Area → Building → Project):
+      - {} — подстрока пустая, фильтровать не нужно;
+      - {"building__area_id": id} / {"building_id": id} / {"building__project_id": id};
+      - None — подстрока задана, но ничего не нашлось.
+    Сущность ищется в памяти (entity_index), без LIKE-запросов к справочникам.
+    Фильтр подходит и для MergedTransaction / MergedRentalTransaction,
+    и для TransactionDailyRollup.
+    """
+    if not (search_substring and search_substring.strip()):
+        return {}
+    resolved = get_entity_index().resolve(search_substring)
+    if resolved is None:
+        return None
+    kind, pk = resolved
+    return {
+        "area": {"building__area_id": pk},
+        "building": {"building_id": pk},
+        "project": {"building__project_id": pk},
+    }[kind]
+
+
+def _filter_transactions_queryset(
+    transaction_type: str,
+    search_substring: str | None,
+    property_components: list[str] | None,
+    periods: str | None,
+):
+    """
+    Возвращает «настоящий» QuerySet с фильтрами поиска:
+    MergedRentalTransaction для transaction_type == "rental",
+    иначе MergedTransaction(transaction_type="sales").
+
+    Подстрока ищется по очереди в Area → Building → Project;
+    если ничего не нашлось, возвращается пустой QuerySet.
+    Используется там, где нужны values()/aggregate() (см. metrics.py).
+    """
+    if transaction_type == "rental":
+        qs = MergedRentalTransaction.objects.all()
+    else:
+        qs = MergedTransaction.objects.filter(transaction_type="sales")
+    search_filter = _resolve_search_filter(search_substring)
+    if search_filter is None:
+        return qs.none()
+    qs = qs.filter(**search_filter)
+    if property_components and len(property_components) > 0:
+        qs = qs.filter(number_of_rooms__in=property_components)
+    if periods:
+        start_date, end_date = _get_period_range(periods)
+        qs = qs.filter(date_of_transaction__range=(start_date, end_date))
+    return qs
+
+
 def _build_transactions_queryset(
     transaction_type: str,
-    search_substring: Optional[str],
-    property_components: Optional[List[str]],
-    periods: Optional[str],
-) -> Union[List[MergedTransaction], FakeQuerySet]:
+    search_substring: str | None,
+    property_components: list[str] | None,
+    periods: str | None,
+) -> list[MergedTransaction] | FakeQuerySet:
     """
     Если transaction_type == "rental", берём объекты MergedRentalTransaction,
     фильтруем их и для каждого создаём «фейковый» объект MergedTransaction,
@@ -102,70 +188,27 @@ def _build_transactions_queryset(
 
     Иначе (sales) – возвращаем обычный QuerySet MergedTransaction.
     """
-    if transaction_type == "rental":
-        qs_r = MergedRentalTransaction.objects.all()
-        if search_substring and search_substring.strip():
-            area = Area.objects.filter(name_en__icontains=search_substring).first()
-            if area:
-                qs_r = qs_r.filter(building__area=area)
-            else:
-                building = Building.objects.filter(
-                    english_name__icontains=search_substring
-                ).first()
-                if building:
-                    qs_r = qs_r.filter(building=building)
-                else:
-                    project = Project.objects.filter(
-                        english_name__icontains=search_substring
-                    ).first()
-                    if project:
-                        qs_r = qs_r.filter(building__project=project)
-                    else:
-                        return FakeQuerySet([], model=MergedTransaction)
-        if property_components and len(property_components) > 0:
-            qs_r = qs_r.filter(number_of_rooms__in=property_components)
-        if periods:
-            start_date, end_date = _get_period_range(periods)
-            qs_r = qs_r.filter(date_of_transaction__range=(start_date, end_date))
-        fake_list = []
-        for rent_obj in qs_r:
-            fake_obj = MergedTransaction(
-                transaction_type="rental",
-                building=rent_obj.building,
-                date_of_transaction=rent_obj.date_of_transaction,
-                building_name=rent_obj.building_name,
-                location_name=rent_obj.location_name,
-                number_of_rooms=rent_obj.number_of_rooms,
-                sqm=rent_obj.sqm,
-                period=rent_obj.period,
-                meter_sale_price=rent_obj.meter_sale_price,
-            )
-            fake_obj._rental_data = rent_obj
-            fake_list.append(fake_obj)
-        return FakeQuerySet(fake_list, model=MergedTransaction)
-    else:
-        qs = MergedTransaction.objects.filter(transaction_type="sales")
-        if search_substring and search_substring.strip():
-            area = Area.objects.filter(name_en__icontains=search_substring).first()
-            if area:
-                qs = qs.filter(building__area=area)
-            else:
-                building = Building.objects.filter(
-                    english_name__icontains=search_substring
-                ).first()
-                if building:
-                    qs = qs.filter(building=building)
-                else:
-                    project = Project.objects.filter(
-                        english_name__icontains=search_substring
-                    ).first()
-                    if project:
-                        qs = qs.filter(building__project=project)
-                    else:
-                        return qs.none()
-        if property_components and len(property_components) > 0:
-            qs = qs.filter(number_of_rooms__in=property_components)
-        if periods:
-            start_date, end_date = _get_period_range(periods)
-            qs = qs.filter(date_of_transaction__range=(start_date, end_date))
+    qs = _filter_transactions_queryset(
+        transaction_type=transaction_type,
+        search_substring=search_substring,
+        property_components=property_components,
+        periods=periods,
+    )
+    if transaction_type != "rental":
         return qs
+
+    fake_list = []
+    for rent_obj in qs:
+        fake_obj = MergedTransaction(
+            transaction_type="rental",
+            building=rent_obj.building,
+            date_of_transaction=rent_obj.date_of_transaction,
+            building_name=rent_obj.building_name,
+            location_name=rent_obj.location_name,
+            number_of_rooms=rent_obj.number_of_rooms,
+            sqm=rent_obj.sqm,
+            meter_sale_price=rent_obj.meter_sale_price,
+        )
+        fake_obj._rental_data = rent_obj
+        fake_list.append(fake_obj)
+    return FakeQuerySet(fake_list, model=MergedTransaction)
@@ -10,11 +10,14 @@ from django.http import JsonResponse
 from django.shortcuts import render
 from django.db import models
 
+from .entity_index import get_entity_index
 from .models import Area
 from .models import Building
 from .models import MergedRentalTransaction
 from .models import MergedTransaction
 from .models import Project
+from .quantiles import quantiles
+from .utils import _get_period_range
 
 
 def rental_transactions_list(request):
@@ -34,20 +37,15 @@ def rental_transactions_list(request):
         "area", "building", "project", "project__developer"
     ).all()
 
-    # Логика расширения period, включая "10 years"
-    period_includes = {
-        "1 week": ["1 week"],
-        "1 month": ["1 month"],
-        "3 months": ["3 months", "1 month"],
-        "6 months": ["6 months", "3 months", "1 month"],
-        "1 year": ["1 year", "6 months", "3 months", "1 month"],
-        "2 year": ["2 year", "1 year", "6 months", "3 months", "1 month"],
-        "YTD": ["YTD", "1 year", "6 months", "3 months", "1 month"],
-        "10 years": ["10 years", "2 year", "1 year", "6 months", "3 months", "1 month"],
-    }
+    # Период — диапазон date_of_transaction, считая от сегодняшней даты
+    period_range = None
     if search_period:
-        periods_to_include = period_includes.get(search_period, [search_period])
-        transactions = transactions.filter(period__in=periods_to_include)
+        try:
+            period_range = _get_period_range(search_period)
+        except ValueError:
+            transactions = transactions.none()
+    if period_range:
+        transactions = transactions.filter(date_of_transaction__range=period_range)
 
     # Фильтрация по количеству комнат
     if search_rooms:
@@ -241,19 +239,9 @@ def rental_transactions_list(request):
         avg_meter=Avg("meter_sale_price"),
     )
     
-    # Убираем проблемный расчет медианы - он загружает все данные в память
-    # prices = list(
-    #     transactions.order_by("annual_amount").values_list("annual_amount", flat=True)
-    # )
-    # if prices:
-    #     n = len(prices)
-    #     if n % 2 == 1:
-    #         median_price = prices[n // 2]
-    #     else:
-    #         median_price = (prices[n // 2 - 1] + prices[n // 2]) / 2
-    # else:
-    #     median_price = None
-    median_price = None  # Временно отключаем для оптимизации
+    # Медиана и перцентили — в БД (percentile_cont) или потоковым скетчем
+    price_quantiles = quantiles(transactions, "annual_amount")
+    median_price = price_quantiles[0.5]
 
     deals_count_global = aggs["count_deals"] or 0
 
@@ -366,10 +354,9 @@ def rental_transactions_list(request):
                     # никаких шагов не выполнено — pass
                     pass
 
-    # Фильтр по period (тот же periods_to_include)
-    if search_period:
-        sales_periods = period_includes.get(search_period, [search_period])
-        sales_qs = sales_qs.filter(period__in=sales_periods)
+    # Фильтр по периоду (тот же диапазон дат)
+    if period_range:
+        sales_qs = sales_qs.filter(date_of_transaction__range=period_range)
 
     avg_sales_price = sales_qs.aggregate(avg_sp=Avg("transaction_price"))["avg_sp"] or 0
     roi_value = None
@@ -384,7 +371,7 @@ def rental_transactions_list(request):
         "3 months",
         "6 months",
         "1 year",
-        "2 year",
+        "2 years",
         "YTD",
         "10 years",
     ]
@@ -401,6 +388,9 @@ def rental_transactions_list(request):
         "aggregates": {
             "avg_price": aggs["avg_price"],
             "median_price": median_price,
+            "p25_price": price_quantiles[0.25],
+            "p75_price": price_quantiles[0.75],
+            "p90_price": price_quantiles[0.9],
             "avg_sqm": aggs["avg_sqm"],
             "count_deals": deals_count_global,
             "total_deal_volume": aggs["total_deal_volume"],
@@ -427,14 +417,6 @@ def autocomplete_suggestions(request):
     query = request.GET.get("q", "").strip()
     suggestions = {"areas": [], "buildings": [], "projects": []}
     if query:
-        areas = Area.objects.filter(name_en__icontains=query)[:5]
-        suggestions["areas"] = [{"id": a.id, "name": a.name_en} for a in areas]
-        buildings = Building.objects.filter(english_name__icontains=query)[:5]
-        suggestions["buildings"] = [
-            {"id": b.id, "name": b.english_name} for b in buildings
-        ]
-        projects = Project.objects.filter(english_name__icontains=query)[:5]
-        suggestions["projects"] = [
-            {"id": p.id, "name": p.english_name} for p in projects
-        ]
+        # Поиск по именам в памяти процесса (см. entity_index.py)
+        suggestions = get_entity_index().suggest(query, limit=5)
     return JsonResponse(suggestions)
@@ -0,0 +1,221 @@
+"""
+Incremental warming of the search statistics cache.
+
+The work is a list of items ``(transaction_type, entity_kind, entity_name)``;
+each item warms every period of WARM_PERIODS for one entity (All Dubai, an
+area, a building or a project).
+
+  - plan_warm_items: builds the list, most searched entities first (by
+    SearchTransactionsLog of the last POPULARITY_DAYS), and drops items whose
+    signature did not change since their last warm (StatsWarmState);
+  - warm_item: computes and caches one item and checkpoints it; an exception
+    is recorded on the item and does not stop the others.
+
+The signature of an item is its transaction count and last update, the stats
+cache generation (see stats_cache.py) and the date: periods are relative to
+today, so cached windows roll over daily. Entities without transactions of
+the type are not warmed at all.
+
+The tasks in tasks.py fan the items out in batches over the django-tasks
+workers.
+"""
+
+import hashlib
+import logging
+import time
+from collections import Counter
+from collections.abc import Iterable
+from datetime import timedelta
+
+from django.db.models import Count
+from django.db.models import Max
+from django.utils import timezone
+
+from . import stats_cache
+from .models import Area
+from .models import Building
+from .models import MergedRentalTransaction
+from .models import MergedTransaction
+from .models import Project
+from .models import SearchTransactionsLog
+from .models import StatsWarmState
+from .stats import calc_search_logs_for_periods
+from .stats import SEARCH_PERIODS
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_TYPES = ("sales", "rental")
+WARM_PERIODS = SEARCH_PERIODS
+POPULARITY_DAYS = 30
+
+# (transaction_type, entity_kind, entity_name)
+WarmItem = tuple[str, str, str]
+
+
+def _building_fingerprints(transaction_type: str) -> dict[int | None, tuple[int, str]]:
+    """{building_id: (transactions, last updated_at)} for one transaction type, one query."""
+    if transaction_type == "rental":
+        qs = MergedRentalTransaction.objects.all()
+    else:
+        qs = MergedTransaction.objects.filter(transaction_type="sales")
+    rows = (
+        qs.order_by()
+        .values("building_id")
+        .annotate(n=Count("id"), last=Max("updated_at"))
+        .values_list("building_id", "n", "last")
+    )
+    return {b_id: (n, last.isoformat() if last else "") for b_id, n, last in rows}
+
+
+def _merge(fingerprints: Iterable[tuple[int, str]]) -> tuple[int, str]:
+    count, last = 0, ""
+    for n, updated in fingerprints:
+        count += n
+        last = max(last, updated)
+    return count, last
+
+
+def _entity_fingerprints(
+    transaction_type: str,
+) -> dict[tuple[str, str], tuple[int, str]]:
+    """{(entity_kind, entity_name): (transactions, last updated_at)} of every entity."""
+    per_building = _building_fingerprints(transaction_type)
+    by_area: dict[str, list] = {}
+    by_project: dict[str, list] = {}
+    result = {("dubai", ""): _merge(per_building.values())}
+
+    buildings = Building.objects.exclude(english_name__isnull=True).exclude(
+        english_name=""
+    )
+    for b_id, name, area_name, project_name in buildings.values_list(
+        "id", "english_name", "area__name_en", "project__english_name"
+    ):
+        fingerprint = per_building.get(b_id)
+        if fingerprint is None:
+            continue
+        result[("building", name)] = _merge(
+            [result.get(("building", name), (0, "")), fingerprint]
+        )
+        if area_name:
+            by_area.setdefault(area_name, []).append(fingerprint)
+        if project_name:
+            by_project.setdefault(project_name, []).append(fingerprint)
+
+    for area_name in (
+        Area.objects.exclude(name_en__isnull=True)
+        .exclude(name_en="")
+        .values_list("name_en", flat=True)
+    ):
+        if area_name in by_area:
+            result[("area", area_name)] = _merge(by_area[area_name])
+    for project_name in (
+        Project.objects.exclude(english_name__isnull=True)
+        .exclude(english_name="")
+        .values_list("english_name", flat=True)
+    ):
+        if project_name in by_project:
+            result[("project", project_name)] = _merge(by_project[project_name])
+    return result
+
+
+def _signature(transaction_type: str, fingerprint: tuple[int, str]) -> str:
+    raw = "|".join(
+        [
+            str(fingerprint[0]),
+            fingerprint[1],
+            str(stats_cache.get_generation(transaction_type)),
+            timezone.localdate().isoformat(),
+        ]
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _popularity() -> Counter:
+    """{search substring (lower case): searches in the last POPULARITY_DAYS}."""
+    since = timezone.now() - timedelta(days=POPULARITY_DAYS)
+    popularity: Counter = Counter()
+    for substring, n in (
+        SearchTransactionsLog.objects.filter(requested_at__gte=since)
+        .exclude(search_substring__isnull=True)
+        .values("search_substring")
+        .annotate(n=Count("id"))
+        .values_list("search_substring", "n")
+    ):
+        popularity[substring.strip().lower()] += n
+    return popularity
+
+
+# All Dubai is the reference of every other item, then areas, projects, buildings
+_KIND_ORDER = {"dubai": 0, "area": 1, "project": 2, "building": 3}
+
+
+def plan_warm_items(
+    transaction_types: Iterable[str] = TRANSACTION_TYPES, force: bool = False
+) -> list[tuple[WarmItem, str]]:
+    """
+    Returns ``[(item, signature), ...]`` that need warming, most popular first.
+    With ``force`` items are returned even if their signature did not change.
+    """
+    popularity = _popularity()
+    planned = []
+    for transaction_type in transaction_types:
+        done = {
+            (kind, name): signature
+            for kind, name, signature in StatsWarmState.objects.filter(
+                transaction_type=transaction_type
+            ).values_list("entity_kind", "entity_name", "signature")
+        }
+        for (kind, name), fingerprint in _entity_fingerprints(transaction_type).items():
+            if not fingerprint[0] and kind != "dubai":
+                continue
+            signature = _signature(transaction_type, fingerprint)
+            if not force and done.get((kind, name)) == signature:
+                continue
+            planned.append(((transaction_type, kind, name), signature))
+
+    planned.sort(
+        key=lambda entry: (
+            entry[0][1] != "dubai",
+            -popularity.get(entry[0][2].lower(), 0),
+            _KIND_ORDER[entry[0][1]],
+            entry[0][2],
+        )
+    )
+    return planned
+
+
+def warm_item(item: WarmItem, signature: str) -> bool:
+    """
+    Computes and caches every period of one item, then checkpoints it.
+    Returns False (and records the error) if the calculation failed.
+    """
+    transaction_type, kind, name = item
+    started = time.perf_counter()
+    error = ""
+    try:
+        # Все периоды — из одной выборки (см. calc_search_logs_for_periods)
+        calc_search_logs_for_periods(
+            transaction_type=transaction_type,
+            search_substring=name or None,
+            property_components=None,
+            periods=WARM_PERIODS,
+            return_dict=True,  # We don't need to save to DB
+            use_cache=True,
+        )
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Warming %s failed", item)
+        error = f"{type(exc).__name__}: {exc}"
+
+    StatsWarmState.objects.update_or_create(
+        transaction_type=transaction_type,
+        entity_kind=kind,
+        entity_name=name,
+        defaults={
+            # Неудачный элемент остаётся "непрогретым" и попадёт в следующий план
+            "signature": "" if error else signature,
+            "warmed_at": timezone.now(),
+            "duration_seconds": time.perf_counter() - started,
+            "last_error": error,
+        },
+    )
+    return not error
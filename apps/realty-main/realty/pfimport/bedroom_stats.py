@@ -0,0 +1,142 @@
+"""
+PFBuildingBedroomStats maintenance.
+
+Stats of a building are recomputed from its stored listings (PFListSale /
+PFListRent with price > 0): count, sum and sum of squares, min / max,
+average and exact median price, summed days on market, and the ROI of the
+(building, bedrooms) pair = average rent / average sale price, written on
+both listing types. PFJsonUpload.process_json refreshes the buildings it
+touched; ``rebuild_pf_bedroom_stats`` rebuilds everything.
+"""
+
+import logging
+import statistics
+from collections import defaultdict
+from collections.abc import Iterable
+
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import CharField
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Lower
+from django.db.models.functions import Trim
+from django.db.models.lookups import Exact
+from django.utils import timezone
+
+from .models import PFBuildingBedroomStats
+from .models import PFListRent
+from .models import PFListSale
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+LISTING_MODELS = (("sale", PFListSale), ("rent", PFListRent))
+
+BEDROOM_KEYS = {
+    "studio": "studio",
+    "0": "studio",
+    "1": "1br",
+    "2": "2br",
+    "3": "3br",
+    "4": "4br",
+}
+DEFAULT_BEDROOM_KEY = "4br"  # всё >=4 считаем как 4br
+
+
+def normalize_bedroom_key(bedrooms_value) -> str:
+    if not bedrooms_value:
+        return "studio"  # трактуем пустое как студию
+    val = str(bedrooms_value).lower().strip()
+    return BEDROOM_KEYS.get(val, DEFAULT_BEDROOM_KEY)
+
+
+def bedroom_key_expression(field: str = "bedrooms") -> Case:
+    """normalize_bedroom_key() of a listing column as an SQL expression."""
+    value = Lower(Trim(field))
+    return Case(
+        When(**{f"{field}__isnull": True}, then=Value("studio")),
+        When(**{field: ""}, then=Value("studio")),
+        *[
+            When(Exact(value, raw), then=Value(key))
+            for raw, key in BEDROOM_KEYS.items()
+        ],
+        default=Value(DEFAULT_BEDROOM_KEY),
+        output_field=CharField(),
+    )
+
+
+def _summarize(values):
+    """values: [(price Decimal, days on market)] → stats fields."""
+    prices = [price for price, _ in values]
+    total = sum(prices)
+    return {
+        "count": len(prices),
+        "sum_price": total,
+        "sum_price_sq": sum(float(price) ** 2 for price in prices),
+        "min_price": min(prices),
+        "max_price": max(prices),
+        "avg_price": float(total) / len(prices),
+        "median_price": float(statistics.median(prices)),
+        "sum_exposure_days": sum(days for _, days in values),
+    }
+
+
+def _refresh_batch(building_ids, today):
+    grouped = defaultdict(list)
+    for listing_type, model in LISTING_MODELS:
+        for b_id, bedrooms, price, added_on in (
+            model.objects.filter(building_id__in=building_ids, price__gt=0)
+            .values_list("building_id", "bedrooms", "price", "added_on")
+            .iterator()
+        ):
+            days = max((today - added_on.date()).days, 0) if added_on else 0
+            key = (b_id, normalize_bedroom_key(bedrooms), listing_type)
+            grouped[key].append((price, days))
+
+    summaries = {key: _summarize(values) for key, values in grouped.items()}
+    rows = []
+    for (b_id, bedrooms, listing_type), fields in summaries.items():
+        rent = summaries.get((b_id, bedrooms, "rent"))
+        sale = summaries.get((b_id, bedrooms, "sale"))
+        roi = rent["avg_price"] / sale["avg_price"] if rent and sale else None
+        rows.append(
+            PFBuildingBedroomStats(
+                building_id=b_id,
+                bedrooms=bedrooms,
+                listing_type=listing_type,
+                roi=roi,
+                updated_at=timezone.now(),
+                **fields,
+            )
+        )
+
+    with transaction.atomic():
+        PFBuildingBedroomStats.objects.filter(building_id__in=building_ids).delete()
+        PFBuildingBedroomStats.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def refresh_bedroom_stats(building_ids: Iterable[int] | None = None) -> int:
+    """
+    Recomputes the stats of `building_ids` (of every building with listings
+    when None). Returns the number of stats rows written.
+    """
+    if building_ids is None:
+        ids = set()
+        for _, model in LISTING_MODELS:
+            ids.update(
+                model.objects.exclude(building_id__isnull=True)
+                .values_list("building_id", flat=True)
+                .distinct()
+            )
+    else:
+        ids = {pk for pk in building_ids if pk is not None}
+    ids = sorted(ids)
+
+    today = timezone.now().date()
+    written = 0
+    for start in range(0, len(ids), BATCH_SIZE):
+        written += _refresh_batch(ids[start : start + BATCH_SIZE], today)
+    logger.info("PF bedroom stats: %s rows for %s buildings", written, len(ids))
+    return written
@@ -19,13 +19,13 @@ from django.db.models import (
     F,
     FloatField,
     Q,
-    Value,
     When,
 )
 from django.db.models.functions import ExtractYear
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
 
+from .listings import case_avg as _case_avg
 from .models import Area, Building, PFListRent, PFListSale
 
 TODAY = timezone.now().date()
@@ -192,18 +192,6 @@ def _build_common(request, model_cls, *, list_type: str):
 
 
 # ──────────────────────────── Helper functions ──────────────────────────────
-def _case_avg(sum_field: str, cnt_field: str) -> ExpressionWrapper:
-    """sum / count → FloatField (NULL, если count==0)"""
-    return ExpressionWrapper(
-        Case(
-            When(**{f"{cnt_field}__gt": 0}, then=F(sum_field) / F(cnt_field)),
-            default=Value(None),
-            output_field=FloatField(),
-        ),
-        output_field=FloatField(),
-    )
-
-
 def _add_avg_price_annotations(qs, list_type: str):
     """Добавляет аннотации средних цен (_avg_rent/_avg_sale)"""
     if list_type == "sale":
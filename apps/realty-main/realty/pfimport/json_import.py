@@ -0,0 +1,447 @@
+"""
+Import of PropertyFinder scraper JSON (PFJsonUpload.process_json).
+
+The file (a JSON array of listings, or JSON Lines) is stream-parsed, arrays
+with ijson when it is installed, so large scrapes are never loaded whole.
+Listings are handled in chunks of CHUNK_SIZE items, each in two phases:
+
+  1. existence lookup: the listing ids of the chunk are looked up in both
+     PFListSale and PFListRent with chunked ``IN`` queries;
+  2. writes: new areas / buildings first, then for every model its new
+     listings (bulk_create) and the existing ones whose fields changed
+     (bulk_update), in batches of BULK_BATCH_SIZE.
+
+Area / building counters accumulate in memory and are written once at the
+end; the whole import runs in one transaction. PFBuildingBedroomStats of the
+touched buildings are refreshed afterwards.
+
+Listings whose address names no known area get the area whose polygon
+contains their coordinates (spatial.AreaIndex, one lookup per chunk) when
+shapely is installed.
+"""
+
+import datetime
+import json
+import logging
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .bedroom_stats import BEDROOM_KEYS
+from .bedroom_stats import normalize_bedroom_key
+from .bedroom_stats import refresh_bedroom_stats
+from .models import AREAS_WITH_PROPERTY
+from .models import Area
+from .models import Building
+from .models import PFListRent
+from .models import PFListSale
+from .models import _clean_str
+from .spatial import AreaIndex
+from .spatial import available as spatial_available
+
+try:
+    import ijson
+except ImportError:  # без ijson файл читается целиком через json.load
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2_000
+BULK_BATCH_SIZE = 500
+
+LISTING_TYPES = {
+    "Residential for Sale": (PFListSale, "sell"),
+    "Residential for Rent": (PFListRent, "rent"),
+}
+
+LISTING_FIELDS = [
+    "area",
+    "building",
+    "url",
+    "title",
+    "display_address",
+    "bedrooms",
+    "bathrooms",
+    "added_on",
+    "broker",
+    "agent",
+    "agent_phone",
+    "verified",
+    "reference",
+    "broker_license_number",
+    "property_type",
+    "price_duration",
+    "listing_type",
+    "price",
+    "price_currency",
+    "latitude",
+    "longitude",
+    "size_min",
+    "numeric_area",
+    "furnishing",
+    "description",
+    "description_html",
+]
+
+AREA_FIELDS = [
+    "sum_number_of_days_for_all_ads",
+    "numbers_of_processed_ads",
+    "verified_value",
+]
+
+_SUFFIXES = sorted(set(BEDROOM_KEYS.values()))
+BUILDING_FIELDS = [
+    "latitude",
+    "longitude",
+    "numbers_of_processed_rent_ads",
+    "numbers_of_processed_sale_ads",
+    "sum_exposure_rent_days",
+    "sum_exposure_sale_days",
+    *[
+        f"{kind}_{what}_{key}"
+        for kind in ("rent", "sale")
+        for what in ("count", "sum")
+        for key in _SUFFIXES
+    ],
+]
+
+
+def _first_byte(f) -> bytes:
+    """First non-whitespace byte of `f` (the position is restored)."""
+    start = f.tell()
+    while True:
+        block = f.read(4096)
+        stripped = block.lstrip()
+        if stripped or not block:
+            f.seek(start)
+            return stripped[:1]
+
+
+def iter_items(file_path):
+    """
+    Listings of a scraper file one by one: a JSON array or JSON Lines (one
+    object per line, like parsing/take_all.py writes).
+    """
+    with open(file_path, "rb") as f:
+        if _first_byte(f) != b"[":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif ijson is None:
+            yield from json.load(f)
+        else:
+            yield from ijson.items(f, "item", use_float=True)
+
+
+def _parse_added_on(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _parse_size(size_min_str):
+    if not size_min_str:
+        return None
+    try:
+        return float(size_min_str.split()[0])
+    except Exception:
+        return None
+
+
+def _apply_changes(listing, data) -> bool:
+    """Copies the non-empty values of `data` onto `listing`; True if something changed."""
+    changed = False
+    for field, value in data.items():
+        if value is None:
+            continue
+        if field in ("area", "building"):
+            # связанные объекты сравниваем по id (новые ещё без pk)
+            changed |= value.pk is None or value.pk != getattr(listing, f"{field}_id")
+        else:
+            changed |= getattr(listing, field) != value
+        setattr(listing, field, value)
+    return changed
+
+
+class PFJsonImporter:
+    """One run of the import, see the module docstring."""
+
+    def __init__(self, file_path, chunk_size: int = CHUNK_SIZE, area_index=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.today = timezone.now().date()
+        self.areas = {area.name: area for area in Area.objects.all()}
+        self.areas_by_id = {area.pk: area for area in self.areas.values()}
+        if area_index is None and spatial_available():
+            area_index = AreaIndex.from_db()
+        # без полигонов районов привязка по координатам не нужна
+        self.area_index = (
+            area_index if area_index is not None and len(area_index) else None
+        )
+        # здания ключуем по имени района: у новых районов ещё нет id
+        self.buildings = {
+            (building.name, building.area.name): building
+            for building in Building.objects.select_related("area")
+        }
+        self.new_areas = []
+        self.new_buildings = []
+        self.dirty_areas = {}
+        self.dirty_buildings = {}
+        self.touched_building_ids = set()
+        self.touched_buildings = []
+        self.stats = Counter()
+
+    # ------------------------------------------------------------------ #
+    def run(self):
+        with transaction.atomic():
+            chunk = []
+            for item in iter_items(self.file_path):
+                prepared = self._prepare(item)
+                if prepared is None:
+                    self.stats["skipped"] += 1
+                    continue
+                chunk.append(prepared)
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._write_chunk(chunk)
+
+            self._create_pending()
+            Area.objects.bulk_update(
+                self.dirty_areas.values(),
+                fields=AREA_FIELDS,
+                batch_size=BULK_BATCH_SIZE,
+            )
+            Building.objects.bulk_update(
+                self.dirty_buildings.values(),
+                fields=BUILDING_FIELDS,
+                batch_size=BULK_BATCH_SIZE,
+            )
+            self.touched_building_ids.update(b.pk for b in self.touched_buildings)
+            refresh_bedroom_stats(self.touched_building_ids)
+
+        logger.info(
+            "PF JSON import %s: %s",
+            self.file_path,
+            ", ".join(f"{key} {value}" for key, value in sorted(self.stats.items())),
+        )
+        return self.stats
+
+    # ------------------------------------------------------------------ #
+    def _area(self, name, parsed_added_on):
+        """Area of `name` with its counters bumped (None outside AREAS_WITH_PROPERTY)."""
+        if not (name and name in AREAS_WITH_PROPERTY):
+            return None
+        days = (self.today - parsed_added_on.date()).days if parsed_added_on else 0
+        area = self.areas.get(name)
+        if area is None:
+            main_page_ads = AREAS_WITH_PROPERTY.get(name, 0)
+            area = Area(
+                name=name,
+                numeric_area=None,
+                numbers_of_main_page_ads=main_page_ads,
+                sum_number_of_days_for_all_ads=days,
+                numbers_of_processed_ads=1,
+                verified_value=f"{name} ({main_page_ads:,})",
+            )
+            self.areas[name] = area
+            self.new_areas.append(area)
+            return area
+
+        area.sum_number_of_days_for_all_ads += days
+        area.numbers_of_processed_ads += 1
+        if not area.verified_value:
+            area.verified_value = f"{area.name} ({area.numbers_of_main_page_ads:,})"
+        self.dirty_areas[id(area)] = area
+        return area
+
+    def _building(self, name, area, item, is_rent, parsed_added_on, lat, lng):
+        """Building of `name` in `area` with its listing counters bumped."""
+        if not (name and area):
+            return None
+        key = (name, area.name)
+        building = self.buildings.get(key)
+        if building is None:
+            building = Building(name=name, area=area, latitude=lat, longitude=lng)
+            self.buildings[key] = building
+            self.new_buildings.append(building)
+        else:
+            if lat is not None and lng is not None:
+                building.latitude = lat
+                building.longitude = lng
+            self.dirty_buildings[id(building)] = building
+
+        kind = "rent" if is_rent else "sale"
+        bedroom_key = normalize_bedroom_key(item.get("bedrooms"))
+        price_val = Decimal(str(item.get("price") or 0))
+        days_on_market = (
+            (self.today - parsed_added_on.date()).days if parsed_added_on else 0
+        )
+        counter = f"numbers_of_processed_{kind}_ads"
+        setattr(building, counter, getattr(building, counter) + 1)
+        for field, step in (
+            (f"{kind}_count_{bedroom_key}", 1),
+            (f"{kind}_sum_{bedroom_key}", price_val),
+            (f"sum_exposure_{kind}_days", days_on_market),
+        ):
+            setattr(building, field, getattr(building, field) + step)
+        self.touched_buildings.append(building)
+        return building
+
+    def _prepare(self, item):
+        """(model, listing_id, listing fields) of a JSON item, None if skipped."""
+        listing_id = item.get("id")
+        if not listing_id:
+            return None  # без id бессмысленно
+        listing_type_val = item.get("type")
+        if listing_type_val not in LISTING_TYPES:
+            return None
+        # оставляем только квартиры (сравнение без учёта регистра)
+        property_type_str = (item.get("propertyType") or "").strip()
+        if property_type_str.lower() != "apartment":
+            return None
+        model_class, price_duration_val = LISTING_TYPES[listing_type_val]
+
+        parsed_added_on = _parse_added_on(item.get("addedOn"))
+        coords = item.get("coordinates") or {}
+        lat, lng = coords.get("latitude"), coords.get("longitude")
+        size_min_str = item.get("sizeMin") or ""
+
+        # адрес (building / area)
+        disp_addr = item.get("displayAddress", "")
+        parts = [x.strip() for x in disp_addr.split(",", 3)]
+        while len(parts) < 4:
+            parts.append("")
+        address1, _, address3, _ = parts
+
+        area_obj = self._area(address3, parsed_added_on)
+        building_obj = self._building(
+            address1,
+            area_obj,
+            item,
+            model_class is PFListRent,
+            parsed_added_on,
+            lat,
+            lng,
+        )
+
+        listing_data = {
+            "area": area_obj,
+            "building": building_obj,
+            # ---- базовые поля --------------------------------------------------
+            "url": _clean_str(item.get("url")),
+            "title": _clean_str(item.get("title")),
+            "display_address": _clean_str(disp_addr),
+            "bedrooms": _clean_str(item.get("bedrooms")),
+            "bathrooms": _clean_str(item.get("bathrooms")),
+            "added_on": parsed_added_on,
+            # ---- агент / брокер ------------------------------------------------
+            "broker": _clean_str(item.get("brokerName")),
+            "agent": _clean_str(item.get("agentName")),
+            "agent_phone": _clean_str(item.get("phone")),
+            "verified": bool(item.get("verified")),
+            "reference": _clean_str(item.get("reference")),
+            "broker_license_number": _clean_str(item.get("brokerLicenseNo")),
+            # ---- типы / цены ---------------------------------------------------
+            "property_type": _clean_str(property_type_str),
+            "price_duration": price_duration_val,
+            "listing_type": listing_type_val,
+            "price": Decimal(str(item.get("price") or 0)),
+            "price_currency": _clean_str(item.get("priceCurrency")),
+            # ---- координаты / площадь -----------------------------------------
+            "latitude": lat,
+            "longitude": lng,
+            "size_min": size_min_str or None,
+            "numeric_area": _parse_size(size_min_str),
+            # ---- прочее --------------------------------------------------------
+            "furnishing": _clean_str(item.get("furnishing")),
+            "description": _clean_str(item.get("description")),
+            "description_html": _clean_str(item.get("descriptionHtml")),
+        }
+        return model_class, str(listing_id), listing_data
+
+    # ------------------------------------------------------------------ #
+    def _create_pending(self):
+        """bulk_create of the areas / buildings first seen since the last call."""
+        if self.new_areas:
+            Area.objects.bulk_create(self.new_areas, batch_size=BULK_BATCH_SIZE)
+            self.new_areas = []
+        if self.new_buildings:
+            Building.objects.bulk_create(self.new_buildings, batch_size=BULK_BATCH_SIZE)
+            self.new_buildings = []
+
+    def _existing(self, model_class, listing_ids):
+        """Phase one: {listing_id: listing} of `listing_ids` already stored."""
+        listing_ids = list(listing_ids)
+        found = {}
+        for start in range(0, len(listing_ids), BULK_BATCH_SIZE):
+            batch = listing_ids[start : start + BULK_BATCH_SIZE]
+            for listing in model_class.objects.filter(listing_id__in=batch):
+                found[listing.listing_id] = listing
+        return found
+
+    def _areas_by_coordinates(self, chunk):
+        """Area of the polygon around the listing, for listings without one."""
+        if self.area_index is None:
+            return
+        pending = [
+            data
+            for _, _, data in chunk
+            if data["area"] is None and data["latitude"] is not None
+        ]
+        if not pending:
+            return
+        area_ids = self.area_index.lookup(
+            [data["longitude"] for data in pending],
+            [data["latitude"] for data in pending],
+        )
+        for data, area_id in zip(pending, area_ids, strict=True):
+            area = self.areas_by_id.get(int(area_id))
+            if area is not None:
+                data["area"] = area
+                self.stats["area by coordinates"] += 1
+
+    def _write_chunk(self, chunk):
+        """Phase two: per-model bulk writes of the chunk's new and changed listings."""
+        self._create_pending()  # у объявлений должны быть id района и здания
+        self._areas_by_coordinates(chunk)
+
+        by_model = {PFListSale: {}, PFListRent: {}}
+        for model_class, listing_id, data in chunk:
+            by_model[model_class].setdefault(listing_id, []).append(data)
+
+        for model_class, items in by_model.items():
+            if not items:
+                continue
+            existing = self._existing(model_class, items)
+            to_create, to_update = [], []
+            for listing_id, versions in items.items():
+                listing = existing.get(listing_id)
+                if listing is None:
+                    # повторы id внутри файла сливаются в одно объявление
+                    listing = model_class(listing_id=listing_id, **versions[0])
+                    for data in versions[1:]:
+                        _apply_changes(listing, data)
+                    to_create.append(listing)
+                    continue
+                self.touched_building_ids.add(listing.building_id)
+                changed = False
+                for data in versions:
+                    changed |= _apply_changes(listing, data)
+                if changed:
+                    to_update.append(listing)
+                else:
+                    self.stats[f"{model_class.__name__} unchanged"] += 1
+
+            model_class.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+            model_class.objects.bulk_update(
+                to_update, fields=LISTING_FIELDS, batch_size=BULK_BATCH_SIZE
+            )
+            self.stats[f"{model_class.__name__} created"] += len(to_create)
+            self.stats[f"{model_class.__name__} updated"] += len(to_update)
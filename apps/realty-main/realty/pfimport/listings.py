@@ -0,0 +1,239 @@
+"""
+Query engine of the PF listing pages (/main/pf-listings/sale/ and /rent/).
+
+Everything that used to be computed per row in Python is an SQL annotation:
+  - avg_rent / avg_sale: average PF price of the listing's building for its
+    bedroom count, read from PFBuildingBedroomStats (see bedroom_stats.py);
+  - pf_avg_roi: avg_rent / price for sales, the stats ROI (avg rent / avg
+    sale) for rents;
+  - price_per_sqft: price / numeric_area.
+Price filters and the sort run in the database as well, and pages are cut
+with keyset pagination: the cursor holds the sort key and id of the last
+(or first) row of the page, so a page costs O(page size) whatever its depth.
+"""
+
+import base64
+import datetime
+import json
+from dataclasses import dataclass
+from dataclasses import field
+from decimal import Decimal
+from decimal import InvalidOperation
+
+from django.conf import settings
+from django.db.models import Case
+from django.db.models import DateTimeField
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Cast
+from django.db.models.functions import Coalesce
+
+from .bedroom_stats import bedroom_key_expression
+from .models import PFBuildingBedroomStats
+
+PAGE_SIZE = 10
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC if settings.USE_TZ else None)
+
+# sort → (ключ сортировки, по убыванию при order=asc)
+# NULL-ы ключей заменены так же, как в прежней Python-сортировке
+SORTS = {
+    # Меньше дней на рынке = позже добавлено; без даты — «бесконечно давно»
+    "days": (Coalesce("added_on", Value(EPOCH, output_field=DateTimeField())), True),
+    "price_sqft": (Coalesce("price_per_sqft", Value(0.0)), False),
+    "roi": (Coalesce("pf_avg_roi", Value(0.0)), False),
+    "": (F("id"), False),
+}
+
+
+def case_avg(sum_field: str, cnt_field: str) -> ExpressionWrapper:
+    """sum / count → FloatField (NULL, если count==0)"""
+    return ExpressionWrapper(
+        Case(
+            When(
+                **{f"{cnt_field}__gt": 0},
+                then=Cast(sum_field, FloatField()) / F(cnt_field),
+            ),
+            default=Value(None),
+            output_field=FloatField(),
+        ),
+        output_field=FloatField(),
+    )
+
+
+def _bedroom_stat(listing_type: str, field: str) -> Subquery:
+    """`field` of the PFBuildingBedroomStats row of the listing's building / bedrooms."""
+    return Subquery(
+        PFBuildingBedroomStats.objects.filter(
+            building_id=OuterRef("building_id"),
+            bedrooms=OuterRef("_bedroom_key"),
+            listing_type=listing_type,
+        ).values(field)[:1],
+        output_field=FloatField(),
+    )
+
+
+def bedroom_avg(kind: str) -> Case:
+    """
+    Average `kind` ("rent" / "sale") price of the listing's building for the
+    listing's bedrooms; 0 if the building has no such ads (like
+    Building.avg_rent_1br & co), NULL without a building.
+    Needs the ``_bedroom_key`` annotation (see annotate_listings).
+    """
+    return Case(
+        When(building__isnull=True, then=Value(None)),
+        default=Coalesce(_bedroom_stat(kind, "avg_price"), Value(0.0)),
+        output_field=FloatField(),
+    )
+
+
+def _ratio(numerator, denominator) -> Case:
+    return Case(
+        When(**{f"{denominator}__gt": 0}, then=F(numerator) / F(denominator)),
+        default=Value(None),
+        output_field=FloatField(),
+    )
+
+
+def annotate_listings(qs, list_type: str):
+    """Adds avg_rent, avg_sale, pf_avg_roi and price_per_sqft (see the module docstring)."""
+    qs = qs.annotate(_bedroom_key=bedroom_key_expression()).annotate(
+        avg_rent=bedroom_avg("rent"),
+        avg_sale=bedroom_avg("sale"),
+        _price=Cast("price", FloatField()),
+        price_per_sqft=Case(
+            When(
+                price__gt=0,
+                numeric_area__gt=0,
+                then=Cast("price", FloatField()) / F("numeric_area"),
+            ),
+            default=Value(None),
+            output_field=FloatField(),
+        ),
+    )
+    if list_type == "sale":
+        return qs.annotate(pf_avg_roi=_ratio("avg_rent", "_price"))
+    return qs.annotate(pf_avg_roi=_bedroom_stat("rent", "roi"))
+
+
+def _to_number(value: str | None) -> Decimal | None:
+    try:
+        return Decimal(value.strip()) if value and value.strip() else None
+    except InvalidOperation:
+        return None
+
+
+def filter_price(qs, price_min: str | None, price_max: str | None):
+    """price_min / price_max; listings without price count as price 0."""
+    low = _to_number(price_min)
+    high = _to_number(price_max)
+    if low is not None:
+        cond = Q(price__gte=low)
+        if low <= 0:
+            cond |= Q(price__isnull=True)
+        qs = qs.filter(cond)
+    if high is not None:
+        cond = Q(price__lte=high)
+        if high >= 0:
+            cond |= Q(price__isnull=True)
+        qs = qs.filter(cond)
+    return qs
+
+
+# ───────────────────────────── keyset pagination ─────────────────────────────
+@dataclass
+class ListingPage:
+    """One keyset page; iterates like a Paginator page."""
+
+    object_list: list = field(default_factory=list)
+    has_next: bool = False
+    has_previous: bool = False
+    next_cursor: str = ""
+    previous_cursor: str = ""
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _encode_cursor(direction: str, key, pk: int) -> str:
+    if isinstance(key, datetime.datetime):
+        key = key.isoformat()
+    raw = json.dumps([direction, key, pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_field: str):
+    """(direction, key, id) or None for a missing / broken cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, key, pk = json.loads(raw)
+        if direction not in ("next", "prev"):
+            return None
+        if sort_field == "days":
+            key = datetime.datetime.fromisoformat(key)
+        elif sort_field:
+            key = float(key)
+        else:
+            key = int(key)
+        return direction, key, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(
+    qs, sort_field: str, sort_order: str, cursor: str = "", per_page: int = PAGE_SIZE
+) -> ListingPage:
+    """
+    Orders `qs` by SORTS[sort_field] (then id) and returns the page after /
+    before `cursor` (the first page without one).
+    """
+    key_expr, inverted = SORTS.get(sort_field, SORTS[""])
+    if sort_field not in SORTS:
+        sort_field = ""
+    descending = (sort_order == "desc") != inverted
+    qs = qs.annotate(_sort_key=key_expr)
+
+    decoded = _decode_cursor(cursor, sort_field)
+    direction, key, pk = decoded if decoded else ("next", None, None)
+    backwards = direction == "prev"
+    # Назад — та же сортировка наоборот, потом разворачиваем страницу
+    scan_descending = descending != backwards
+
+    if key is not None:
+        lookup = "lt" if scan_descending else "gt"
+        qs = qs.filter(
+            Q(**{f"_sort_key__{lookup}": key})
+            | Q(_sort_key=key, **{f"id__{lookup}": pk})
+        )
+    prefix = "-" if scan_descending else ""
+    rows = list(qs.order_by(f"{prefix}_sort_key", f"{prefix}id")[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+
+    page = ListingPage(
+        object_list=rows,
+        has_next=has_more if not backwards else True,
+        has_previous=has_more if backwards else key is not None,
+    )
+    if rows:
+        first, last = rows[0], rows[-1]
+        page.next_cursor = _encode_cursor("next", last._sort_key, last.id)
+        page.previous_cursor = _encode_cursor("prev", first._sort_key, first.id)
+    return page
@@ -15,7 +15,7 @@ class Command(BaseCommand):
         parser.add_argument(
             'directory',
             type=str,
-            help='Directory containing JSON files to import'
+            help='Directory containing JSON / JSONL files to import'
         )
         parser.add_argument(
             '--update',
@@ -52,8 +52,11 @@ class Command(BaseCommand):
         if not directory.is_dir():
             raise CommandError(f'{directory} is not a directory')
         
-        # Ищем JSON файлы
-        json_files = list(directory.glob('*.json'))
+        # Ищем JSON и JSON Lines файлы (PFJsonUpload читает оба формата)
+        json_files = sorted(
+            p for p in directory.iterdir()
+            if p.suffix.lower() in ('.json', '.jsonl', '.ndjson')
+        )
         if not json_files:
             raise CommandError(f'No JSON files found in {directory}')
         
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+from itertools import islice
 from pathlib import Path
 from typing import List, Dict, Any
 from django.core.management.base import BaseCommand, CommandError
@@ -8,8 +9,12 @@ from django.db import transaction, connection
 from django.utils import timezone
 from decimal import Decimal, InvalidOperation
 
+from realty.pfimport.json_import import iter_items
 from realty.pfimport.models import PFListSale, PFListRent, Building, Area
 
+# JSON-массивы и JSON Lines (parsing/take_all.py)
+JSON_SUFFIXES = ('.json', '.jsonl', '.ndjson')
+
 
 class Command(BaseCommand):
     help = 'Enhanced PropertyFinder data import with better performance and error handling'
@@ -30,7 +35,7 @@ class Command(BaseCommand):
         parser.add_argument(
             'source',
             type=str,
-            help='JSON file or directory containing JSON files to import'
+            help='JSON / JSONL file or directory containing such files to import'
         )
         parser.add_argument(
             '--batch-size',
@@ -116,12 +121,12 @@ class Command(BaseCommand):
     def get_json_files(self, source: Path) -> List[Path]:
         """Get list of JSON files to process."""
         if source.is_file():
-            if source.suffix.lower() == '.json':
+            if source.suffix.lower() in JSON_SUFFIXES:
                 return [source]
             else:
                 raise CommandError(f'File {source} is not a JSON file')
         
-        return list(source.glob('*.json'))
+        return sorted(p for p in source.iterdir() if p.suffix.lower() in JSON_SUFFIXES)
 
     def clear_data_if_requested(self, options: Dict[str, Any]):
         """Clear existing data if requested."""
@@ -150,32 +155,28 @@ class Command(BaseCommand):
         self.stdout.write(f"📄 Processing {json_file.name}...")
         
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if not isinstance(data, list):
-                self.stdout.write(
-                    self.style.ERROR(f"❌ {json_file.name}: Expected list, got {type(data)}")
-                )
-                return
-            
-            self.stdout.write(f"📊 Found {len(data)} properties in {json_file.name}")
-            self.stats['files_processed'] += 1
-            self.stats['total_properties'] += len(data)
-            
-            # Process in batches
-            for i in range(0, len(data), batch_size):
-                batch = data[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (len(data) + batch_size - 1) // batch_size
+            # Файл читается потоково, в памяти только текущий batch
+            items = iter_items(json_file)
+            file_total = 0
+            batch_num = 0
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    break
+                batch_num += 1
+                file_total += len(batch)
+                self.stats['total_properties'] += len(batch)
                 
-                self.stdout.write(f"📦 Processing batch {batch_num}/{total_batches} ({len(batch)} items)")
+                self.stdout.write(f"📦 Processing batch {batch_num} ({len(batch)} items, {file_total} so far)")
                 
                 if not options['dry_run']:
                     self.process_batch(batch, options['update'])
                 else:
                     # In dry run, just validate data
                     self.validate_batch(batch)
+            
+            self.stdout.write(f"📊 Found {file_total} properties in {json_file.name}")
+            self.stats['files_processed'] += 1
                 
         except json.JSONDecodeError as e:
             self.stats['errors'] += 1
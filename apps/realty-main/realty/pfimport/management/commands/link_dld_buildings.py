@@ -1,24 +1,78 @@
 # pfimport/management/commands/link_dld_buildings.py
+"""
+Links pfimport.Building to main.Building (dld_building) by name.
+
+Buildings are only compared inside their area ("blocking"): a DLD building
+belongs to the PF area of its ``area_by_pf``, or else to the PF area with
+the same name as its DLD ``area``. DLD buildings without any area are
+candidates for every block. Every block is scored with one batched
+``process.cdist`` (token_sort_ratio on all cores), the best candidate per
+PF building wins (ties go to the smallest DLD id) and all links are written
+with one ``bulk_update``.
+"""
 
 import logging
+from collections import defaultdict
+from itertools import pairwise
 
+import numpy as np
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from rapidfuzz import process, fuzz
+from rapidfuzz import fuzz
+from rapidfuzz import process
 
-from realty.pfimport.models import Building as PfBuilding
 from realty.main.models import Building as DldBuilding
+from realty.main.name_matcher import normalize_name
+from realty.pfimport.models import Area as PfArea
+from realty.pfimport.models import Building as PfBuilding
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_THRESHOLD = 75  # минимальный приемлемый score
+BATCH_SIZE = 1024  # строк PF в одной матрице cdist
+BULK_BATCH_SIZE = 1000
+# границы корзин распределения лучших score для отчёта
+SCORE_BUCKETS = (0, 50, 60, 70, 75, 80, 90, 100, 101)
+
+
+def _dld_blocks(pf_area_ids):
+    """{pf area id | None: [(dld id, normalized name)]} in id order."""
+    pf_area_by_name = {normalize_name(name): pk for pk, name in pf_area_ids}
+    blocks = defaultdict(list)
+    rows = (
+        DldBuilding.objects.filter(english_name__isnull=False)
+        .values_list("id", "english_name", "area_by_pf_id", "area__name_en")
+        .order_by("id")
+    )
+    for pk, name, area_by_pf_id, dld_area_name in rows.iterator():
+        name = normalize_name(name)
+        if not name:
+            continue
+        block = area_by_pf_id or pf_area_by_name.get(normalize_name(dld_area_name))
+        blocks[block].append((pk, name))
+    return blocks
+
+
+def _best_matches(queries, candidates):
+    """(best score, dld id) for every query name among the candidates."""
+    names = [name for _, name in candidates]
+    ids = np.array([pk for pk, _ in candidates], dtype=np.int64)
+    for start in range(0, len(queries), BATCH_SIZE):
+        scores = process.cdist(
+            queries[start : start + BATCH_SIZE],
+            names,
+            scorer=fuzz.token_sort_ratio,
+            dtype=np.float32,
+            workers=-1,
+        )
+        best = scores.argmax(axis=1)
+        for row, col in enumerate(best):
+            yield float(scores[row, col]), int(ids[col])
 
 
 class Command(BaseCommand):
     help = (
-        "Для каждого pfimport.Building делает fuzzy‑match против всех "
-        "DldBuilding.english_name и при max_score > DEFAULT_THRESHOLD "
-        "сохраняет связь в поле dld_building."
+        "Fuzzy‑match pfimport.Building → DldBuilding.english_name внутри "
+        "одного района; при score > threshold сохраняет связь в dld_building."
     )
 
     def add_arguments(self, parser):
@@ -36,51 +90,89 @@ class Command(BaseCommand):
             default=None,
             help="Обработать только первые N записей (для теста)",
         )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Перелинковать и уже связанные PfBuilding",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Ничего не сохранять, только отчёт о распределении score",
+        )
+        parser.add_argument(
+            "--verbose-matches",
+            action="store_true",
+            help="Печатать каждую пару PF → DLD",
+        )
 
     def handle(self, *args, **options):
         thresh = options["threshold"]
-        limit = options["limit"]
 
-        # Загружаем кандидатов из DldBuilding
-        dld_qs = DldBuilding.objects.filter(english_name__isnull=False).values_list(
-            "id", "english_name"
+        blocks = _dld_blocks(PfArea.objects.values_list("id", "name"))
+        unblocked = blocks.pop(None, [])
+        self.stdout.write(
+            f"Loaded {sum(map(len, blocks.values())) + len(unblocked)} DldBuilding "
+            f"candidates in {len(blocks)} areas ({len(unblocked)} without area)"
         )
-        choices = {name: pk for pk, name in dld_qs}
-
-        self.stdout.write(f"Loaded {len(choices)} DldBuilding candidates")
 
-        # Берём все PfBuilding без связи
-        qs = PfBuilding.objects.filter(dld_building__isnull=True)
-        if limit:
-            qs = qs[:limit]
-        total = qs.count()
+        qs = PfBuilding.objects.order_by("id")
+        if not options["all"]:
+            qs = qs.filter(dld_building__isnull=True)
+        if options["limit"]:
+            qs = qs[: options["limit"]]
+        pf_by_area = defaultdict(list)
+        for pk, area_id, name, dld_id in qs.values_list(
+            "id", "area_id", "name", "dld_building_id"
+        ):
+            pf_by_area[area_id].append((pk, name or "", dld_id))
+        total = sum(map(len, pf_by_area.values()))
         self.stdout.write(f"Processing {total} PfBuilding records...")
 
-        for idx, pf in enumerate(qs, start=1):
-            src_name = pf.name or ""
-            # Найти лучший матч сразу среди всех english_name
-            match = process.extractOne(
-                src_name, choices.keys(), scorer=fuzz.token_sort_ratio
-            )
-            if not match:
-                self.stdout.write(f"[{idx}/{total}] ✗ '{src_name}': нет кандидатов")
+        best_scores = []
+        changed = []
+        no_candidates = 0
+        for area_id, pf_rows in pf_by_area.items():
+            candidates = sorted(blocks.get(area_id, []) + unblocked)
+            if not candidates:
+                no_candidates += len(pf_rows)
                 continue
-
-            best_name, score, _ = match
-            if score <= thresh:
-                self.stdout.write(
-                    f"[{idx}/{total}] ✗ '{src_name}': лучший '{best_name}' score={score} ≤ threshold={thresh}"
-                )
-                continue
-
-            # Сохраняем в БД
-            dld_pk = choices[best_name]
-            with transaction.atomic():
-                pf.dld_building_id = dld_pk
-                pf.save(update_fields=["dld_building"])
-
-            self.stdout.write(
-                f"[{idx}/{total}] ✓ '{src_name}' → '{best_name}' (score={score})"
-            )
-
-        self.stdout.write("Done.")
+            queries = [normalize_name(name) for _, name, _ in pf_rows]
+            matches = _best_matches(queries, candidates)
+            for (pk, name, dld_id), (score, best_id) in zip(
+                pf_rows, matches, strict=True
+            ):
+                best_scores.append(score)
+                if score <= thresh:
+                    continue
+                if options["verbose_matches"]:
+                    self.stdout.write(f"✓ '{name}' → {best_id} (score={score:.0f})")
+                if best_id != dld_id:
+                    changed.append(PfBuilding(id=pk, dld_building_id=best_id))
+
+        self._report(best_scores, thresh, no_candidates)
+        if options["dry_run"]:
+            self.stdout.write(f"Dry run: {len(changed)} links would be written.")
+            return
+
+        PfBuilding.objects.bulk_update(
+            changed, ["dld_building"], batch_size=BULK_BATCH_SIZE
+        )
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(changed)} links written."))
+
+    def _report(self, best_scores, thresh, no_candidates):
+        scores = np.array(best_scores, dtype=np.float32)
+        matched = int((scores > thresh).sum())
+        self.stdout.write(
+            f"Matched {matched}, below threshold {len(scores) - matched}, "
+            f"no candidates in area {no_candidates}"
+        )
+        if not len(scores):
+            return
+        counts, _ = np.histogram(scores, bins=SCORE_BUCKETS)
+        for (low, high), count in zip(pairwise(SCORE_BUCKETS), counts, strict=True):
+            label = "100" if low == 100 else f"{low}–{high}"
+            bar = "#" * int(40 * count / len(scores))
+            self.stdout.write(f"  score {label:>7}: {count:6d} {bar}")
+        p25, p50, p75 = np.percentile(scores, [25, 50, 75])
+        self.stdout.write(f"  best score p25={p25:.0f} median={p50:.0f} p75={p75:.0f}")
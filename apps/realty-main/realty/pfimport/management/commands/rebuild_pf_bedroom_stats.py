@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from realty.pfimport.bedroom_stats import refresh_bedroom_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild PFBuildingBedroomStats from the stored PF listings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--building",
+            type=int,
+            nargs="+",
+            help="Only rebuild these PF building ids (default: every building)",
+        )
+
+    def handle(self, *args, **options):
+        written = refresh_bedroom_stats(options["building"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bedroom stats rows"))
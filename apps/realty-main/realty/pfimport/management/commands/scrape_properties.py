@@ -7,6 +7,8 @@ import requests
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand
 
+from realty.pfimport.seen_index import SeenIndex, fingerprint
+
 
 class Command(BaseCommand):
     help = "Scrape properties from PropertyFinder and produce a single JSON output file"
@@ -23,6 +25,14 @@ class Command(BaseCommand):
         parser.add_argument(
             "--output", type=str, help="Output file path for the final JSON"
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only fetch new or changed listings (seen-index + conditional "
+                "requests) and stop at the first page without them"
+            ),
+        )
 
     def handle(self, *args, **options):
         start_value = options["start_value"]
@@ -57,6 +67,7 @@ class Command(BaseCommand):
             end_page=end_value,
             output_file=output_file,
             sleep_time=sleep_time,
+            index=SeenIndex() if options["incremental"] else None,
         )
 
         self.stdout.write(
@@ -82,6 +93,20 @@ class Command(BaseCommand):
             if a.has_attr("href")
         ]
 
+    def extract_cards_from_page(self, html):
+        """(link, card fingerprint) of the property cards of a search results page."""
+        soup = BeautifulSoup(html, "lxml")
+        section = soup.select_one("[aria-label='Properties']")
+        if not section:
+            return []
+        cards = []
+        for a in section.select("[data-testid='property-card-link']"):
+            if not a.has_attr("href"):
+                continue
+            card = a.find_parent("article") or a.parent
+            cards.append((a["href"], fingerprint(card.get_text(" "))))
+        return cards
+
     def extract_first_script(self, html):
         """Extract JSON data from the first script tag."""
         soup = BeautifulSoup(html, "lxml")
@@ -209,11 +234,21 @@ class Command(BaseCommand):
         }
 
     def extract_and_process_to_file(
-        self, session, base_url, start_page, end_page, output_file, sleep_time
+        self,
+        session,
+        base_url,
+        start_page,
+        end_page,
+        output_file,
+        sleep_time,
+        index=None,
     ):
         """
         Streamlined process: Extract property links, scrape data, transform, and
         write directly to final JSON file all in one process without temp files.
+
+        With a SeenIndex (incremental mode) only new or changed listings are
+        fetched and written, see realty/pfimport/seen_index.py.
         """
         # Use a set to track unique property IDs
         seen_ids = set()
@@ -223,6 +258,8 @@ class Command(BaseCommand):
         # First gather all property links from search pages
         self.stdout.write("Gathering property links...")
         all_links = set()
+        card_hashes = {}
+        skipped = {"known cards": 0, "not modified": 0, "same data": 0}
 
         for page in range(start_page, end_page + 1):
             url = self.build_page_url(base_url, page)
@@ -232,8 +269,8 @@ class Command(BaseCommand):
                 response = session.get(url)
                 response.raise_for_status()
 
-                links = self.extract_links_from_page(response.text)
-                if not links:
+                cards = self.extract_cards_from_page(response.text)
+                if not cards:
                     self.stdout.write(
                         self.style.WARNING(
                             f"No links found on page {page}, stopping link collection."
@@ -241,6 +278,24 @@ class Command(BaseCommand):
                     )
                     break
 
+                links = [link for link, _ in cards]
+                if index is not None:
+                    index.load(links)
+                    links = []
+                    for link, card_hash in cards:
+                        if index.card_unchanged(link, card_hash):
+                            index.touch(link)
+                            skipped["known cards"] += 1
+                        else:
+                            card_hashes[link] = card_hash
+                            links.append(link)
+                    if not links:
+                        # выдача отсортирована по новизне: дальше только известное
+                        self.stdout.write(
+                            f"Page {page} has only known listings, stopping link collection."
+                        )
+                        break
+
                 all_links.update(links)
                 self.stdout.write(
                     f"Found {len(links)} links on page {page}, total unique links: {len(all_links)}"
@@ -264,7 +319,12 @@ class Command(BaseCommand):
 
             try:
                 # Get property page
-                response = session.get(link)
+                headers = index.conditional_headers(link) if index is not None else {}
+                response = session.get(link, headers=headers)
+                if response.status_code == 304:
+                    index.touch(link, card_hashes.get(link))
+                    skipped["not modified"] += 1
+                    continue
                 response.raise_for_status()
 
                 # Extract JSON data
@@ -303,6 +363,23 @@ class Command(BaseCommand):
                 if property_id:
                     seen_ids.add(property_id)
 
+                if index is not None:
+                    content_hash = fingerprint(
+                        json.dumps(property_data, sort_keys=True, ensure_ascii=False)
+                    )
+                    unchanged = index.content_unchanged(link, content_hash)
+                    index.record(
+                        link,
+                        listing_id=property_id,
+                        card_hash=card_hashes.get(link),
+                        content_hash=content_hash,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+                    if unchanged:
+                        skipped["same data"] += 1
+                        continue
+
                 # Add to our collection
                 all_properties.append(property_data)
                 self.stdout.write(
@@ -314,8 +391,9 @@ class Command(BaseCommand):
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Error processing {link}: {e}"))
 
-            # Sleep to avoid rate limiting
-            time.sleep(sleep_time)
+            finally:
+                # Sleep to avoid rate limiting (also after skipped pages)
+                time.sleep(sleep_time)
 
         # Write all properties to the final JSON file
         self.stdout.write(f"Writing {len(all_properties)} properties to {output_file}")
@@ -329,6 +407,14 @@ class Command(BaseCommand):
             )
         )
 
+        # Индекс сохраняем только после записи файла, иначе пропущенное потеряется
+        if index is not None:
+            saved = index.save()
+            self.stdout.write(
+                f"Seen-index: {saved} entries updated, skipped "
+                + ", ".join(f"{count} {reason}" for reason, count in skipped.items())
+            )
+
 
 PF_PARSER_CONFIG = {
     "mp_name": "pf",
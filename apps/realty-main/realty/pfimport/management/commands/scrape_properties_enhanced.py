@@ -1,25 +1,147 @@
-import os
 import re
 import time
 import json
 import datetime
+import threading
 import requests
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from collections.abc import Callable
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand
-from django.conf import settings
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from realty.pfimport.ratelimit import TokenBucket, retry_after_seconds
+
+DEFAULT_BASE_URL = "https://www.propertyfinder.ae/en/search?l=1&c=2&t=1&fu=0&rp=y&ob=nd&page=220"
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 4.0  # requests per second, all threads together
+
+
+# ---------------------------------------------------------------------------
+# HTML parsing. Module-level functions, so that they can run in the parse
+# worker processes; they return error messages instead of logging them.
+# ---------------------------------------------------------------------------
+def parse_links(html: str, page_url: str) -> list[str]:
+    """Property links of a search results page (absolute, relative to `page_url`)."""
+    soup = BeautifulSoup(html, "lxml")
+    section = soup.select_one("[aria-label='Properties']")
+    if not section:
+        return []
+    return [
+        urljoin(page_url, a["href"])
+        for a in section.select("[data-testid='property-card-link']")
+        if a.has_attr("href")
+    ]
+
+
+def parse_property(html: str, url: str) -> tuple[dict | None, str | None]:
+    """(property, None) for a property page, (None, reason) if it has no usable data."""
+    try:
+        soup = BeautifulSoup(html, "lxml")
+        script = soup.body.find("script") if soup.body else None
+        if not script or not script.string:
+            return None, f"No data script on {url}"
+
+        text = script.string
+        idx = text.find("{")
+        if idx < 0:
+            return None, f"No JSON in data script of {url}"
+
+        json_data = json.loads(text[idx:])
+    except json.JSONDecodeError as e:
+        return None, f"JSON decode error for {url}: {e}"
+    except Exception as e:
+        return None, f"Error extracting property data from {url}: {e}"
+    return transform_property(json_data, url)
+
+
+def transform_property(data: dict, url: str) -> tuple[dict | None, str | None]:
+    """Transform raw property data to structured format."""
+    try:
+        prop = (
+            data.get("props", {})
+            .get("pageProps", {})
+            .get("propertyResult", {})
+            .get("property", {})
+        )
+
+        if not prop:
+            return None, f"No property in page data of {url}"
+
+        # Extract basic details with safe access
+        property_data = {
+            "id": prop.get("id"),
+            "url": url,
+            "title": prop.get("title"),
+            "displayAddress": prop.get("location", {}).get("full_name"),
+            "bedrooms": prop.get("bedrooms"),
+            "bathrooms": prop.get("bathrooms"),
+            "addedOn": prop.get("listed_date"),
+            "broker": prop.get("broker", {}).get("name"),
+            "agent": prop.get("agent", {}).get("name"),
+            "verified": bool(prop.get("is_verified")),
+            "reference": prop.get("reference"),
+            "brokerLicenseNumber": prop.get("broker", {}).get("license_number"),
+            "priceDuration": "rent" if prop.get("isRent") else "sell",
+            "propertyType": prop.get("property_type"),
+            "price": prop.get("price", {}).get("value"),
+            "priceCurrency": prop.get("price", {}).get("currency"),
+            "coordinates": {
+                "latitude": prop.get("location", {}).get("coordinates", {}).get("lat"),
+                "longitude": prop.get("location", {}).get("coordinates", {}).get("lon"),
+            },
+            "size": f"{prop.get('size', {}).get('value', '')} {prop.get('size', {}).get('unit', '')}".strip(),
+            "furnishing": prop.get("furnished", "NO").upper(),
+            "features": [a.get("name") for a in prop.get("amenities", []) if a.get("name")],
+            "description": prop.get("description"),
+            "images": [
+                img.get("full") for img in prop.get("images", {}).get("property", [])
+                if img.get("full")
+            ],
+            "scraped_at": datetime.datetime.now().isoformat(),
+        }
+
+        # Validate required fields
+        if not property_data.get("id") or not property_data.get("title"):
+            return None, f"Missing required fields for {url}"
+
+        return property_data, None
+
+    except Exception as e:
+        return None, f"Error transforming property data: {e}"
+
 
 class PropertyFinderScraper:
-    """Enhanced PropertyFinder scraper with robust error handling and logging."""
+    """
+    Enhanced PropertyFinder scraper with robust error handling and logging.
+
+    Pages are fetched by `concurrency` threads sharing one keep-alive
+    connection pool, paced by a token bucket (`rate` requests per second for
+    the whole crawl, paused on 429 / Retry-After), and parsed in a pool of
+    `parse_workers` processes (0 = parse in the fetch threads).
+    """
     
-    def __init__(self, output_dir: str = "/shared-data", log_level: str = "INFO"):
+    def __init__(
+        self,
+        output_dir: str = "/shared-data",
+        log_level: str = "INFO",
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: float = DEFAULT_RATE,
+        parse_workers: int | None = None,
+        base_url: str = DEFAULT_BASE_URL,
+    ):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.parse_workers = parse_workers
+        self.limiter = TokenBucket(rate)
+        self._stats_lock = threading.Lock()
         self.setup_logging(log_level)
         self.setup_session()
         self.stats = {
@@ -56,16 +178,24 @@ class PropertyFinderScraper:
         """Setup requests session with retry strategy and robust configuration."""
         self.session = requests.Session()
         
-        # Retry strategy
+        # Retry strategy (429 is handled by safe_request and the rate limiter)
         retry_strategy = Retry(
             total=5,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "OPTIONS"],
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
             backoff_factor=2,
-            raise_on_status=False
+            raise_on_status=False,
+            # иначе urllib3 сам ждёт Retry-After у 429 внутри одного потока
+            respect_retry_after_header=False,
         )
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # One keep-alive connection per fetch thread
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=2,
+            pool_maxsize=self.concurrency,
+            pool_block=True,
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
@@ -73,7 +203,7 @@ class PropertyFinderScraper:
         self.session.headers.update(self.get_headers())
         self.session.cookies.update(self.get_cookies())
     
-    def get_headers(self) -> Dict[str, str]:
+    def get_headers(self) -> dict[str, str]:
         """Get randomized headers to avoid detection."""
         return {
             "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
@@ -91,27 +221,31 @@ class PropertyFinderScraper:
             "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
         }
     
-    def get_cookies(self) -> Dict[str, str]:
+    def get_cookies(self) -> dict[str, str]:
         """Get base cookies - in production these should be rotated."""
         return {
             "flagship_user_id": f"scraper_{int(time.time())}",
             "anonymous_user_id": f"scraper_{int(time.time())}",
         }
     
-    def safe_request(self, url: str, max_retries: int = 3, timeout: int = 30) -> Optional[requests.Response]:
+    def safe_request(self, url: str, max_retries: int = 3, timeout: int = 30) -> requests.Response | None:
         """Make a safe HTTP request with comprehensive error handling."""
         for attempt in range(max_retries):
             try:
                 self.logger.debug(f"Attempting request to {url} (attempt {attempt + 1})")
                 
+                self.limiter.acquire()
                 response = self.session.get(url, timeout=timeout)
                 
                 # Check for various error conditions
                 if response.status_code == 429:
-                    wait_time = (attempt + 1) * 10
-                    self.logger.warning(f"Rate limited. Waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    self.stats['retries'] += 1
+                    wait_time = retry_after_seconds(response.headers.get("Retry-After"))
+                    if wait_time is None:
+                        wait_time = (attempt + 1) * 10
+                    self.logger.warning(f"Rate limited. Pausing all requests for {wait_time:.0f} seconds...")
+                    # пауза для всех потоков, а не только для этого
+                    self.limiter.pause(wait_time)
+                    self.count('retries')
                     continue
                 
                 if response.status_code >= 400:
@@ -125,29 +259,29 @@ class PropertyFinderScraper:
                 if self.is_blocked(response):
                     self.logger.error(f"Detected blocking/captcha for {url}")
                     wait_time = (attempt + 1) * 30
-                    self.logger.info(f"Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
+                    self.logger.info(f"Pausing all requests for {wait_time} seconds before retry...")
+                    self.limiter.pause(wait_time)
                     continue
                 
                 return response
                 
             except requests.exceptions.Timeout:
                 self.logger.error(f"Timeout for {url} (attempt {attempt + 1})")
-                self.stats['errors'] += 1
+                self.count('errors')
                 if attempt < max_retries - 1:
                     time.sleep((attempt + 1) * 5)
                     continue
             
             except requests.exceptions.ConnectionError:
                 self.logger.error(f"Connection error for {url} (attempt {attempt + 1})")
-                self.stats['errors'] += 1
+                self.count('errors')
                 if attempt < max_retries - 1:
                     time.sleep((attempt + 1) * 10)
                     continue
             
             except Exception as e:
                 self.logger.error(f"Unexpected error for {url}: {e}")
-                self.stats['errors'] += 1
+                self.count('errors')
                 if attempt < max_retries - 1:
                     time.sleep((attempt + 1) * 2)
                     continue
@@ -176,109 +310,34 @@ class PropertyFinderScraper:
         sep = "&" if "?" in base_url else "?"
         return f"{base_url}{sep}page={page_num}"
     
-    def extract_links_from_page(self, html: str) -> List[str]:
+    def count(self, key: str, value: int = 1):
+        """Thread-safe increment of a stats counter."""
+        with self._stats_lock:
+            self.stats[key] += value
+    
+    def extract_links_from_page(self, html: str, page_url: str = DEFAULT_BASE_URL) -> list[str]:
         """Extract property links from search results page."""
         try:
-            soup = BeautifulSoup(html, "lxml")
-            section = soup.select_one("[aria-label='Properties']")
-            if not section:
-                return []
-            
-            links = []
-            for a in section.select("[data-testid='property-card-link']"):
-                if a.has_attr("href"):
-                    href = a["href"]
-                    if not href.startswith("http"):
-                        href = f"https://www.propertyfinder.ae{href}"
-                    links.append(href)
-            
-            return links
-            
+            return parse_links(html, page_url)
         except Exception as e:
             self.logger.error(f"Error extracting links: {e}")
             return []
     
-    def extract_property_data(self, html: str, url: str) -> Optional[Dict]:
+    def extract_property_data(self, html: str, url: str) -> dict | None:
         """Extract property data from individual property page."""
-        try:
-            soup = BeautifulSoup(html, "lxml")
-            script = soup.body.find("script")
-            if not script or not script.string:
-                return None
-            
-            text = script.string
-            idx = text.find("{")
-            if idx < 0:
-                return None
-            
-            json_data = json.loads(text[idx:])
-            return self.transform_property(json_data, url)
-            
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON decode error for {url}: {e}")
-            return None
-        except Exception as e:
-            self.logger.error(f"Error extracting property data from {url}: {e}")
-            return None
+        data, error = parse_property(html, url)
+        if error:
+            self.logger.error(error)
+        return data
     
-    def transform_property(self, data: Dict, url: str) -> Optional[Dict]:
+    def transform_property(self, data: dict, url: str) -> dict | None:
         """Transform raw property data to structured format."""
-        try:
-            prop = (
-                data.get("props", {})
-                .get("pageProps", {})
-                .get("propertyResult", {})
-                .get("property", {})
-            )
-
-            if not prop:
-                return None
-
-            # Extract basic details with safe access
-            property_data = {
-                "id": prop.get("id"),
-                "url": url,
-                "title": prop.get("title"),
-                "displayAddress": prop.get("location", {}).get("full_name"),
-                "bedrooms": prop.get("bedrooms"),
-                "bathrooms": prop.get("bathrooms"),
-                "addedOn": prop.get("listed_date"),
-                "broker": prop.get("broker", {}).get("name"),
-                "agent": prop.get("agent", {}).get("name"),
-                "verified": bool(prop.get("is_verified")),
-                "reference": prop.get("reference"),
-                "brokerLicenseNumber": prop.get("broker", {}).get("license_number"),
-                "priceDuration": "rent" if prop.get("isRent") else "sell",
-                "propertyType": prop.get("property_type"),
-                "price": prop.get("price", {}).get("value"),
-                "priceCurrency": prop.get("price", {}).get("currency"),
-                "coordinates": {
-                    "latitude": prop.get("location", {}).get("coordinates", {}).get("lat"),
-                    "longitude": prop.get("location", {}).get("coordinates", {}).get("lon"),
-                },
-                "size": f"{prop.get('size', {}).get('value', '')} {prop.get('size', {}).get('unit', '')}".strip(),
-                "furnishing": prop.get("furnished", "NO").upper(),
-                "features": [a.get("name") for a in prop.get("amenities", []) if a.get("name")],
-                "description": prop.get("description"),
-                "images": [
-                    img.get("full") for img in prop.get("images", {}).get("property", [])
-                    if img.get("full")
-                ],
-                "scraped_at": datetime.datetime.now().isoformat(),
-            }
-
-            # Validate required fields
-            if not property_data.get("id") or not property_data.get("title"):
-                self.logger.warning(f"Missing required fields for {url}")
-                return None
-
-            return property_data
-
-        except Exception as e:
-            self.logger.error(f"Error transforming property data: {e}")
-            return None
+        data, error = transform_property(data, url)
+        if error:
+            self.logger.warning(error)
+        return data
     
-    def save_incremental(self, properties: List[Dict], batch_num: int):
+    def save_incremental(self, properties: list[dict], batch_num: int):
         """Save properties incrementally to avoid data loss."""
         if not properties:
             return
@@ -296,80 +355,114 @@ class PropertyFinderScraper:
         except Exception as e:
             self.logger.error(f"Error saving batch {batch_num}: {e}")
     
-    def scrape_properties(self, start_page: int, end_page: int, sleep_time: int = 2) -> Dict:
-        """Main scraping method with comprehensive error handling."""
-        base_url = "https://www.propertyfinder.ae/en/search?l=1&c=2&t=1&fu=0&rp=y&ob=nd&page=220"
-        
-        self.logger.info(f"Starting scrape: pages {start_page}-{end_page}, sleep={sleep_time}s")
-        
+    def parse_pool(self):
+        """Process pool for HTML parsing; no pool (None) when parse_workers == 0."""
+        if self.parse_workers == 0:
+            return nullcontext()
+        return ProcessPoolExecutor(self.parse_workers)
+    
+    def fetch_and_parse(self, url: str, parser: Callable, parsers):
+        """
+        Fetches `url` (rate limited) and returns parser(html, url), run in the
+        `parsers` pool or inline in the fetch thread when it is None; None if
+        the fetch failed.
+        """
+        response = self.safe_request(url)
+        if not response:
+            return None
+        if parsers is None:
+            return parser(response.text, url)
+        return parsers.submit(parser, response.text, url).result()
+    
+    def collect_links(self, start_page: int, end_page: int, fetchers, parsers) -> list[str]:
+        """Phase 1: links of the search pages, fetched `concurrency` pages at a time."""
         all_links = set()
-        all_properties = []
-        
-        # Phase 1: Collect all property links
-        for page in range(start_page, end_page + 1):
-            url = self.build_page_url(base_url, page)
-            self.logger.info(f"Processing page {page}/{end_page}: {url}")
-            
-            response = self.safe_request(url)
-            if not response:
-                self.logger.error(f"Failed to fetch page {page}")
-                continue
-            
-            links = self.extract_links_from_page(response.text)
-            if not links:
-                self.logger.warning(f"No links found on page {page}")
-                if page > start_page + 5:  # Allow some pages without results, then stop
-                    self.logger.info("Multiple pages without results, stopping link collection")
-                    break
-                continue
-            
-            all_links.update(links)
-            self.stats['pages_processed'] += 1
-            self.stats['links_found'] += len(links)
-            
-            self.logger.info(f"Found {len(links)} links on page {page}, total unique: {len(all_links)}")
-            
-            time.sleep(sleep_time)
-        
-        # Phase 2: Process all property pages
-        self.logger.info(f"Starting to process {len(all_links)} property pages...")
+        pages = list(range(start_page, end_page + 1))
+        for window_start in range(0, len(pages), self.concurrency):
+            window = pages[window_start : window_start + self.concurrency]
+            urls = [self.build_page_url(self.base_url, page) for page in window]
+            results = fetchers.map(lambda url: self.fetch_and_parse(url, parse_links, parsers), urls)
+            stop = False
+            for page, url, links in zip(window, urls, results, strict=True):
+                self.logger.info(f"Processed page {page}/{end_page}: {url}")
+                if links is None:
+                    self.logger.error(f"Failed to fetch page {page}")
+                    continue
+                if not links:
+                    self.logger.warning(f"No links found on page {page}")
+                    if page > start_page + 5:  # Allow some pages without results, then stop
+                        self.logger.info("Multiple pages without results, stopping link collection")
+                        stop = True
+                        break
+                    continue
+                
+                all_links.update(links)
+                self.count('pages_processed')
+                self.count('links_found', len(links))
+                
+                self.logger.info(f"Found {len(links)} links on page {page}, total unique: {len(all_links)}")
+            if stop:
+                break
+        return sorted(all_links)
+    
+    def fetch_properties(self, links: list[str], fetchers, parsers, batch_size: int = 50) -> list[dict]:
+        """Phase 2: property pages of `links`, saved in batches as they complete; returns them in `links` order."""
+        self.logger.info(f"Starting to process {len(links)} property pages...")
         
-        batch_size = 50
+        futures = {
+            fetchers.submit(self.fetch_and_parse, link, parse_property, parsers): idx
+            for idx, link in enumerate(links)
+        }
+        results = {}
         batch_properties = []
         batch_num = 1
         
-        for idx, link in enumerate(sorted(all_links), 1):
-            self.logger.debug(f"Processing property {idx}/{len(all_links)}: {link}")
-            
-            response = self.safe_request(link)
-            if not response:
-                self.stats['errors'] += 1
+        for done, future in enumerate(as_completed(futures), 1):
+            outcome = future.result()
+            if outcome is None:
+                self.count('errors')
                 continue
             
-            property_data = self.extract_property_data(response.text, link)
+            property_data, error = outcome
             if property_data:
+                results[futures[future]] = property_data
                 batch_properties.append(property_data)
-                all_properties.append(property_data)
-                self.stats['properties_processed'] += 1
-                
-                if idx % 10 == 0:
-                    self.logger.info(f"Processed {idx}/{len(all_links)} properties, found {len(all_properties)} valid")
+                self.count('properties_processed')
             else:
-                self.stats['errors'] += 1
+                self.logger.error(error)
+                self.count('errors')
+            
+            if done % 10 == 0:
+                self.logger.info(f"Processed {done}/{len(links)} properties, found {len(results)} valid")
             
             # Save incremental batches
             if len(batch_properties) >= batch_size:
                 self.save_incremental(batch_properties, batch_num)
-                self.stats['properties_saved'] += len(batch_properties)
+                self.count('properties_saved', len(batch_properties))
                 batch_properties = []
                 batch_num += 1
-            
-            time.sleep(sleep_time)
         
         # Save remaining properties
         if batch_properties:
             self.save_incremental(batch_properties, batch_num)
-            self.stats['properties_saved'] += len(batch_properties)
+            self.count('properties_saved', len(batch_properties))
+        
+        return [results[idx] for idx in sorted(results)]
+    
+    def scrape_properties(self, start_page: int, end_page: int, sleep_time: float | None = None) -> dict:
+        """Main scraping method with comprehensive error handling."""
+        if sleep_time:
+            # старый режим --sleep: не больше одного запроса в sleep_time секунд
+            self.limiter = TokenBucket(1 / sleep_time, capacity=1)
+        
+        self.logger.info(
+            f"Starting scrape: pages {start_page}-{end_page}, "
+            f"concurrency={self.concurrency}, rate={self.limiter.rate:g}/s"
+        )
+        
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="pf-fetch") as fetchers, self.parse_pool() as parsers:
+            links = self.collect_links(start_page, end_page, fetchers, parsers)
+            all_properties = self.fetch_properties(links, fetchers, parsers)
         
         # Save final consolidated file
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -397,9 +490,33 @@ class Command(BaseCommand):
         parser.add_argument("end_value", type=int, help="Page end value")
         parser.add_argument(
             "--sleep",
+            type=float,
+            default=None,
+            help="Legacy pacing: at most one request per SLEEP seconds (overrides --rate)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help="Number of parallel fetches (and keep-alive connections)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=DEFAULT_RATE,
+            help="Maximum requests per second for the whole crawl",
+        )
+        parser.add_argument(
+            "--parse-workers",
             type=int,
-            default=2,
-            help="Sleep time between requests in seconds",
+            default=None,
+            help="HTML parsing processes (default: CPU count, 0: parse in the fetch threads)",
+        )
+        parser.add_argument(
+            "--base-url",
+            type=str,
+            default=DEFAULT_BASE_URL,
+            help="Search results URL (the page parameter is replaced)",
         )
         parser.add_argument(
             "--output-dir",
@@ -424,21 +541,31 @@ class Command(BaseCommand):
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"🚀 Starting enhanced PropertyFinder scraper"
+                "🚀 Starting enhanced PropertyFinder scraper"
             )
         )
         self.stdout.write(f"📄 Pages: {start_value} - {end_value}")
-        self.stdout.write(f"⏱️ Sleep time: {sleep_time}s")
+        if sleep_time:
+            self.stdout.write(f"⏱️ Sleep time: {sleep_time}s")
+        else:
+            self.stdout.write(f"⏱️ Concurrency: {options['concurrency']}, rate: {options['rate']}/s")
         self.stdout.write(f"📁 Output directory: {output_dir}")
         self.stdout.write(f"📝 Log level: {log_level}")
 
-        scraper = PropertyFinderScraper(output_dir=output_dir, log_level=log_level)
+        scraper = PropertyFinderScraper(
+            output_dir=output_dir,
+            log_level=log_level,
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            parse_workers=options["parse_workers"],
+            base_url=options["base_url"],
+        )
         
         try:
             result = scraper.scrape_properties(start_value, end_value, sleep_time)
             
             self.stdout.write(
-                self.style.SUCCESS(f"✅ Scraping completed successfully!")
+                self.style.SUCCESS("✅ Scraping completed successfully!")
             )
             self.stdout.write(f"📊 Properties processed: {result['properties_count']}")
             self.stdout.write(f"📁 Final file: {result['final_file']}")
@@ -0,0 +1,346 @@
+"""
+Map data of the building maps (map_views.py): only what is visible, in as
+few bytes as possible.
+
+  - bbox filtering: ``in_bbox()`` turns ``minLon,minLat,maxLon,maxLat`` into
+    latitude / longitude range filters (main.Building has an index on them);
+  - clustering by zoom level: points are grouped on a grid of CELL_PX screen
+    pixels in Web Mercator; a cell with several buildings becomes one
+    cluster feature (``point_count``), a lone building stays a building
+    feature. From CLUSTER_MAX_ZOOM on nothing is clustered;
+  - tiles: ``/z/x/y`` is the standard slippy-map tile. 256 is a multiple of
+    CELL_PX, so clusters never cross tile edges and a tile is complete on
+    its own. Tiles are cached precompressed (gzip, and brotli when the
+    ``brotli`` package of whitenoise[brotli] is installed) and served with
+    an ETag.
+
+Area overlays are built once, when pf_area imports the polygons
+(``build_area_blobs``): every Area.geometry_json is simplified with
+Douglas-Peucker for each of AREA_ZOOM_LEVELS (tolerance AREA_TOLERANCE_PX
+screen pixels) and stored precompressed in AreaGeometryBlob. ``area_blob``
+keeps the blobs in the Django cache, so with a real cache backend repeat
+visits cost no query (and a 304 when the ETag still matches).
+
+Only the columns the features need are read, the project / area names
+through joins (no query per building).
+"""
+
+import gzip
+import hashlib
+import json
+import math
+
+import numpy as np
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .spatial import simplify
+
+try:
+    import brotli
+except ImportError:  # только gzip
+    brotli = None
+
+TILE_SIZE = 256
+CELL_PX = 64  # сторона ячейки кластеризации в пикселях экрана
+MAX_ZOOM = 22
+CLUSTER_MAX_ZOOM = 17  # с этого зума точки не кластеризуются
+TILE_CACHE_TIMEOUT = 3600
+MAX_LATITUDE = 85.0511287798  # предел Web Mercator
+AREA_ZOOM_LEVELS = (8, 10, 12, 14)
+AREA_TOLERANCE_PX = 1.0
+
+Bbox = tuple[float, float, float, float]
+
+BUILDING_COLUMNS = (
+    "id",
+    "longitude",
+    "latitude",
+    "english_name",
+    "number",
+    "project__english_name",
+    "area_by_pf__name",
+    "property_type",
+    "floor_count",
+    "total_units",
+)
+
+
+def parse_bbox(value: str) -> Bbox:
+    """``minLon,minLat,maxLon,maxLat`` → tuple; ValueError when malformed."""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or not all(map(math.isfinite, parts)):
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox min must not exceed max")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def in_bbox(qs, bbox: Bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return qs.filter(
+        latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon)
+    )
+
+
+def tile_bbox(z: int, x: int, y: int) -> Bbox:
+    """Bounds of the Web Mercator tile z/x/y."""
+    n = 2**z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def _mercator(lons: np.ndarray, lats: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Web Mercator world coordinates in [0, 1)."""
+    lats = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    mx = (lons + 180.0) / 360.0
+    my = (1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0
+    return mx, my
+
+
+def building_feature(row) -> dict:
+    pk, lon, lat, name, number, project, area, ptype, floors, units = row
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "properties": {
+            "id": pk,
+            "name": name or number or f"B {pk}",
+            "project": project or "",
+            "area": area or "",
+            "property_type": ptype,
+            "floor_count": floors,
+            "total_units": units,
+        },
+    }
+
+
+def building_features(qs) -> list[dict]:
+    return [
+        building_feature(row)
+        for row in qs.order_by("pk").values_list(*BUILDING_COLUMNS).iterator()
+    ]
+
+
+def clustered_features(qs, zoom: int, tile: tuple[int, int] | None = None):
+    """
+    Features of `qs` at `zoom`: clusters of the CELL_PX grid plus the
+    buildings alone in their cell. With `tile` = (x, y) only the points of
+    that tile are kept (the bbox filter includes its edges).
+    """
+    if zoom >= CLUSTER_MAX_ZOOM and tile is None:
+        return building_features(qs)
+    rows = list(qs.order_by("pk").values_list("id", "longitude", "latitude"))
+    if not rows:
+        return []
+    ids, lons, lats = (np.array(column) for column in zip(*rows, strict=True))
+    lons = lons.astype(np.float64)
+    lats = lats.astype(np.float64)
+    mx, my = _mercator(lons, lats)
+    scale = 2**zoom
+    if tile is not None:
+        keep = (np.floor(mx * scale) == tile[0]) & (np.floor(my * scale) == tile[1])
+        ids, lons, lats, mx, my = ids[keep], lons[keep], lats[keep], mx[keep], my[keep]
+        if zoom >= CLUSTER_MAX_ZOOM:
+            return building_features(qs.filter(pk__in=ids.tolist()))
+
+    cells_per_world = scale * (TILE_SIZE // CELL_PX)
+    cell_x = np.floor(mx * cells_per_world).astype(np.int64)
+    cell_y = np.floor(my * cells_per_world).astype(np.int64)
+    keys = cell_x * cells_per_world + cell_y
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    alone = counts[inverse] == 1
+
+    features = building_features(qs.filter(pk__in=ids[alone].tolist()))
+    mean_lon = np.bincount(inverse, weights=lons) / counts
+    mean_lat = np.bincount(inverse, weights=lats) / counts
+    for cell in np.flatnonzero(counts > 1):
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [float(mean_lon[cell]), float(mean_lat[cell])],
+                },
+                "properties": {"cluster": True, "point_count": int(counts[cell])},
+            }
+        )
+    return features
+
+
+def feature_collection(features) -> bytes:
+    return json.dumps(
+        {"type": "FeatureCollection", "features": features},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def precompress(payload: bytes) -> dict[str, object]:
+    """ETag + gzip (+ brotli) variants of `payload`, ready for the cache."""
+    variants = {
+        "etag": f'"{hashlib.md5(payload).hexdigest()}"',
+        "gzip": gzip.compress(payload, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        variants["br"] = brotli.compress(payload)
+    return variants
+
+
+def accepted_encodings(header: str) -> dict[str, float]:
+    """{content-coding: q} of an Accept-Encoding header (q defaults to 1)."""
+    accepted = {}
+    for item in header.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def precompressed_response(
+    request, variants, content_type: str, max_age: int = TILE_CACHE_TIMEOUT
+):
+    """
+    Response with the best variant the client accepts (br, gzip, identity)
+    or 304 when its If-None-Match is still current.
+    """
+    etag = variants["etag"]
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        wildcard = accepted.get("*", 0.0)
+        # при равном q — br, затем gzip; q=0 означает «нельзя»
+        weights = {
+            name: accepted.get(name, wildcard)
+            for name in ("br", "gzip")
+            if name in variants
+        }
+        encoding = max(weights, key=weights.get, default=None)
+        if encoding and weights[encoding] <= 0:
+            encoding = None
+        if encoding:
+            response = HttpResponse(variants[encoding], content_type=content_type)
+            response["Content-Encoding"] = encoding
+        else:
+            body = gzip.decompress(variants["gzip"])
+            response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = f"public, max-age={max_age}"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def building_tile(qs, z: int, x: int, y: int, cache_key: str) -> dict[str, object]:
+    """Precompressed GeoJSON of tile z/x/y of `qs`, cached for TILE_CACHE_TIMEOUT."""
+    variants = cache.get(cache_key)
+    if variants is None:
+        features = clustered_features(in_bbox(qs, tile_bbox(z, x, y)), z, (x, y))
+        variants = precompress(feature_collection(features))
+        cache.set(cache_key, variants, TILE_CACHE_TIMEOUT)
+    return variants
+
+
+def area_zoom_level(zoom: int) -> int:
+    """The AREA_ZOOM_LEVELS entry used at `zoom` (the closest one not above it)."""
+    below = [level for level in AREA_ZOOM_LEVELS if level <= zoom]
+    return below[-1] if below else AREA_ZOOM_LEVELS[0]
+
+
+def area_tolerance(level: int) -> float:
+    """AREA_TOLERANCE_PX screen pixels in degrees of longitude at `level`."""
+    return 360.0 / (TILE_SIZE * 2**level) * AREA_TOLERANCE_PX
+
+
+def _area_cache_key(level: int) -> str:
+    return f"pfimport:areas:{level}"
+
+
+def area_features(rows, tolerance: float | None = None) -> list[dict]:
+    """Features of (id, name, geometry_json) rows, simplified when `tolerance` is set."""
+    features = []
+    for pk, name, geometry in rows:
+        if tolerance is not None:
+            geometry = simplify(geometry, tolerance)
+        if geometry:
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": {"id": pk, "name": name},
+                }
+            )
+    return features
+
+
+def build_area_blobs() -> dict[int, int]:
+    """
+    Rebuilds the AreaGeometryBlob of every AREA_ZOOM_LEVELS entry from
+    Area.geometry_json and drops the cached copies. Needs shapely.
+    Returns {zoom level: compressed size}.
+    """
+    from .models import Area
+    from .models import AreaGeometryBlob
+
+    rows = list(
+        Area.objects.exclude(geometry_json=None)
+        .order_by("pk")
+        .values_list("id", "name", "geometry_json")
+    )
+    sizes = {}
+    for level in AREA_ZOOM_LEVELS:
+        features = area_features(rows, area_tolerance(level))
+        payload = feature_collection(features)
+        variants = precompress(payload)
+        AreaGeometryBlob.objects.update_or_create(
+            zoom=level,
+            defaults={
+                "etag": variants["etag"],
+                "gzip": variants["gzip"],
+                "brotli": variants.get("br"),
+                "area_count": len(features),
+                "size": len(payload),
+            },
+        )
+        sizes[level] = len(variants["gzip"])
+    AreaGeometryBlob.objects.exclude(zoom__in=AREA_ZOOM_LEVELS).delete()
+    cache.delete_many([_area_cache_key(level) for level in AREA_ZOOM_LEVELS])
+    return sizes
+
+
+def area_blob(level: int) -> dict[str, object] | None:
+    """Precompressed area overlay of `level` (cache, then DB); None when not built."""
+    key = _area_cache_key(level)
+    variants = cache.get(key)
+    if variants is None:
+        from .models import AreaGeometryBlob
+
+        blob = AreaGeometryBlob.objects.filter(zoom=level).first()
+        if blob is None:
+            return None
+        variants = {"etag": blob.etag, "gzip": bytes(blob.gzip)}
+        if blob.brotli:
+            variants["br"] = bytes(blob.brotli)
+        # без таймаута: build_area_blobs сбрасывает кэш сам
+        cache.set(key, variants, None)
+    return variants
@@ -1,7 +1,25 @@
+import hashlib
+
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.http import HttpResponse
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_POST
 
+from .map_tiles import AREA_ZOOM_LEVELS
+from .map_tiles import MAX_ZOOM
+from .map_tiles import area_blob
+from .map_tiles import area_features
+from .map_tiles import area_zoom_level
+from .map_tiles import building_features
+from .map_tiles import building_tile
+from .map_tiles import clustered_features
+from .map_tiles import feature_collection
+from .map_tiles import in_bbox
+from .map_tiles import parse_bbox
+from .map_tiles import precompress
+from .map_tiles import precompressed_response
+from .map_tiles import valid_tile
 from .models import Area as PfArea, Building as PfBuilding
 from realty.main.models import Area as MainArea, MasterProject, Building as MainBuilding
 
@@ -25,8 +43,10 @@ def pf_buildings_json(request):
     area_id = request.GET.get("area_id")
     if not area_id:
         return JsonResponse({"pf": []})
-    qs = PfBuilding.objects.filter(area_id=area_id).exclude(
-        latitude__isnull=True, longitude__isnull=True
+    qs = (
+        PfBuilding.objects.filter(area_id=area_id)
+        .exclude(latitude__isnull=True, longitude__isnull=True)
+        .select_related("area")
     )
     data = {
         "pf": [
@@ -42,10 +62,12 @@ def main_buildings_json(request):
     master_id = request.GET.get("master_project_id")
     qs = MainBuilding.objects.none()
     if master_id:
-        qs = MainBuilding.objects.filter(building__project__master_project_id=master_id)
+        qs = MainBuilding.objects.filter(project__master_project_id=master_id)
     elif area_id:
         qs = MainBuilding.objects.filter(area_id=area_id)
-    qs = qs.exclude(latitude__isnull=True, longitude__isnull=True)
+    qs = qs.exclude(latitude__isnull=True, longitude__isnull=True).select_related(
+        "project__master_project"
+    )
     data = {
         "main": [
             {
@@ -80,7 +102,6 @@ def link_buildings(request):
 
 
 # main/views.py
-import json
 from django.shortcuts import render
 from realty.main.models import Building
 from realty.pfimport.models import Area
@@ -89,56 +110,20 @@ from realty.pfimport.models import Area
 def buildings_map(request):
     """
     Карта со всеми Building (точки) + полигоны pfimport.Area.
+    Ни точки, ни полигоны не встраиваются в страницу: карта грузит видимые
+    тайлы (buildings_tile) с кластерами по зуму и готовые упрощённые
+    полигоны районов (areas_geojson).
     """
-    # --- точки --------------------------------------------------------------
-    bqs = Building.objects.select_related("project", "area_by_pf").filter(
-        latitude__isnull=False, longitude__isnull=False
-    )
-
-    building_features = [
-        {
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [b.longitude, b.latitude],
-            },
-            "properties": {
-                "name": b.english_name or b.number or f"Building #{b.pk}",
-                "project": b.project.english_name or b.project.project_number,
-                "area": b.area_by_pf.name if b.area_by_pf else "—",
-            },
-        }
-        for b in bqs
-    ]
-
-    # --- полигоны районов ----------------------------------------------------
-    # берём все, у кого сохранена geometry_json
-    areas_qs = Area.objects.exclude(geometry_json=None)
-
-    area_features = [
-        {
-            "type": "Feature",
-            "geometry": a.geometry_json,
-            "properties": {"name": a.name},
-        }
-        for a in areas_qs
-    ]
-
     context = {
-        "buildings_geojson": json.dumps(
-            {"type": "FeatureCollection", "features": building_features}
-        ),
-        "areas_geojson": json.dumps(
-            {"type": "FeatureCollection", "features": area_features}
-        ),
+        # относительно map3/ — работает при любом префиксе pfimport.urls
+        "buildings_tile_url": "../api/buildings/tiles/{z}/{x}/{y}.geojson",
+        "areas_geojson_url": "../api/areas.geojson",
     }
     return render(request, "pfimport/map3.html", context)
 
 
 # ─── ДОБАВЬТЕ в конец файла ──────────────────────────────────────────────────
-import json
-from django.http import JsonResponse
-from django.db.models import Q
+GEOJSON = "application/geo+json"
 
 
 def _apply_building_filters(qs, params):
@@ -195,30 +180,56 @@ def buildings_geojson(request):
     """
     API‑эндпоинт: GeoJSON всех (или отфильтрованных) Building.
     Пример: /api/buildings.geojson?property_type=Residential&min_floor=10
+    ?bbox=minLon,minLat,maxLon,maxLat — только точки в прямоугольнике,
+    ?zoom=N — кластеры для этого зума (см. map_tiles).
+    """
+    qs = Building.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    qs = _apply_building_filters(qs, request.GET)
+    try:
+        if request.GET.get("bbox"):
+            qs = in_bbox(qs, parse_bbox(request.GET["bbox"]))
+        zoom = request.GET.get("zoom")
+        zoom = min(max(int(zoom), 0), MAX_ZOOM) if zoom else None
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    if zoom is None:
+        features = building_features(qs)
+    else:
+        features = clustered_features(qs, zoom)
+    return HttpResponse(feature_collection(features), content_type=GEOJSON)
+
+
+def buildings_tile(request, z, x, y):
     """
+    Тайл z/x/y карты зданий: GeoJSON с кластерами, кэш + gzip/brotli + ETag.
+    Фильтры те же, что у buildings_geojson.
+    """
+    if not valid_tile(z, x, y):
+        raise Http404("tile out of range")
     qs = Building.objects.filter(latitude__isnull=False, longitude__isnull=False)
     qs = _apply_building_filters(qs, request.GET)
+    params = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    variants = building_tile(qs, z, x, y, f"pfimport:tile:{z}:{x}:{y}:{params}")
+    return precompressed_response(request, variants, GEOJSON)
 
-    features = [
-        {
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [b.longitude, b.latitude],
-            },
-            "properties": {
-                "name": b.english_name or b.number or f"B {b.pk}",
-                "project": b.project.english_name if b.project else "",
-                "area": b.area_by_pf.name if b.area_by_pf else "",
-                # — можете добавить больше свойств —
-                "property_type": b.property_type,
-                "floor_count": b.floor_count,
-                "total_units": b.total_units,
-            },
-        }
-        for b in qs
-    ]
-    return JsonResponse(
-        {"type": "FeatureCollection", "features": features},
-        json_dumps_params={"ensure_ascii": False},
-    )
+
+def areas_geojson(request):
+    """
+    Полигоны районов, упрощённые для ?zoom=N (см. map_tiles.AREA_ZOOM_LEVELS):
+    готовые gzip/brotli-блобы из pf_area, ETag / 304.
+    Пока блобы не построены — полные полигоны, без кэша.
+    """
+    try:
+        zoom = int(request.GET.get("zoom", AREA_ZOOM_LEVELS[-1]))
+    except ValueError:
+        return HttpResponseBadRequest("zoom must be an integer")
+    variants = area_blob(area_zoom_level(zoom))
+    if variants is None:
+        rows = (
+            Area.objects.exclude(geometry_json=None)
+            .order_by("pk")
+            .values_list("id", "name", "geometry_json")
+        )
+        variants = precompress(feature_collection(area_features(rows)))
+    return precompressed_response(request, variants, GEOJSON)
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:12
+
+import django.db.models.deletion
+import statistics
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 500
+BEDROOM_KEYS = {
+    "studio": "studio",
+    "0": "studio",
+    "1": "1br",
+    "2": "2br",
+    "3": "3br",
+    "4": "4br",
+}
+
+
+def bedroom_key(value):
+    if not value:
+        return "studio"
+    return BEDROOM_KEYS.get(str(value).lower().strip(), "4br")
+
+
+def summarize(values):
+    prices = [price for price, _ in values]
+    total = sum(prices)
+    return {
+        "count": len(prices),
+        "sum_price": total,
+        "sum_price_sq": sum(float(price) ** 2 for price in prices),
+        "min_price": min(prices),
+        "max_price": max(prices),
+        "avg_price": float(total) / len(prices),
+        "median_price": float(statistics.median(prices)),
+        "sum_exposure_days": sum(days for _, days in values),
+    }
+
+
+def backfill_stats(apps, schema_editor):
+    Stats = apps.get_model("pfimport", "PFBuildingBedroomStats")
+    listing_models = (
+        ("sale", apps.get_model("pfimport", "PFListSale")),
+        ("rent", apps.get_model("pfimport", "PFListRent")),
+    )
+    ids = set()
+    for _, model in listing_models:
+        ids.update(
+            model.objects.exclude(building_id__isnull=True)
+            .values_list("building_id", flat=True)
+            .distinct()
+        )
+    ids = sorted(ids)
+    today = timezone.now().date()
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start : start + BATCH_SIZE]
+        grouped = defaultdict(list)
+        for listing_type, model in listing_models:
+            for b_id, bedrooms, price, added_on in (
+                model.objects.filter(building_id__in=batch, price__gt=0)
+                .values_list("building_id", "bedrooms", "price", "added_on")
+                .iterator()
+            ):
+                days = max((today - added_on.date()).days, 0) if added_on else 0
+                key = (b_id, bedroom_key(bedrooms), listing_type)
+                grouped[key].append((price, days))
+
+        summaries = {key: summarize(values) for key, values in grouped.items()}
+        rows = []
+        for (b_id, bedrooms, listing_type), fields in summaries.items():
+            rent = summaries.get((b_id, bedrooms, "rent"))
+            sale = summaries.get((b_id, bedrooms, "sale"))
+            rows.append(
+                Stats(
+                    building_id=b_id,
+                    bedrooms=bedrooms,
+                    listing_type=listing_type,
+                    roi=rent["avg_price"] / sale["avg_price"] if rent and sale else None,
+                    **fields,
+                )
+            )
+        Stats.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pfimport', '0011_pflistrent_building_avg_roi_pflistrent_roi_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PFBuildingBedroomStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bedrooms', models.CharField(max_length=10)),
+                ('listing_type', models.CharField(choices=[('sale', 'Sale'), ('rent', 'Rent')], max_length=4)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sum_price', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=18)),
+                ('sum_price_sq', models.FloatField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('avg_price', models.FloatField(blank=True, null=True)),
+                ('median_price', models.FloatField(blank=True, null=True)),
+                ('sum_exposure_days', models.PositiveIntegerField(default=0)),
+                ('roi', models.FloatField(blank=True, help_text='Средняя аренда / средняя цена продажи тех же спален в здании', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bedroom_stats', to='pfimport.building')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing_type', 'bedrooms', 'roi'], name='pfimport_pf_listing_c4cf49_idx'), models.Index(fields=['listing_type', 'roi'], name='pfimport_pf_listing_6df9e4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('building', 'bedrooms', 'listing_type'), name='unique_pf_building_bedroom_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
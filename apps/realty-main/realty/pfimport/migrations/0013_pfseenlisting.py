@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pfimport', '0012_pfbuildingbedroomstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PFSeenListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=500, unique=True)),
+                ('listing_id', models.CharField(blank=True, default='', max_length=50)),
+                ('card_hash', models.CharField(blank=True, default='', help_text='Отпечаток карточки в выдаче', max_length=32)),
+                ('content_hash', models.CharField(blank=True, default='', help_text='Отпечаток данных объявления', max_length=32)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('last_modified', models.CharField(blank=True, default='', max_length=64)),
+                ('last_seen', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
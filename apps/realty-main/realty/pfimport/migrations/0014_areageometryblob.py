@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pfimport', '0013_pfseenlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AreaGeometryBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField(unique=True)),
+                ('etag', models.CharField(max_length=64)),
+                ('gzip', models.BinaryField()),
+                ('brotli', models.BinaryField(blank=True, null=True)),
+                ('area_count', models.PositiveIntegerField(default=0)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Несжатый размер, байт')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,5 @@
 # -------------------------------- pfimport/models.py --------------------------------
-import datetime, json, logging, shlex, tempfile, gc
+import logging, shlex, tempfile, gc
 from decimal import Decimal
 from io import StringIO
 from pathlib import Path
@@ -336,6 +336,24 @@ class Area(models.Model):
         return None
 
 
+class AreaGeometryBlob(models.Model):
+    """
+    FeatureCollection of all Area polygons simplified for one zoom level,
+    precompressed for the map (pfimport.map_tiles, rebuilt by pf_area).
+    """
+
+    zoom = models.PositiveSmallIntegerField(unique=True)
+    etag = models.CharField(max_length=64)
+    gzip = models.BinaryField()
+    brotli = models.BinaryField(blank=True, null=True)
+    area_count = models.PositiveIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0, help_text="Несжатый размер, байт")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Areas z{self.zoom} ({self.area_count})"
+
+
 # ─────────────────────────────── Building ─────────────────────────────────────
 class Building(models.Model):
     """Жилой дом / комплекс (address1)"""
@@ -455,6 +473,54 @@ class Building(models.Model):
         return self._avg(self.sale_sum_4br, self.sale_count_4br)
 
 
+
+class PFBuildingBedroomStats(models.Model):
+    """
+    Агрегаты PF-объявлений здания в длинном формате: строка на
+    (здание, спальни, тип объявления). Пересчитываются из самих объявлений
+    (см. bedroom_stats.py) для зданий, затронутых импортом.
+    """
+
+    LISTING_TYPES = [("sale", "Sale"), ("rent", "Rent")]
+
+    building = models.ForeignKey(
+        Building, on_delete=models.CASCADE, related_name="bedroom_stats"
+    )
+    bedrooms = models.CharField(max_length=10)  # studio / 1br / 2br / 3br / 4br (4+)
+    listing_type = models.CharField(max_length=4, choices=LISTING_TYPES)
+
+    count = models.PositiveIntegerField(default=0)
+    sum_price = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal("0"))
+    sum_price_sq = models.FloatField(default=0)
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    avg_price = models.FloatField(blank=True, null=True)
+    median_price = models.FloatField(blank=True, null=True)
+    sum_exposure_days = models.PositiveIntegerField(default=0)
+    roi = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Средняя аренда / средняя цена продажи тех же спален в здании",
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["building", "bedrooms", "listing_type"],
+                name="unique_pf_building_bedroom_stats",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["listing_type", "bedrooms", "roi"]),
+            models.Index(fields=["listing_type", "roi"]),
+        ]
+
+    def __str__(self):
+        return f"{self.building_id} {self.bedrooms} {self.listing_type}: {self.count}"
+
+
 from django.utils.html import format_html
 
 
@@ -566,6 +632,28 @@ class PFListRent(PFBase):
         )
 
 
+class PFSeenListing(models.Model):
+    """
+    Seen-index of the incremental scrape (scrape_properties --incremental):
+    what the crawler last saw for a property page URL.
+    """
+
+    url = models.CharField(max_length=500, unique=True)
+    listing_id = models.CharField(max_length=50, blank=True, default="")
+    card_hash = models.CharField(
+        max_length=32, blank=True, default="", help_text="Отпечаток карточки в выдаче"
+    )
+    content_hash = models.CharField(
+        max_length=32, blank=True, default="", help_text="Отпечаток данных объявления"
+    )
+    etag = models.CharField(max_length=255, blank=True, default="")
+    last_modified = models.CharField(max_length=64, blank=True, default="")
+    last_seen = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.listing_id or self.url
+
+
 # ──────────────────────────────── JSON Upload ─────────────────────────────────
 class PFJsonUpload(models.Model):
     upload_file = models.FileField(upload_to="pfjson")
@@ -614,300 +702,6 @@ class PFJsonUpload(models.Model):
 
     def process_json(self):
         """Разбор загруженного JSON‑файла и сохранение объявлений + обновление агрегатов"""
-        from .models import (
-            PFListSale,
-            PFListRent,
-        )  # локальный импорт во избежание циклов
-
-        file_path = self.upload_file.path
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        today = timezone.now().date()
-        
-        # Подготавливаем списки для bulk операций
-        areas_to_create = []
-        areas_to_update = []
-        buildings_to_create = []
-        buildings_to_update = []
-        listings_to_create = []
-        listings_to_update = []
-        
-        # Кэшируем существующие объекты для избежания повторных запросов
-        existing_areas = {area.name: area for area in Area.objects.all()}
-        existing_buildings = {}
-        for building in Building.objects.select_related('area').all():
-            key = (building.name, building.area_id)
-            existing_buildings[key] = building
-
-        for item in data:
-            listing_id = item.get("id")
-            if not listing_id:
-                continue  # без id бессмысленно
-
-            listing_type_val = item.get(
-                "type"
-            )  # "Residential for Sale" / "Residential for Rent"
-            if listing_type_val not in ("Residential for Sale", "Residential for Rent"):
-                continue
-
-            # фильтр по типу недвижимости (оставляем только квартиры, сравнение без учёта регистра)
-            raw_property_type = (item.get("propertyType") or "").strip()
-            if raw_property_type.lower() != "apartment":
-                continue
-            property_type_str = raw_property_type  # для записи в модель
-
-            # --- дата объявления
-            added_on_str = item.get("addedOn")
-            parsed_added_on = None
-            if added_on_str:
-                try:
-                    parsed_added_on = datetime.datetime.fromisoformat(
-                        added_on_str.replace("Z", "+00:00")
-                    )
-                except ValueError:
-                    parsed_added_on = None
-
-            # координаты
-            coords = item.get("coordinates", {})
-            lat, lng = coords.get("latitude"), coords.get("longitude")
-
-            # площадь
-            size_min_str = item.get("sizeMin") or ""
-            numeric_area_val = None
-            if size_min_str:
-                try:
-                    numeric_area_val = float(size_min_str.split()[0])
-                except Exception:
-                    numeric_area_val = None
-
-            # адрес (building / area)
-            disp_addr = item.get("displayAddress", "")
-            parts = [x.strip() for x in disp_addr.split(",", 3)]
-            while len(parts) < 4:
-                parts.append("")
-            address1, _, address3, _ = parts
-
-            # ---------------- Area ----------------
-            area_obj = None
-            if (
-                address3 and address3 in AREAS_WITH_PROPERTY
-            ):  # Modified this line to check against allowed areas
-                if address3 in existing_areas:
-                    area_obj = existing_areas[address3]
-                    # Обновляем показатели района
-                    if parsed_added_on:
-                        area_obj.sum_number_of_days_for_all_ads += (
-                            today - parsed_added_on.date()
-                        ).days
-                    area_obj.numbers_of_processed_ads += 1
-                    if not area_obj.verified_value:
-                        area_obj.verified_value = (
-                            f"{area_obj.name} ({area_obj.numbers_of_main_page_ads:,})"
-                        )
-                    areas_to_update.append(area_obj)
-                else:
-                    # Создаем новый район
-                    area_obj = Area(
-                        name=address3,
-                        numeric_area=None,
-                        numbers_of_main_page_ads=AREAS_WITH_PROPERTY.get(address3, 0),
-                        sum_number_of_days_for_all_ads=0,
-                        numbers_of_processed_ads=1,
-                        verified_value=f"{address3} ({AREAS_WITH_PROPERTY.get(address3, 0):,})"
-                    )
-                    if parsed_added_on:
-                        area_obj.sum_number_of_days_for_all_ads += (
-                            today - parsed_added_on.date()
-                        ).days
-                    areas_to_create.append(area_obj)
-                    existing_areas[address3] = area_obj
-
-            # ---------------- Building ----------------
-            building_obj = None
-            if address1 and area_obj:
-                building_key = (address1, area_obj.id)
-                if building_key in existing_buildings:
-                    building_obj = existing_buildings[building_key]
-                    # Обновляем существующее здание
-                    if lat is not None and lng is not None:
-                        building_obj.latitude = lat
-                        building_obj.longitude = lng
-                    
-                    # Инкрементируем общее кол-во объявлений
-                    if listing_type_val == "Residential for Rent":
-                        building_obj.numbers_of_processed_rent_ads += 1
-                    else:
-                        building_obj.numbers_of_processed_sale_ads += 1
-                    
-                    # Категория по спальням
-                    bedroom_key = self._normalize_bedroom_key(item.get("bedrooms"))
-                    price_val = item.get("price") or 0
-                    price_val = Decimal(str(price_val))
-                    
-                    # Сколько дней на рынке
-                    days_on_market = 0
-                    if parsed_added_on:
-                        days_on_market = (today - parsed_added_on.date()).days
-                    
-                    # Обновляем счетчики
-                    if listing_type_val == "Residential for Rent":
-                        setattr(
-                            building_obj,
-                            f"rent_count_{bedroom_key}",
-                            getattr(building_obj, f"rent_count_{bedroom_key}") + 1,
-                        )
-                        setattr(
-                            building_obj,
-                            f"rent_sum_{bedroom_key}",
-                            getattr(building_obj, f"rent_sum_{bedroom_key}") + price_val,
-                        )
-                        building_obj.sum_exposure_rent_days += days_on_market
-                    elif listing_type_val == "Residential for Sale":
-                        setattr(
-                            building_obj,
-                            f"sale_count_{bedroom_key}",
-                            getattr(building_obj, f"sale_count_{bedroom_key}") + 1,
-                        )
-                        setattr(
-                            building_obj,
-                            f"sale_sum_{bedroom_key}",
-                            getattr(building_obj, f"sale_sum_{bedroom_key}") + price_val,
-                        )
-                        building_obj.sum_exposure_sale_days += days_on_market
-                    
-                    buildings_to_update.append(building_obj)
-                else:
-                    # Создаем новое здание
-                    building_obj = Building(
-                        name=address1,
-                        area=area_obj,
-                        latitude=lat,
-                        longitude=lng,
-                        numbers_of_processed_rent_ads=1 if listing_type_val == "Residential for Rent" else 0,
-                        numbers_of_processed_sale_ads=1 if listing_type_val == "Residential for Sale" else 0
-                    )
-                    
-                    # Инициализируем счетчики
-                    bedroom_key = self._normalize_bedroom_key(item.get("bedrooms"))
-                    price_val = item.get("price") or 0
-                    price_val = Decimal(str(price_val))
-                    days_on_market = 0
-                    if parsed_added_on:
-                        days_on_market = (today - parsed_added_on.date()).days
-                    
-                    if listing_type_val == "Residential for Rent":
-                        setattr(building_obj, f"rent_count_{bedroom_key}", 1)
-                        setattr(building_obj, f"rent_sum_{bedroom_key}", price_val)
-                        building_obj.sum_exposure_rent_days = days_on_market
-                    elif listing_type_val == "Residential for Sale":
-                        setattr(building_obj, f"sale_count_{bedroom_key}", 1)
-                        setattr(building_obj, f"sale_sum_{bedroom_key}", price_val)
-                        building_obj.sum_exposure_sale_days = days_on_market
-                    
-                    buildings_to_create.append(building_obj)
-                    existing_buildings[building_key] = building_obj
-
-            # ------------------------------------------------------------------
-            # Теперь САМЫЕ ГЛАВНЫЕ изменения — сохраняем само объявление
-            # ------------------------------------------------------------------
-            model_class = (
-                PFListRent if listing_type_val == "Residential for Rent" else PFListSale
-            )
-            price_duration_val = (
-                "rent" if listing_type_val == "Residential for Rent" else "sell"
-            )
+        from .json_import import PFJsonImporter  # локальный импорт во избежание циклов
 
-            # Подготавливаем данные для объявления
-            listing_data = {
-                "area": area_obj,
-                "building": building_obj,
-                # ---- базовые поля --------------------------------------------------
-                "url": _clean_str(item.get("url")),
-                "title": _clean_str(item.get("title")),
-                "display_address": _clean_str(disp_addr),
-                "bedrooms": _clean_str(item.get("bedrooms")),
-                "bathrooms": _clean_str(item.get("bathrooms")),
-                "added_on": parsed_added_on,
-                # ---- агент / брокер ------------------------------------------------
-                "broker": _clean_str(item.get("brokerName")),
-                "agent": _clean_str(item.get("agentName")),
-                "agent_phone": _clean_str(item.get("phone")),
-                "verified": bool(item.get("verified")),
-                "reference": _clean_str(item.get("reference")),
-                "broker_license_number": _clean_str(item.get("brokerLicenseNo")),
-                # ---- типы / цены ---------------------------------------------------
-                "property_type": _clean_str(property_type_str),
-                "price_duration": price_duration_val,
-                "listing_type": listing_type_val,
-                "price": Decimal(str(item.get("price") or 0)),
-                "price_currency": _clean_str(item.get("priceCurrency")),
-                # ---- координаты / площадь -----------------------------------------
-                "latitude": lat,
-                "longitude": lng,
-                "size_min": size_min_str or None,
-                "numeric_area": numeric_area_val,
-                # ---- прочее --------------------------------------------------------
-                "furnishing": _clean_str(item.get("furnishing")),
-                "description": _clean_str(item.get("description")),
-                "description_html": _clean_str(item.get("descriptionHtml")),
-            }
-            
-            # Проверяем, существует ли уже объявление
-            try:
-                existing_listing = model_class.objects.get(listing_id=listing_id)
-                # Обновляем существующее объявление
-                for field, value in listing_data.items():
-                    if value is not None:
-                        setattr(existing_listing, field, value)
-                listings_to_update.append(existing_listing)
-            except model_class.DoesNotExist:
-                # Создаем новое объявление
-                new_listing = model_class(listing_id=listing_id, **listing_data)
-                listings_to_create.append(new_listing)
-
-        # Выполняем bulk операции
-        if areas_to_create:
-            Area.objects.bulk_create(areas_to_create)
-        
-        if areas_to_update:
-            Area.objects.bulk_update(
-                areas_to_update,
-                fields=[
-                    'sum_number_of_days_for_all_ads',
-                    'numbers_of_processed_ads',
-                    'verified_value'
-                ]
-            )
-        
-        if buildings_to_create:
-            Building.objects.bulk_create(buildings_to_create)
-        
-        if buildings_to_update:
-            Building.objects.bulk_update(
-                buildings_to_update,
-                fields=[
-                    'latitude', 'longitude', 'numbers_of_processed_rent_ads',
-                    'numbers_of_processed_sale_ads', 'sum_exposure_rent_days',
-                    'sum_exposure_sale_days'
-                ] + [f'rent_count_{key}' for key in self.BEDROOM_KEYS.values()] +
-                     [f'rent_sum_{key}' for key in self.BEDROOM_KEYS.values()] +
-                     [f'sale_count_{key}' for key in self.BEDROOM_KEYS.values()] +
-                     [f'sale_sum_{key}' for key in self.BEDROOM_KEYS.values()]
-            )
-        
-        if listings_to_create:
-            model_class.objects.bulk_create(listings_to_create)
-        
-        if listings_to_update:
-            model_class.objects.bulk_update(
-                listings_to_update,
-                fields=[
-                    'area', 'building', 'url', 'title', 'display_address',
-                    'bedrooms', 'bathrooms', 'added_on', 'broker', 'agent',
-                    'agent_phone', 'verified', 'reference', 'broker_license_number',
-                    'property_type', 'price_duration', 'listing_type', 'price',
-                    'price_currency', 'latitude', 'longitude', 'size_min',
-                    'numeric_area', 'furnishing', 'description', 'description_html'
-                ]
-            )
+        return PFJsonImporter(self.upload_file.path).run()
@@ -0,0 +1,130 @@
+"""
+Seen-index of the incremental PropertyFinder crawl.
+
+For every property page URL the index keeps the listing id, a fingerprint of
+its card on the search page, a fingerprint of the extracted listing data and
+the ETag / Last-Modified validators of the page (PFSeenListing). With it the
+crawler
+
+  - skips the detail fetch of cards that did not change since the last run;
+  - sends conditional requests (If-None-Match / If-Modified-Since) for the
+    others and treats 304 as "unchanged";
+  - drops listings whose extracted data is identical to the last run;
+  - stops paging (newest first) at the first page without new or changed
+    cards.
+
+Entries are loaded per search page and written back in one upsert.
+"""
+
+import hashlib
+import re
+from collections.abc import Iterable
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import PFSeenListing
+
+BATCH_SIZE = 500
+# записи, не встречавшиеся дольше этого срока, удаляются
+TTL = timedelta(days=90)
+
+# «3 days ago» и т.п. меняются каждый день, не меняя само объявление
+_RELATIVE_TIME_RE = re.compile(
+    r"\b\d+\s+(?:second|minute|hour|day|week|month|year)s?\s+ago\b", re.IGNORECASE
+)
+_SPACES_RE = re.compile(r"\s+")
+
+UPDATE_FIELDS = [
+    "listing_id",
+    "card_hash",
+    "content_hash",
+    "etag",
+    "last_modified",
+    "last_seen",
+]
+
+
+def fingerprint(text: str) -> str:
+    """Short stable hash of `text`, ignoring whitespace and relative times."""
+    text = _RELATIVE_TIME_RE.sub("", text)
+    text = _SPACES_RE.sub(" ", text).strip()
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SeenIndex:
+    def __init__(self):
+        self.entries: dict[str, PFSeenListing] = {}
+        self.dirty: dict[str, PFSeenListing] = {}
+        self.now = timezone.now()
+
+    def load(self, urls: Iterable[str]):
+        """Fetches the entries of `urls` not loaded yet (one query)."""
+        missing = [url for url in urls if url not in self.entries]
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start : start + BATCH_SIZE]
+            for entry in PFSeenListing.objects.filter(url__in=batch):
+                self.entries[entry.url] = entry
+
+    def _entry(self, url: str) -> PFSeenListing:
+        entry = self.entries.get(url)
+        if entry is None:
+            entry = self.entries[url] = PFSeenListing(url=url)
+        entry.last_seen = self.now
+        self.dirty[url] = entry
+        return entry
+
+    def card_unchanged(self, url: str, card_hash: str) -> bool:
+        entry = self.entries.get(url)
+        return bool(entry and entry.content_hash and entry.card_hash == card_hash)
+
+    def touch(self, url: str, card_hash: str | None = None):
+        """Marks `url` as seen unchanged in this run."""
+        entry = self._entry(url)
+        if card_hash:
+            entry.card_hash = card_hash
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        entry = self.entries.get(url)
+        headers = {}
+        if entry and entry.content_hash:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def content_unchanged(self, url: str, content_hash: str) -> bool:
+        entry = self.entries.get(url)
+        return bool(entry and entry.content_hash == content_hash)
+
+    def record(
+        self,
+        url: str,
+        *,
+        listing_id,
+        card_hash: str,
+        content_hash: str,
+        etag: str | None,
+        last_modified: str | None,
+    ):
+        entry = self._entry(url)
+        entry.listing_id = str(listing_id or "")[:50]
+        entry.card_hash = card_hash or ""
+        entry.content_hash = content_hash
+        entry.etag = (etag or "")[:255]
+        entry.last_modified = (last_modified or "")[:64]
+
+    def save(self) -> int:
+        """Upserts the entries seen in this run and prunes the stale ones."""
+        PFSeenListing.objects.bulk_create(
+            self.dirty.values(),
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["url"],
+            update_fields=UPDATE_FIELDS,
+        )
+        PFSeenListing.objects.filter(last_seen__lt=self.now - TTL).delete()
+        saved = len(self.dirty)
+        self.dirty = {}
+        return saved
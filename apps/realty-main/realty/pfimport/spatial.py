@@ -0,0 +1,153 @@
+"""
+Point → pfimport.Area assignment by the area polygons (Area.geometry_json).
+
+AreaIndex builds a shapely STRtree over the polygons once and answers whole
+coordinate arrays with one vectorized ``STRtree.query(predicate="within")``
+instead of testing every point against every polygon. Like
+``Polygon.contains``, a point on the boundary is outside; a point inside
+several overlapping polygons goes to the smallest area id.
+
+Used by ``pf_area --assign-buildings`` (main.Building.area_by_pf),
+``pf_area --assign-listings`` and the PF JSON import (listings whose
+address names no area). ``simplify()`` prepares the per-zoom area overlays
+of the map (map_tiles.build_area_blobs).
+
+shapely (>= 2.0) is optional: without it ``available()`` is False.
+"""
+
+import logging
+from collections.abc import Iterable
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely.geometry import mapping
+    from shapely.geometry import shape
+except ImportError:  # привязка по координатам недоступна
+    shapely = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+BULK_BATCH_SIZE = 1000
+COORDINATE_DIGITS = 6  # ~0.1 м, для карты достаточно
+
+
+def available() -> bool:
+    return shapely is not None
+
+
+class AreaIndex:
+    def __init__(self, areas: Iterable[tuple[int, dict]]):
+        if shapely is None:
+            raise ImportError("shapely is required for the area index")
+        ids, geometries = [], []
+        for pk, geometry_json in sorted(areas, key=lambda row: row[0]):
+            try:
+                geometry = shape(geometry_json)
+            except Exception as exc:
+                logger.warning("Area %s skipped – invalid geometry (%s)", pk, exc)
+                continue
+            if geometry.is_empty:
+                continue
+            ids.append(pk)
+            geometries.append(geometry)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.tree = shapely.STRtree(geometries)
+
+    @classmethod
+    def from_db(cls):
+        from .models import Area
+
+        return cls(
+            Area.objects.exclude(geometry_json=None).values_list("id", "geometry_json")
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, longitudes, latitudes) -> np.ndarray:
+        """Area id of every point, 0 outside all areas or without coordinates."""
+        lons = np.array(longitudes, dtype=np.float64)
+        lats = np.array(latitudes, dtype=np.float64)
+        result = np.zeros(len(lons), dtype=np.int64)
+        valid = np.flatnonzero(np.isfinite(lons) & np.isfinite(lats))
+        if not len(valid) or not len(self.ids):
+            return result
+        points = shapely.points(lons[valid], lats[valid])
+        point_idx, area_idx = self.tree.query(points, predicate="within")
+        # ids отсортированы — меньший индекс дерева = меньший id района
+        best = np.full(len(valid), len(self.ids), dtype=np.int64)
+        np.minimum.at(best, point_idx, area_idx)
+        found = best < len(self.ids)
+        result[valid[found]] = self.ids[best[found]]
+        return result
+
+    def area_id(self, longitude, latitude) -> int | None:
+        found = int(self.lookup([longitude], [latitude])[0])
+        return found or None
+
+
+def simplify(geometry_json: dict, tolerance: float) -> dict | None:
+    """
+    GeoJSON geometry simplified with Douglas-Peucker (`tolerance` in degrees,
+    topology preserved) and rounded to COORDINATE_DIGITS; None when it is
+    invalid or nothing is left.
+    """
+    if shapely is None:
+        raise ImportError("shapely is required to simplify geometries")
+    try:
+        geometry = shape(geometry_json)
+    except Exception as exc:
+        logger.warning("Geometry skipped – invalid (%s)", exc)
+        return None
+    geometry = shapely.simplify(geometry, tolerance, preserve_topology=True)
+    geometry = shapely.transform(
+        geometry, lambda coords: np.round(coords, COORDINATE_DIGITS)
+    )
+    if geometry.is_empty:
+        return None
+    return mapping(geometry)
+
+
+def assign_areas(queryset, field: str, index: AreaIndex) -> tuple[int, int, int]:
+    """
+    Sets the Area foreign key `field` of the rows of `queryset` from their
+    latitude / longitude, in chunks of CHUNK_SIZE rows with one bulk_update
+    each. Rows outside every area keep their value.
+    Returns (found, changed, not found).
+    """
+    model = queryset.model
+    column = f"{field}_id"
+    rows = (
+        queryset.filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by("pk")
+        .values_list("pk", "longitude", "latitude", column)
+    )
+    found = changed = missing = 0
+    chunk = []
+
+    def flush():
+        nonlocal found, changed, missing
+        pks, lons, lats, current = zip(*chunk, strict=True)
+        area_ids = index.lookup(lons, lats)
+        updates = [
+            model(pk=pk, **{column: int(area_id)})
+            for pk, area_id, old in zip(pks, area_ids, current, strict=True)
+            if area_id and area_id != old
+        ]
+        model.objects.bulk_update(updates, [field], batch_size=BULK_BATCH_SIZE)
+        hits = int(np.count_nonzero(area_ids))
+        found += hits
+        missing += len(chunk) - hits
+        changed += len(updates)
+        chunk.clear()
+
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+    return found, changed, missing
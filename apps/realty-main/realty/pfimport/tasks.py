@@ -36,7 +36,14 @@ def scrape_property_finder():
         # Call our Django management command to scrape properties and generate the JSON file
         # Start from page 1 and scrape 20 pages by default
         logger.info("Running property scraper command")
-        call_command("scrape_properties", START_PAGE, END_PAGE, output=output_filename)
+        # Incremental: only new / changed listings, paging stops at known ones
+        call_command(
+            "scrape_properties",
+            START_PAGE,
+            END_PAGE,
+            output=output_filename,
+            incremental=True,
+        )
 
         # Load the generated file into the PFJsonUpload model
         # This will trigger the save() method which processes the data
@@ -12,6 +12,8 @@ from .map_views import (
     pf_buildings_json,
     buildings_map,
     buildings_geojson,
+    buildings_tile,
+    areas_geojson,
 )
 
 app_name = "pfimport"
@@ -37,4 +39,10 @@ urlpatterns = [
     path("api/buildings/", main_buildings_json, name="main_buildings_json"),
     path("api/link/", link_buildings, name="link_buildings"),  # НОВОЕ
     path("api/buildings.geojson", buildings_geojson, name="buildings_geojson"),
+    path(
+        "api/buildings/tiles/<int:z>/<int:x>/<int:y>.geojson",
+        buildings_tile,
+        name="buildings_tile",
+    ),
+    path("api/areas.geojson", areas_geojson, name="areas_geojson"),
 ]
@@ -1,6 +1,5 @@
 import datetime
 
-from django.core.paginator import Paginator
 from django.db.models import Avg
 from django.db.models import F
 from django.db.models import FloatField
@@ -9,6 +8,9 @@ from django.db.models.functions import ExtractYear
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 
+from .listings import annotate_listings
+from .listings import filter_price
+from .listings import keyset_page
 from .models import Area
 from .models import Building
 from .models import PFListRent
@@ -236,8 +238,7 @@ def _serialize_marker(obj, kind: str) -> dict:
 
 def _markers_from_page(page_obj, kind):
     markers = []
-    for row in page_obj:
-        obj = row["obj"]
+    for obj in page_obj:
         if obj.latitude and obj.longitude:
             markers.append(_serialize_marker(obj, kind))
     return markers
@@ -256,224 +257,61 @@ def pf_listings_rent_view(request):
 
 
 def _build_common(request, model_cls, *, list_type: str):
+    """
+    Фильтры, аннотации (ROI, средние цены, цена за фут²), сортировка и
+    keyset-пагинация выполняются в БД (см. listings.py); в Python
+    досчитываются только поля 10 строк страницы.
+    """
     # GET‑параметры
     q = request.GET.get("q", "").strip()
     filter_area = request.GET.get("area", "").strip()
-    # pf_roi_min_str = request.GET.get("pf_avg_roi_min", "").strip()
-    # pf_roi_max_str = request.GET.get("pf_avg_roi_max", "").strip()
-    # ▼▼▼ заменили ROI-фильтры на price-фильтры ▼▼▼
     price_min_str = request.GET.get("price_min", "").strip()
     price_max_str = request.GET.get("price_max", "").strip()
 
     sort_field = request.GET.get("sort", "").strip()
     sort_order = request.GET.get("order", "asc").lower()
-    page_number = request.GET.get("page", "1")
+    cursor = request.GET.get("cursor", "")
 
     # QS: только районы с непустым verified_value
-    qs = model_cls.objects.filter(area__verified_value__isnull=False).exclude(
-        area__verified_value__exact=""
+    qs = (
+        model_cls.objects.select_related("area", "building")
+        .filter(area__verified_value__isnull=False)
+        .exclude(area__verified_value__exact="")
     )
 
     if q:
         qs = qs.filter(Q(title__icontains=q) | Q(display_address__icontains=q))
     if filter_area:
         qs = qs.filter(display_address__icontains=filter_area)
+    qs = filter_price(qs, price_min_str, price_max_str)
+    qs = annotate_listings(qs, list_type)
+
+    page_obj = keyset_page(qs, sort_field, sort_order, cursor)
 
     today = datetime.date.today()
-    raw_list = []
-
-    def parse_addr(addr):
-        parts = [x.strip() for x in (addr or "").split(",")]
-        while len(parts) < 4:
-            parts.append("")
-        return parts[:4]
-
-    for obj in qs:
-        address1, _, address3, _ = parse_addr(obj.display_address)
-        days_on_market = (today - obj.added_on.date()).days if obj.added_on else None
-        price_per_sqft = (
-            float(obj.price) / float(obj.numeric_area)
-            if obj.price and obj.numeric_area
-            else None
+    for obj in page_obj:
+        obj.days_on_market = (
+            (today - obj.added_on.date()).days if obj.added_on else None
         )
-
-        avg_price = "—"
-        pf_avg_roi = None
-        avg_exposure_days = None
-        area_avg_days = obj.area.avg_days_on_market if obj.area else None
-
-        if obj.area:
-            area_avg_days_on_market = obj.area.avg_days_on_market
-
+        obj.area_avg_days = obj.area.avg_days_on_market if obj.area else None
+        obj.avg_exposure_days = None
+        obj.avg_price = "—"
         if obj.building:
             bld = obj.building
-            # Bld exposure
             if list_type == "sale":
                 n_ads, exp_sum = (
                     bld.numbers_of_processed_sale_ads,
                     bld.sum_exposure_sale_days,
                 )
+                avg_price = obj.avg_sale
             else:
                 n_ads, exp_sum = (
                     bld.numbers_of_processed_rent_ads,
                     bld.sum_exposure_rent_days,
                 )
-            avg_exposure_days = round(exp_sum / n_ads, 2) if n_ads else None
-
-            def _avg(attr):
-                return float(getattr(bld, attr, 0) or 0.0)
-
-            bed = obj.bedrooms or ""
-            if list_type == "sale":
-                pf_avg_roi = {
-                    "studio": lambda: _avg("avg_rent_studio") / float(obj.price)
-                    if obj.price
-                    else None,
-                    "1": lambda: _avg("avg_rent_1br") / float(obj.price)
-                    if obj.price
-                    else None,
-                    "2": lambda: _avg("avg_rent_2br") / float(obj.price)
-                    if obj.price
-                    else None,
-                    "3": lambda: _avg("avg_rent_3br") / float(obj.price)
-                    if obj.price
-                    else None,
-                    "4": lambda: _avg("avg_rent_4br") / float(obj.price)
-                    if obj.price
-                    else None,
-                }.get(
-                    bed,
-                    lambda: _avg("avg_rent_4br") / float(obj.price)
-                    if obj.price
-                    else None,
-                )()
-                avg_price = {
-                    "studio": _avg("avg_sale_studio"),
-                    "1": _avg("avg_sale_1br"),
-                    "2": _avg("avg_sale_2br"),
-                    "3": _avg("avg_sale_3br"),
-                    "4": _avg("avg_sale_4br"),
-                }.get(bed, _avg("avg_sale_4br"))
-                avg_price = f"{avg_price:.2f} AED"
-
-                pf_avg_roi_rent = {
-                    "studio": lambda: _avg("avg_rent_studio") / _avg("avg_sale_studio")
-                    if _avg("avg_sale_studio")
-                    else None,
-                    "1": lambda: _avg("avg_rent_1br") / _avg("avg_sale_1br")
-                    if _avg("avg_sale_1br")
-                    else None,
-                    "2": lambda: _avg("avg_rent_2br") / _avg("avg_sale_2br")
-                    if _avg("avg_sale_2br")
-                    else None,
-                    "3": lambda: _avg("avg_rent_3br") / _avg("avg_sale_3br")
-                    if _avg("avg_sale_3br")
-                    else None,
-                    "4": lambda: _avg("avg_rent_4br") / _avg("avg_sale_4br")
-                    if _avg("avg_sale_4br")
-                    else None,
-                }.get(
-                    bed,
-                    lambda: _avg("avg_rent_4br") / _avg("avg_sale_4br")
-                    if _avg("avg_sale_4br")
-                    else None,
-                )()
-
-                avg_price_rent = {
-                    "studio": _avg("avg_rent_studio"),
-                    "1": _avg("avg_rent_1br"),
-                    "2": _avg("avg_rent_2br"),
-                    "3": _avg("avg_rent_3br"),
-                    "4": _avg("avg_rent_4br"),
-                }.get(bed, _avg("avg_rent_4br"))
-
-            else:
-                pf_avg_roi = {
-                    "studio": lambda: _avg("avg_rent_studio") / _avg("avg_sale_studio")
-                    if _avg("avg_sale_studio")
-                    else None,
-                    "1": lambda: _avg("avg_rent_1br") / _avg("avg_sale_1br")
-                    if _avg("avg_sale_1br")
-                    else None,
-                    "2": lambda: _avg("avg_rent_2br") / _avg("avg_sale_2br")
-                    if _avg("avg_sale_2br")
-                    else None,
-                    "3": lambda: _avg("avg_rent_3br") / _avg("avg_sale_3br")
-                    if _avg("avg_sale_3br")
-                    else None,
-                    "4": lambda: _avg("avg_rent_4br") / _avg("avg_sale_4br")
-                    if _avg("avg_sale_4br")
-                    else None,
-                }.get(
-                    bed,
-                    lambda: _avg("avg_rent_4br") / _avg("avg_sale_4br")
-                    if _avg("avg_sale_4br")
-                    else None,
-                )()
-                avg_price = {
-                    "studio": _avg("avg_rent_studio"),
-                    "1": _avg("avg_rent_1br"),
-                    "2": _avg("avg_rent_2br"),
-                    "3": _avg("avg_rent_3br"),
-                    "4": _avg("avg_rent_4br"),
-                }.get(bed, _avg("avg_rent_4br"))
-                avg_price = f"{avg_price:.2f} AED"
-
-                pf_avg_roi_rent = pf_avg_roi
-                avg_price_rent = avg_price
-            numbers_of_processed_sale_ads_with_same_rooms = {
-                "studio": _avg("sale_count_studio"),
-                "1": _avg("sale_count_1br"),
-                "2": _avg("sale_count_1br"),
-                "3": _avg("sale_count_1br"),
-                "4": _avg("sale_count_1br"),
-            }.get(bed, _avg("avg_rent_4br"))
-
-        raw_list.append(
-            {
-                "obj": obj,
-                "days_on_market": days_on_market,
-                "area_avg_days": area_avg_days,
-                "price_per_sqft": price_per_sqft,
-                "pf_avg_roi": pf_avg_roi,
-                "avg_exposure_days": avg_exposure_days,
-                "avg_price": avg_price,
-                "area_avg_days_on_market": area_avg_days_on_market,
-                "pf_avg_roi_rent": pf_avg_roi_rent,
-                "avg_price_rent": avg_price_rent,
-                "numbers_of_processed_sale_ads_with_same_rooms": numbers_of_processed_sale_ads_with_same_rooms,
-            }
-        )
-    #
-    # # фильтрация по ROI
-    # pf_min = float(pf_roi_min_str) if pf_roi_min_str else None
-    # pf_max = float(pf_roi_max_str) if pf_roi_max_str else None
-    #
-    # if pf_min is not None:
-    #     raw_list = [r for r in raw_list if (r["pf_avg_roi"] or 0) >= pf_min]
-    # if pf_max is not None:
-    #     raw_list = [r for r in raw_list if (r["pf_avg_roi"] or 0) <= pf_max]
-    price_min = float(price_min_str) if price_min_str else None
-    price_max = float(price_max_str) if price_max_str else None
-    if price_min is not None:
-        raw_list = [r for r in raw_list if (r["obj"].price or 0) >= price_min]
-    if price_max is not None:
-        raw_list = [r for r in raw_list if (r["obj"].price or 0) <= price_max]
-    # сортировка
-    reverse = sort_order == "desc"
-
-    def keyfunc(item):
-        if sort_field == "days":
-            return item["days_on_market"] or 9e9
-        if sort_field == "price_sqft":
-            return item["price_per_sqft"] or 0
-        if sort_field == "roi":
-            return item["pf_avg_roi"] or 0
-        return item["obj"].id
-
-    raw_list.sort(key=keyfunc, reverse=reverse)
-
-    page_obj = Paginator(raw_list, 10).get_page(page_number)
+                avg_price = obj.avg_rent
+            obj.avg_exposure_days = round(exp_sum / n_ads, 2) if n_ads else None
+            obj.avg_price = f"{avg_price or 0:.2f} AED"
 
     all_areas = (
         Area.objects.filter(verified_value__isnull=False)
@@ -481,17 +319,21 @@ def _build_common(request, model_cls, *, list_type: str):
         .order_by("name")
     )
 
+    # GET без курсора — для ссылок «назад / вперёд»
+    base_query = request.GET.copy()
+    base_query.pop("cursor", None)
+    base_query.pop("page", None)
+
     context = {
         "page_obj": page_obj,
         "search_query": q,
         "filter_area": filter_area,
-        # "pf_avg_roi_min": pf_roi_min_str,
-        # "pf_avg_roi_max": pf_roi_max_str,
         "price_min": price_min_str,
         "price_max": price_max_str,
         "sort_field": sort_field,
         "sort_order": sort_order,
         "all_areas": all_areas,
         "list_type": list_type,
+        "base_query": base_query.urlencode(),
     }
     return context, page_obj
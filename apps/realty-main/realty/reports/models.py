@@ -25,6 +25,7 @@ from realty.main.models import (
     MergedRentalTransaction,
 )
 from realty.main.models import Area as DldArea
+from realty.main.utils import age_period
 import re
 
 
@@ -1264,22 +1265,28 @@ class DldBuildingReport(models.Model):
         #         БЫСТРАЯ ВЫБОРКА + фильтр по комнатности                #
         # -------------------------------------------------------------- #
         def fetch_tx(model, start: date, end: date):
-            qs = model.objects.filter(
-                building=dld, date_of_transaction__range=(start, end)
-            ).values(
+            fields = [
                 "pk",
                 "transaction_price",
                 "sqm",
                 "date_of_transaction",
-                "period",
                 "number_of_rooms",
-            )
+            ]
+            is_rent = model is MergedRentalTransaction
+            if not is_rent:
+                fields.append("period")
+            qs = model.objects.filter(
+                building=dld, date_of_transaction__range=(start, end)
+            ).values(*fields)
             out = []
             for rec in qs:
                 if rec["transaction_price"] is None or not rec["sqm"]:
                     continue
                 if _bedrooms_to_int(rec["number_of_rooms"]) != bed_int:
                     continue
+                if is_rent:
+                    # у аренды метку возраста считаем на лету (колонки period нет)
+                    rec["period"] = age_period(rec["date_of_transaction"], today)
                 # ★ FIX: price → float, sqm → float
                 rec["transaction_price"] = float(rec["transaction_price"])
                 rec["sqm"] = float(rec["sqm"])
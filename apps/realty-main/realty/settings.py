@@ -56,6 +56,10 @@ if PROD and env.bool("USE_DISKCACHE", default=False):
         "OPTIONS": {"size_limit": 2**30},  # 1 gigabyte
     }
 
+# Считать статистику поиска по дневным агрегатам (TransactionDailyRollup),
+# см. realty/main/rollup.py и команду rebuild_transaction_rollup
+STATS_USE_ROLLUP = env.bool("STATS_USE_ROLLUP", default=False)
+
 CSRF_COOKIE_SECURE = PROD
 
 DATABASES = {